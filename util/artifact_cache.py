@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+
+from lib import file_sha256, sha256sum
+from serialization import dump_yaml, load_yaml
+
+UTIL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Code that the results of each step depend on, next to their data inputs
+CHECK_SOURCES = sorted(glob.glob(os.path.join(UTIL_DIR, 'dashboard', '*.py')))
+HTML_SOURCES = [os.path.join(UTIL_DIR, 'create_ontology_html.py'),
+                os.path.join(UTIL_DIR, 'create_report_html.py'),
+                os.path.join(UTIL_DIR, 'templates', 'ontology.html.jinja2'),
+                os.path.join(UTIL_DIR, 'templates', 'report.html.jinja2'),
+                os.path.join(UTIL_DIR, 'dashboard_pages.py'),
+                'dependencies/obo_context.jsonld']
+
+# Files written by the dashboard checks of an ontology, and the pages built from them
+CHECK_FILES = ['robot_report.tsv', 'fp3.tsv', 'fp7.tsv']
+HTML_FILES = ['dashboard.html', 'robot_report.html', 'fp3.html', 'fp7.html']
+
+
+def output_files(names, ontology_dir):
+    """Map file names to their paths in the output directory of an ontology."""
+    return {name: os.path.join(ontology_dir, name) for name in names}
+
+
+def artifact_key(*inputs):
+    """Return a key that identifies a build step by all of its inputs.
+
+    Inputs can be anything that serialises to JSON; dictionaries are
+    serialised with sorted keys, so their order does not matter.
+
+    >>> artifact_key('prepare', 'abc', {'a': 1, 'b': 2}) == artifact_key('prepare', 'abc', {'b': 2, 'a': 1})
+    True
+    >>> artifact_key('prepare', 'abc', True) == artifact_key('prepare', 'abc', False)
+    False
+    """
+    serialised = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(serialised.encode('utf-8')).hexdigest()
+
+
+def files_digest(paths):
+    """Return a digest of the names and contents of files; missing files count as empty."""
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.basename(path).encode('utf-8'))
+        h.update((sha256sum(path) if os.path.isfile(path) else '').encode('utf-8'))
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def robot_cli_version():
+    """Return the version reported by the robot command line tool, or None if it fails."""
+    try:
+        return subprocess.run(['robot', '--version'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        logging.warning("Unable to determine the ROBOT version")
+        return None
+
+
+def robot_jar_digest(robot_jar):
+    """Return the hashcode of the ROBOT jar, or None if it does not exist (yet)."""
+    return file_sha256(robot_jar) if os.path.isfile(robot_jar) else None
+
+
+def checks_key(prepare_key, ontology, domain_map, robot_jar):
+    """Return the key of the dashboard checks of an ontology.
+
+    Args:
+        prepare_key (str): key of the base file and metrics that are checked
+        ontology (dict): registry entry of the ontology
+        domain_map (dict): map of all ontology ids to their domains (used by FP05)
+        robot_jar (str): location of the ROBOT jar that runs the checks
+
+    Return:
+        key of the checks
+    """
+    return artifact_key('checks', prepare_key, ontology, domain_map, robot_jar_digest(robot_jar),
+                        files_digest(['profile.txt', 'dependencies/registry_schema.json', 'build/ro-properties.csv']),
+                        files_digest(CHECK_SOURCES))
+
+
+def html_key(ontology_dir):
+    """Return the key of the HTML pages of an ontology, from its current dashboard files.
+
+    The timings in dashboard.yml differ from run to run, but are not shown on the pages.
+    """
+    data = {}
+    dashboard_yml = os.path.join(ontology_dir, 'dashboard.yml')
+    if os.path.isfile(dashboard_yml):
+        data = load_yaml(dashboard_yml) or {}
+        data.pop('timings', None)
+    return artifact_key('html', data, files_digest(output_files(CHECK_FILES, ontology_dir).values()),
+                        files_digest(HTML_SOURCES))
+
+
+class ArtifactCache:
+    """Derived files (and optionally some data), stored under the key of the inputs
+    they were built from, so that they can be restored instead of rebuilt.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Args:
+            cache_dir (str): directory of the cache
+        """
+        self.cache_dir = cache_dir
+
+    def _entry(self, step, key):
+        return os.path.join(self.cache_dir, step, key[:2], key)
+
+    def restore(self, step, key, files):
+        """Copy the cached files of a step to their destinations.
+
+        Args:
+            step (str): name of the build step
+            key (str): key of the inputs of the step
+            files (dict): map of cached file names to destination paths
+
+        Return:
+            the data stored with the files ({} if none), or None if they are not cached
+        """
+        entry = self._entry(step, key)
+        if not all(os.path.isfile(os.path.join(entry, name)) for name in files):
+            return None
+        try:
+            for name, dest in files.items():
+                tmp_path = f"{dest}.tmp"
+                shutil.copyfile(os.path.join(entry, name), tmp_path)
+                os.replace(tmp_path, dest)
+            data = {}
+            if os.path.isfile(os.path.join(entry, 'data.yml')):
+                data = load_yaml(os.path.join(entry, 'data.yml'))
+        except Exception:
+            logging.exception(f"Failed to restore {step} {key} from the cache")
+            return None
+        logging.info(f"Restored {', '.join(files.values())} from the cache ({step} {key[:12]})")
+        return data
+
+    def store(self, step, key, files, data=None, newer_than=None):
+        """Store the files built by a step, and optionally some data, under its key.
+
+        Args:
+            step (str): name of the build step
+            key (str): key of the inputs of the step
+            files (dict): map of cached file names to the built files
+            data (dict): data to store with the files
+            newer_than (float): only store the files if they were all modified
+                after this time, i.e. were actually built by the step
+
+        Return:
+            True if the files were stored
+        """
+        for path in files.values():
+            if not os.path.isfile(path) or (newer_than is not None and os.path.getmtime(path) < newer_than):
+                logging.info(f"Not caching {step} {key[:12]}: {path} was not built")
+                return False
+        entry = self._entry(step, key)
+        os.makedirs(entry, exist_ok=True)
+        try:
+            # Every file appears atomically, and identical inputs build identical files, so
+            # concurrent jobs can store and restore the same entry safely. The data goes
+            # first, as an entry is only restored once all of its files are there.
+            if data is not None:
+                fd, tmp_path = tempfile.mkstemp(dir=entry)
+                with os.fdopen(fd, 'w') as f:
+                    dump_yaml(data, f)
+                os.replace(tmp_path, os.path.join(entry, 'data.yml'))
+            for name, path in files.items():
+                self._copy_into(entry, name, path)
+        except OSError:
+            logging.exception(f"Failed to cache {step} {key}")
+            return False
+        return True
+
+    def _copy_into(self, entry, name, path):
+        fd, tmp_path = tempfile.mkstemp(dir=entry)
+        os.close(fd)
+        shutil.copy2(path, tmp_path)
+        os.replace(tmp_path, os.path.join(entry, name))
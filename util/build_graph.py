@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from timings import timed
+
+# A build step: fn(*args) builds the outputs from the inputs (all file paths). The recipe
+# describes everything else the outputs depend on. is_stale, if given, replaces the
+# fingerprint check: the node is rebuilt whenever it returns True.
+Node = namedtuple('Node', ['outputs', 'inputs', 'fn', 'args', 'recipe', 'is_stale'])
+
+
+def fingerprint(node):
+    """Return a fingerprint of the recipe and the contents of all inputs of a node."""
+    h = hashlib.sha256(node.recipe.encode('utf-8'))
+    for path in node.inputs:
+        h.update(path.encode('utf-8'))
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+        else:
+            h.update(b'\0missing')
+    return h.hexdigest()
+
+
+class BuildGraph:
+    """A graph of build steps, like the rules of a Makefile, run in the current process.
+
+    A node depends on the nodes that produce its inputs. It is only rebuilt if
+    one of its outputs is missing, or if the fingerprint of its inputs and
+    recipe differs from the one recorded when it was last built. Nodes whose
+    dependencies are built run concurrently. The timings of the nodes that were
+    built are kept in timings, by their first output.
+    """
+
+    def __init__(self, state_file):
+        """
+        Args:
+            state_file (str): JSON file recording the fingerprint of every built output
+        """
+        self.state_file = state_file
+        self.nodes = []
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.state = {}
+        if os.path.isfile(state_file):
+            try:
+                with open(state_file, 'r') as f:
+                    self.state = json.load(f)
+            except Exception:
+                logging.warning(f"Ignoring broken build state {state_file}")
+
+    def add(self, outputs, inputs, fn, args=(), recipe=None, is_stale=None):
+        """Add a build step.
+
+        Args:
+            outputs (list): files built by the step
+            inputs (list): files the step reads
+            fn (callable): function building the outputs
+            args (tuple): arguments of fn
+            recipe (str): everything else the outputs depend on, defaults to
+                the name and arguments of fn
+            is_stale (callable): optional function deciding if the step has to run
+
+        Return:
+            the new node
+        """
+        if recipe is None:
+            recipe = f"{fn.__module__}.{fn.__qualname__}{args!r}"
+        node = Node(list(outputs), list(inputs), fn, tuple(args), recipe, is_stale)
+        self.nodes.append(node)
+        return node
+
+    def run(self, max_workers=1, force=False):
+        """Build all nodes that are out of date, in dependency order.
+
+        A node whose dependency failed is not built, and counts as failed too, and
+        so do the nodes of a dependency cycle.
+
+        >>> import tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> def path(name):
+        ...     return os.path.join(directory, name)
+        >>> def write(name):
+        ...     open(path(name), 'w').close()
+        >>> def fail():
+        ...     raise ValueError('broken')
+        >>> graph = BuildGraph(path('state.json'))
+        >>> report = graph.add([path('report.tsv')], [], fail)
+        >>> page = graph.add([path('report.html')], [path('report.tsv')], write, ('report.html',))
+        >>> first = graph.add([path('a')], [path('b')], write, ('a',))
+        >>> second = graph.add([path('b')], [path('a')], write, ('b',))
+        >>> other = graph.add([path('index.html')], [], write, ('index.html',))
+        >>> graph.run(max_workers=2) == [report, page, first, second]
+        True
+        >>> sorted(os.listdir(directory))
+        ['index.html', 'state.json']
+
+        Args:
+            max_workers (int): maximum number of nodes built at the same time
+            force (bool): rebuild every node, like make -B
+
+        Return:
+            list of the failed nodes
+        """
+        producers = {}
+        for i, node in enumerate(self.nodes):
+            for output in node.outputs:
+                producers[output] = i
+        deps = {}
+        for i, node in enumerate(self.nodes):
+            deps[i] = {producers[path] for path in node.inputs if path in producers and producers[path] != i}
+
+        pending = list(range(len(self.nodes)))
+        done = set()
+        failed = set()
+        running = {}
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                while pending or running:
+                    for i in list(pending):
+                        if deps[i] & failed:
+                            logging.error(f"Not building {', '.join(self.nodes[i].outputs)}: a dependency failed")
+                            pending.remove(i)
+                            failed.add(i)
+                        elif deps[i] <= done:
+                            pending.remove(i)
+                            running[executor.submit(self._build, self.nodes[i], force)] = i
+                    if not running:
+                        if pending:
+                            logging.error(f"Dependency cycle between {len(pending)} build steps")
+                            failed.update(pending)
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        i = running.pop(future)
+                        try:
+                            future.result()
+                            done.add(i)
+                        except Exception:
+                            logging.exception(f"Failed to build {', '.join(self.nodes[i].outputs)}")
+                            failed.add(i)
+        finally:
+            self._save_state()
+        return [self.nodes[i] for i in sorted(failed)]
+
+    def _build(self, node, force):
+        if node.is_stale is not None:
+            stale = force or node.is_stale()
+            current = None
+        else:
+            current = fingerprint(node)
+            with self.lock:
+                recorded = [self.state.get(output) for output in node.outputs]
+            stale = force or any(not os.path.exists(output) for output in node.outputs) or \
+                any(fp != current for fp in recorded)
+        if not stale:
+            return False
+        for output in node.outputs:
+            if os.path.dirname(output):
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+        logging.info(f"Building {', '.join(node.outputs)}")
+        with timed(self.timings, node.outputs[0]):
+            node.fn(*node.args)
+        if current is not None:
+            with self.lock:
+                for output in node.outputs:
+                    self.state[output] = current
+        return True
+
+    def _save_state(self):
+        with self.lock:
+            tmp_path = f"{self.state_file}.tmp"
+            if os.path.dirname(self.state_file):
+                os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.state_file)
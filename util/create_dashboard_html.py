@@ -5,9 +5,8 @@ import os
 import sys
 from argparse import ArgumentParser
 
-import yaml
 from jinja2 import Template
-from lib import DashboardConfig, save_json, save_yaml
+from lib import DashboardConfig, load_yaml, save_json, save_yaml
 
 
 def main(args):
@@ -37,16 +36,26 @@ def main(args):
                         help='Output dashboard HTML file')
     args = parser.parse_args()
 
-    registry_yaml = args.registry_yaml
-    dashboard_dir = args.dashboard_dir
-    dashboard_score_data_file = args.dashboard_score_data
-    outfile = args.outfile
-    dashboard_config = args.dashboard_config
+    create_dashboard_html(args.dashboard_dir, args.registry_yaml, args.dashboard_config, args.dashboard_score_data,
+                          args.robot_version, args.obomd_version, args.outfile)
 
+
+def create_dashboard_html(dashboard_dir, registry_yaml, dashboard_config, dashboard_score_data_file,
+                          robot_version, obomd_version, outfile):
+    """Render the dashboard index page, and save the results of all ontologies.
+
+    Args:
+        dashboard_dir (str): directory of reports (<dir>/*/dashboard.yml)
+        registry_yaml (str): ontology registry data
+        dashboard_config (str): dashboard config file (typically dashboard-config.yml)
+        dashboard_score_data_file (str): dashboard yaml file with results
+        robot_version (str): version of ROBOT used to build the dashboard
+        obomd_version (str): version of OBO Metadata used to build the dashboard (URL)
+        outfile (str): output dashboard HTML file
+    """
     config = DashboardConfig(dashboard_config)
 
-    with open(registry_yaml, 'r') as f:
-        data = yaml.load(f, Loader=yaml.SafeLoader)
+    data = load_yaml(registry_yaml)
 
     # Put ontology data in order
     data = data['ontologies']
@@ -59,8 +68,7 @@ def main(args):
         dashboard_yaml = '{0}/{1}/dashboard.yml'.format(dashboard_dir, o)
         if not os.path.exists(dashboard_yaml):
             continue
-        with open(dashboard_yaml, 'r') as f:
-            this_data = yaml.load(f, Loader=yaml.SafeLoader)
+        this_data = load_yaml(dashboard_yaml)
         ontologies.append(this_data)
 
     ontologies = reorder_status(ontologies)
@@ -72,8 +80,8 @@ def main(args):
     date = datetime.datetime.today()
     res = template.render(checkorder=check_order,
                           date=date.strftime('%Y-%m-%d'),
-                          robot=args.robot_version,
-                          obomd=args.obomd_version,
+                          robot=robot_version,
+                          obomd=obomd_version,
                           ontologies=ontologies,
                           title=config.get_title(),
                           description=config.get_description()
@@ -89,7 +97,7 @@ def main(args):
     dashboard_score_data['oboscore'] = {}
     dashboard_score_data['oboscore']['dashboard_score_weights'] = oboscore_weights
     dashboard_score_data['oboscore']['dashboard_score_max_impact'] = oboscore_maximpacts
-    save_yaml(dashboard_score_data, dashboard_score_data_file)
+    save_yaml(dashboard_score_data, dashboard_score_data_file, json_sidecar=config.is_json_sidecars())
     save_json(dashboard_score_data, dashboard_score_data_file.replace('.yml', '.json'))
 
 
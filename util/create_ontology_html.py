@@ -2,10 +2,10 @@
 
 import os
 import sys
-import yaml
 
-from argparse import ArgumentParser, FileType
+from argparse import ArgumentParser
 from jinja2 import Template
+from serialization import load_yaml
 
 
 def main(args):
@@ -13,21 +13,33 @@ def main(args):
     """
     parser = ArgumentParser(description='Create a HTML report page')
     parser.add_argument('yaml',
-                        type=FileType('r'),
+                        type=str,
                         help='Dashboard YAML file')
     parser.add_argument('template',
-                        type=FileType('r'),
+                        type=str,
                         help='Template file')
     parser.add_argument('output',
-                        type=FileType('w'),
+                        type=str,
                         help='Output HTML file')
     args = parser.parse_args()
 
+    create_ontology_html(args.yaml, args.template, args.output)
+
+
+def create_ontology_html(yaml_file, template_file, outfile):
+    """Render the dashboard page of an ontology.
+
+    Args:
+        yaml_file (str): dashboard YAML file of the ontology
+        template_file (str): template file
+        outfile (str): output HTML file
+    """
     # get the data from the dashboard
-    data = yaml.load(args.yaml, Loader=yaml.SafeLoader)
+    data = load_yaml(yaml_file)
 
     # Load Jinja2 template
-    template = Template(args.template.read())
+    with open(template_file, 'r') as f:
+        template = Template(f.read())
 
     # Generate the HTML output
     res = template.render(checkorder=check_order,
@@ -35,7 +47,8 @@ def main(args):
                           autochecklinks=automated_map,
                           o=data)
 
-    args.output.write(res)
+    with open(outfile, 'w') as f:
+        f.write(res)
 
 
 check_order = ['FP01 Open',
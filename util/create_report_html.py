@@ -15,32 +15,47 @@ def main(args):
     """
     parser = argparse.ArgumentParser(description='Create a report HTML page')
     parser.add_argument('report',
-                        type=argparse.FileType('r'),
+                        type=str,
                         help='TSV report to convert to HTML')
     parser.add_argument('context',
-                        type=argparse.FileType('r'),
+                        type=str,
                         help='Ontology prefixes')
     parser.add_argument('template',
-                        type=argparse.FileType('r'),
+                        type=str,
                         help='The template file to use')
     parser.add_argument('title',
                         type=str,
                         help='HTML page title')
     parser.add_argument('outfile',
-                        type=argparse.FileType('w'),
+                        type=str,
                         help='Output report HTML file')
     parser.add_argument('limitlines',
                         type=int,
                         help='Parameter to limit lines', nargs='?', default=50)
     args = parser.parse_args()
 
-    context = json.load(args.context)['@context']
+    create_report_html(args.report, args.context, args.template, args.title, args.outfile, args.limitlines)
+
+
+def create_report_html(report_file, context_file, template_file, title, outfile, limitlines=50):
+    """Render a TSV report as an HTML page.
+
+    Args:
+        report_file (str): TSV report to convert to HTML
+        context_file (str): JSON-LD file with the ontology prefixes
+        template_file (str): the template file to use
+        title (str): HTML page title
+        outfile (str): output report HTML file
+        limitlines (int): maximum number of report rows on the page
+    """
+    with open(context_file, 'r') as f:
+        context = json.load(f)['@context']
 
     error_count_rule = {}
     error_count_level = {}
 
     try:
-        report = pd.read_csv(args.report, sep="\t")
+        report = pd.read_csv(report_file, sep="\t")
         if "Level" in report.columns and "Rule Name" in report.columns:
             error_count_level = report["Level"].value_counts()
             error_count_rule = report["Rule Name"].value_counts()
@@ -48,20 +63,22 @@ def main(args):
         print("No report")
 
     # Load Jinja2 template
-    template = Template(args.template.read())
+    with open(template_file, 'r') as f:
+        template = Template(f.read())
 
     # Generate the HTML output
-    res = template.render(contents=report.head(args.limitlines),
+    res = template.render(contents=report.head(limitlines),
                           maybe_get_link=maybe_get_link,
                           context=context,
-                          title=args.title,
-                          file=os.path.basename(args.report.name),
+                          title=title,
+                          file=os.path.basename(report_file),
                           error_count_rule=error_count_rule,
                           error_count_level=error_count_level,
                           class_map=class_map
                           )
 
-    args.outfile.write(res)
+    with open(outfile, 'w') as f:
+        f.write(res)
 
 
 def maybe_get_link(cell, context):
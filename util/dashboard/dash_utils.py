@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 import os
 import re
-import yaml
+
+from serialization import load_yaml
 
 obo = 'http://purl.obolibrary.org/obo/'
 
@@ -80,8 +81,7 @@ def load_data(yaml_infile):
     """Given the registry YAML file, load the data.
     Return a map of ontology ID to data item.
     """
-    with open(yaml_infile, 'r') as s:
-        data = yaml.load(s, Loader=yaml.SafeLoader)
+    data = load_yaml(yaml_infile)
     return data['ontologies']
 
 
@@ -3,9 +3,8 @@
 import datetime
 import json
 import os
-import py4j
 import sys
-import yaml
+import time
 import logging
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
 
@@ -28,38 +27,39 @@ import report_utils
 logging.basicConfig(level=logging.INFO)
 
 from argparse import ArgumentParser, FileType
-from py4j.java_gateway import JavaGateway
+from artifact_cache import CHECK_FILES, ArtifactCache, output_files
+from concurrent.futures import ThreadPoolExecutor
+from gateway_pool import GatewayPool, RobotGateway
+from http_client import HttpClient, set_http_client
 from lib import round_float, compute_dashboard_score_alt1, compute_obo_score, DashboardConfig, \
-    create_dashboard_score_badge, create_dashboard_qc_badge
-
-
-def run():
-    # ---------------------------- #
-    # PREPARE INPUT
-    # ---------------------------- #
-
-    # parse input args
-    parser = ArgumentParser(description='Create dashboard files')
-    parser.add_argument('ontology', type=str, help='Input ontology file')
-    parser.add_argument('ontologymetrics', type=str, help='Output from ROBOT metrics run')
-    parser.add_argument('registry', type=FileType('r'), help='Registry YAML file')
-    parser.add_argument('schema', type=FileType('r'), help='OBO JSON schema')
-    parser.add_argument('relations', type=FileType('r'), help='Table containing RO IRIs and labels')
-    parser.add_argument('profile', type=str, help='Optional location of profile.txt file.')
-    parser.add_argument('configfile', type=str, help='Location of the dashboard config file', default='build/robot.jar')
-    parser.add_argument('outdir', type=str, help='Output directory')
-    parser.add_argument('robot_jar',type=str,help='Location of your local ROBOT jar', default='build/robot.jar')
-    args = parser.parse_args()
-
-    config = DashboardConfig(args.configfile)
-    owl = os.path.basename(args.ontology)
-    namespace = os.path.splitext(owl)[0]
-
-    ontology_file = args.ontology
-    metrics_file = args.ontologymetrics
-
-    registry = args.registry
-    schema = json.load(args.schema)
+    create_dashboard_score_badge, create_dashboard_qc_badge, set_url_cache
+from registry_index import RegistryIndex
+from serialization import load_yaml, save_yaml
+from timings import timed
+from url_cache import UrlCache
+
+def load_registry_index(registry_path, schema_path, relations_path):
+    """Return the index of the registry and of the inputs derived from it (see RegistryIndex),
+    building it if it is missing or older than one of the inputs. In a dashboard run, the first
+    process needing it builds it, and all later ones open it.
+
+    Args:
+        registry_path (str): registry YAML file
+        schema_path (str): OBO JSON schema
+        relations_path (str): table containing RO IRIs and labels
+
+    Return:
+        RegistryIndex
+    """
+    index_path = f"{os.path.splitext(registry_path)[0]}-index.sqlite"
+    sources = [registry_path, schema_path, relations_path]
+    index = RegistryIndex.open(index_path, sources)
+    if index is not None:
+        return index
+
+    logging.info(f"Building the registry index {index_path}")
+    with open(schema_path, 'r') as schema_file:
+        schema = json.load(schema_file)
     contact_schema = {
         "$schema": "http://json-schema.org/draft-07/schema#",
         "$id": "http://obofoundry.org/config/registry_schema/contact",
@@ -81,127 +81,172 @@ def run():
         "required": ["license"],
         "level": "error"
     }
-    robot_jar = args.robot_jar
-    ro_file = args.relations
-    profile = args.profile
 
-    # Create the build directory for this ontology
-    ontology_dir = args.outdir
-    os.makedirs(ontology_dir, exist_ok=True)
+    with open(relations_path, 'r') as relations:
+        ro_props = fp_007.get_ro_properties(relations)
+
+    # Get the registry data
+    yaml_data_raw = load_yaml(registry_path)
+    yaml_data = []
+    for o in yaml_data_raw['ontologies']:
+        yaml_data.append(yaml_data_raw['ontologies'][o])
 
-    # Launch the JVM using the robot JAR
-    py4j.java_gateway.launch_gateway(
-        jarpath=robot_jar, classpath='org.obolibrary.robot.PythonOperation', die_on_exit=True, port=25333)
+    return RegistryIndex.build(index_path, sources, {item['id']: item for item in yaml_data}, {
+        'contact_schema': contact_schema,
+        'license_schema': license_schema,
+        # Map of all ontologies to their domains
+        'domain_map': dash_utils.get_domains(yaml_data),
+        # Map of RO labels to RO IRIs
+        'ro_props': ro_props,
+    })
+
+
+def load_shared_inputs(registry_path, schema_path, relations_path, configfile):
+    """Load the inputs that are shared by the checks of all ontologies.
+
+    Args:
+        registry_path (str): registry YAML file
+        schema_path (str): OBO JSON schema
+        relations_path (str): table containing RO IRIs and labels
+        configfile (str): location of the dashboard config file
+
+    Return:
+        dict of shared inputs for check_ontology
+    """
+    index = load_registry_index(registry_path, schema_path, relations_path)
+
+    config = DashboardConfig(configfile)
+    set_http_client(HttpClient(**config.get_http_settings()))
+    # The link checks of FP04 and FP08 use the results of earlier runs and of prefetch_link_checks
+    set_url_cache(UrlCache(config.get_url_cache_db(), config.get_url_cache_ttl_hours()))
+
+    return {
+        'config': config,
+        'contact_schema': index.shared('contact_schema'),
+        'license_schema': index.shared('license_schema'),
+        # Registry entry of every ontology
+        'registry': index,
+        # Map of all ontologies to their domains
+        'domain_map': index.shared('domain_map'),
+        # Map of RO labels to RO IRIs
+        'ro_props': index.shared('ro_props'),
+    }
 
-    # Activate gateway to JVM
-    gateway = JavaGateway()
 
-    try:
-        robot_gateway = gateway.jvm.org.obolibrary.robot
+def load_dashboard_data(ontology_dir):
+    """Load the dashboard data of an ontology, if the analysis has to be updated.
 
-        # IOHelper for working with ontologies
-        io_helper = robot_gateway.IOHelper()
+    Args:
+        ontology_dir (str): output directory of the ontology
 
-        # Handle ontology file
-        big = namespace in BIG_ONTS
+    Return:
+        dashboard data as dict, or None if the results are up to date
+    """
+    dashboard_yml = os.path.join(ontology_dir, "dashboard.yml")
+    data_yml = dict()
+    if os.path.isfile(dashboard_yml):
+        data_yml = load_yaml(dashboard_yml)
 
-        # Load dashboard data if exists
-        dashboard_yml = os.path.join(ontology_dir, "dashboard.yml")
-        data_yml = dict()
-        if os.path.isfile(dashboard_yml):
-            with open(dashboard_yml, 'r') as f:
-                data_yml = yaml.load(f, Loader=yaml.SafeLoader)
+    if 'changed' not in data_yml or 'results' not in data_yml or data_yml['changed'] == True:
+        print("Analysis has to be updated, running.")
+        return data_yml
+    return None
 
-        if 'changed' not in data_yml or 'results' not in data_yml or data_yml['changed'] == True:
-            print("Analysis has to be updated, running.")
-        else:
-            sys.exit(0)
 
-        # Load raw ontology as OWLOntology object
+def load_syntax(metrics_file):
+    """Return the syntax of an ontology as determined by ROBOT metrics, or None if unknown."""
+    syntax = None
+    if not metrics_file or not os.path.exists(metrics_file) or dash_utils.whitespace_only(metrics_file):
+        # If ontology_file is None, the file does not exist, or the file is empty
+        # Then the ontology is None
         syntax = None
-        if not metrics_file or not os.path.exists(metrics_file) or dash_utils.whitespace_only(metrics_file):
-            # If ontology_file is None, the file does not exist, or the file is empty
-            # Then the ontology is None
-            syntax = None
-        else:
-            try:
-                with open(metrics_file, 'r') as stream:
-                    metrics_data = yaml.safe_load(stream)
-                if metrics_data:
-                    if 'metrics' in metrics_data and 'syntax' in metrics_data['metrics']:
-                        syntax = metrics_data['metrics']['syntax']
-            except Exception as e:
-                print(f"ERROR: Unable to load {metrics_file}, cause: {e}.", flush=True)
+    else:
+        try:
+            metrics_data = load_yaml(metrics_file)
+            if metrics_data:
+                if 'metrics' in metrics_data and 'syntax' in metrics_data['metrics']:
+                    syntax = metrics_data['metrics']['syntax']
+        except Exception as e:
+            print(f"ERROR: Unable to load {metrics_file}, cause: {e}.", flush=True)
+    return syntax
+
+
+def run_checks(gateway, io_helper, ont_or_file, namespace, version_iri, syntax, ontology_dir, profile, shared,
+               timings=None, pid=None):
+    """Run the ROBOT report and all numbered checks over a loaded ontology.
+
+    The reports of the checks are written to the output directory of the
+    ontology, but the dashboard data is not: the results only depend on the
+    ontology and the registry, not on the usage of the ontology by others, so
+    they can be computed before the OBO score is known.
+
+    Args:
+        gateway (JavaGateway): gateway to a JVM running ROBOT
+        io_helper (JavaObject): ROBOT IOHelper of the ontology
+        ont_or_file (JavaObject or str): the ontology, or its file for big ontologies
+        namespace (str): ontology id
+        version_iri (str): version IRI of the ontology
+        syntax (str): syntax of the ontology, see load_syntax
+        ontology_dir (str): output directory of the ontology
+        profile (str): location of the profile.txt file
+        shared (dict): inputs shared by all ontologies, see load_shared_inputs
+        timings (dict): where to record the timings of the report and of every check
+        pid (int): process id of the JVM, see jvm_pid
+
+    Return:
+        dict with the check results ('data') and the QC badge ('badge'), or
+        None if the ontology is obsolete and was not checked
+    """
+    robot_gateway = gateway.jvm.org.obolibrary.robot
+    if timings is None:
+        timings = {}
+    big = namespace in BIG_ONTS
+    license_schema = shared['license_schema']
+    contact_schema = shared['contact_schema']
+    domain_map = shared['domain_map']
+    ro_props = shared['ro_props']
+
+    data = shared['registry'].get(namespace)
+
+    if 'is_obsolete' in data and data['is_obsolete'] == 'true':
+        # do not run on obsolete ontologies
+        print('{0} is obsolete and will not be checked...'.format(namespace), flush=True)
+        return None
 
-        if not big:
-            # Load ontology as OWLOntology object
-            if not ontology_file or not os.path.exists(ontology_file) or dash_utils.whitespace_only(ontology_file):
-                # If ontology_file is None, the file does not exist, or the file is empty
-                # Then the ontology is None
-                ont_or_file = None
-            else:
-                try:
-                    ont_or_file = io_helper.loadOntology(ontology_file)
-                except Exception:
-                    print('ERROR: Unable to load \'{0}\''.format(ontology_file), flush=True)
-                    ont_or_file = None
-            # Get the Verison IRI
-            version_iri = dash_utils.get_version_iri(ont_or_file)
-        else:
-            # Just provide path to file
-            ont_or_file = ontology_file
-            # Get the version IRI by text parsing
-            version_iri = dash_utils.get_big_version_iri(ont_or_file)
+    # ---------------------------- #
+    # RUN CHECKS
+    # ---------------------------- #
 
-        # Get the registry data
-        yaml_data_raw = yaml.load(registry, Loader=yaml.SafeLoader)
-        yaml_data = []
-        for o in yaml_data_raw['ontologies']:
-            yaml_data.append(yaml_data_raw['ontologies'][o])
+    print('-----------------\nChecking ' + namespace, flush=True)
 
-        data = dash_utils.get_data(namespace, yaml_data)
+    # Get the report based on if it's big or not
+    report = None
+    good_format = None
 
-        # Map of all ontologies to their domains
-        domain_map = dash_utils.get_domains(yaml_data)
-        # Map of RO labels to RO IRIs
-        ro_props = fp_007.get_ro_properties(ro_file)
-
-        if 'is_obsolete' in data and data['is_obsolete'] == 'true':
-            # do not run on obsolete ontologies
-            print('{0} is obsolete and will not be checked...'.format(namespace), flush=True)
-            sys.exit(0)
-
-        # ---------------------------- #
-        # RUN CHECKS
-        # ---------------------------- #
-
-        print('-----------------\nChecking ' + namespace, flush=True)
-
-        # Get the report based on if it's big or not
-        report = None
-        good_format = None
-        
-        for base_iri in data['base_ns']:
-            logging.warning(f"Adding base IRI to IO Helper: {base_iri}.")
-            io_helper.addBaseNamespace(base_iri)
-        # This is added so the dashboard os not skippig checks on the ontology itself.
-        io_helper.addBaseNamespace(f"http://purl.obolibrary.org/obo/{namespace}")
-        
-        if big:
-            if namespace != 'gaz':
-                # Report currently takes TOO LONG for GAZ
-                print('Running ROBOT report on {0}...'.format(namespace), flush=True)
+    for base_iri in data['base_ns']:
+        logging.warning(f"Adding base IRI to IO Helper: {base_iri}.")
+        io_helper.addBaseNamespace(base_iri)
+    # This is added so the dashboard os not skippig checks on the ontology itself.
+    io_helper.addBaseNamespace(f"http://purl.obolibrary.org/obo/{namespace}")
+
+    if big:
+        if namespace != 'gaz':
+            # Report currently takes TOO LONG for GAZ
+            print('Running ROBOT report on {0}...'.format(namespace), flush=True)
+            with timed(timings, 'robot_report', pid):
                 report_obj = report_utils.BigReport(robot_gateway, namespace, ont_or_file, profile)
                 report = report_obj.get_report()
-                good_format = report_obj.get_good_format()
-        else:
-            if ont_or_file:
-                # Ontology is not None
-                print('Running ROBOT report on {0}...'.format(namespace), flush=True)
+            good_format = report_obj.get_good_format()
+    else:
+        if ont_or_file:
+            # Ontology is not None
+            print('Running ROBOT report on {0}...'.format(namespace), flush=True)
+            with timed(timings, 'robot_report', pid):
                 report = report_utils.run_report(robot_gateway, io_helper, ont_or_file, profile)
 
-        # Execute the numbered checks
-        check_map = {}
+    # Execute the numbered checks
+    check_map = {}
+    with timed(timings, 'fp01', pid):
         try:
             if big:
                 check_map[1] = fp_001.big_is_open(ont_or_file, data, license_schema)
@@ -211,12 +256,14 @@ def run():
             check_map[1] = 'INFO|unable to run check 1'
             print('ERROR: unable to run check 1 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp02', pid):
         try:
             check_map[2] = fp_002.is_common_format(syntax)
         except Exception as e:
             check_map[2] = 'INFO|unable to run check 2'
             print('ERROR: unable to run check 2 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp03', pid):
         try:
             if big:
                 check_map[3] = fp_003.big_has_valid_uris(namespace, ont_or_file, ontology_dir)
@@ -226,6 +273,7 @@ def run():
             check_map[3] = 'INFO|unable to run check 3'
             print('ERROR: unable to run check 3 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp04', pid):
         try:
             if big:
                 check_map[4] = fp_004.big_has_versioning(ont_or_file)
@@ -235,18 +283,21 @@ def run():
             check_map[4] = 'INFO|unable to run check 4'
             print('ERROR: unable to run check 4 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp05', pid):
         try:
             check_map[5] = fp_005.has_scope(data, domain_map)
         except Exception as e:
             check_map[5] = 'INFO|unable to run check 5'
             print('ERROR: unable to run check 5 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp06', pid):
         try:
             check_map[6] = fp_006.has_valid_definitions(report)
         except Exception as e:
             check_map[6] = 'INFO|unable to run check 6'
             print('ERROR: unable to run check 6 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp07', pid):
         try:
             if big:
                 check_map[7] = fp_007.big_has_valid_relations(namespace, ont_or_file, ro_props, ontology_dir)
@@ -256,30 +307,35 @@ def run():
             check_map[7] = 'INFO|unable to run check 7'
             print('ERROR: unable to run check 7 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp08', pid):
         try:
             check_map[8] = fp_008.has_documentation(data)
         except Exception as e:
             check_map[8] = 'INFO|unable to run check 8'
             print('ERROR: unable to run check 8 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp09', pid):
         try:
             check_map[9] = fp_009.has_users(data)
         except Exception as e:
             check_map[9] = 'INFO|unable to run check 9'
             print('ERROR: unable to run check 9 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp11', pid):
         try:
             check_map[11] = fp_011.has_contact(data, contact_schema)
         except Exception as e:
             check_map[11] = 'INFO|unable to run check 11'
             print('ERROR: unable to run check 11 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp12', pid):
         try:
             check_map[12] = fp_012.has_valid_labels(report)
         except Exception as e:
             check_map[12] = 'INFO|unable to run check 12'
             print('ERROR: unable to run check 12 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp16', pid):
         try:
             if big:
                 check_map[16] = fp_016.big_is_maintained(ont_or_file)
@@ -289,6 +345,7 @@ def run():
             check_map[16] = 'INFO|unable to run check 16'
             print('ERROR: unable to run check 16 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
+    with timed(timings, 'fp20', pid):
         try:
             check_map[20] = fp_020.is_responsive(data)
         except Exception as e:
@@ -296,117 +353,403 @@ def run():
             print('ERROR: unable to run check 20 for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
         # finally, add the report results to the dashboard and save the report
+    with timed(timings, 'process_report', pid):
         try:
             check_map['report'] = report_utils.process_report(robot_gateway, report, ontology_dir)
         except Exception as e:
             check_map['report'] = 'INFO|unable to save report'
             print('ERROR: unable to save ROBOT report for {0}\nCAUSE:\n{1}'.format(namespace, str(e)), flush=True)
 
-        # ---------------------------- #
-        # SAVE RESULTS
-        # ---------------------------- #
-
-        # Parse results
-        err = 0
-        warn = 0
-        info = 0
-        all_checks = {}
-
-        for check, result in check_map.items():
-            if result is None or 'status' not in result:
-                print('Missing result for check {0}'.format(check), flush=True)
-                continue
-
-            status = result['status']
-
-            if status == 'ERROR':
-                err += 1
-            elif status == 'WARN':
-                warn += 1
-            elif status == 'INFO':
-                info += 1
-            elif status != 'PASS':
-                print('Unknown status "{0}" for check {1}'.format(status, check), flush=True)
-                continue
-
-            key = check
-            if check in PRINCIPLE_MAP:
-                key = PRINCIPLE_MAP[check]
-            elif check == 'report':
-                key = 'ROBOT Report'
-
-            all_checks[key] = result
-
-        # Summary status
-        badge_message = []
-        color = ""
-
-        if err > 0:
-            summary = 'ERROR'
-            color = "red"
-            summary_comment = '{0} errors'.format(err)
-            badge_message.append(f"ERROR {err}")
-        elif warn > 0:
-            summary = 'WARN'
-            color = "yellow"
-            summary_comment = '{0} warnings'.format(warn)
-            badge_message.append(f"WARN {warn}")
-        elif info > 0:
-            summary = 'INFO'
-            color = 'green'
-            summary_comment = '{0} info messages'.format(info)
-            badge_message.append(f"INFO {info}")
+    # ---------------------------- #
+    # SAVE RESULTS
+    # ---------------------------- #
+
+    # Parse results
+    err = 0
+    warn = 0
+    info = 0
+    all_checks = {}
+
+    for check, result in check_map.items():
+        if result is None or 'status' not in result:
+            print('Missing result for check {0}'.format(check), flush=True)
+            continue
+
+        status = result['status']
+
+        if status == 'ERROR':
+            err += 1
+        elif status == 'WARN':
+            warn += 1
+        elif status == 'INFO':
+            info += 1
+        elif status != 'PASS':
+            print('Unknown status "{0}" for check {1}'.format(status, check), flush=True)
+            continue
+
+        key = check
+        if check in PRINCIPLE_MAP:
+            key = PRINCIPLE_MAP[check]
+        elif check == 'report':
+            key = 'ROBOT Report'
+
+        all_checks[key] = result
+
+    # Summary status
+    badge_message = []
+    color = ""
+
+    if err > 0:
+        summary = 'ERROR'
+        color = "red"
+        summary_comment = '{0} errors'.format(err)
+        badge_message.append(f"ERROR {err}")
+    elif warn > 0:
+        summary = 'WARN'
+        color = "yellow"
+        summary_comment = '{0} warnings'.format(warn)
+        badge_message.append(f"WARN {warn}")
+    elif info > 0:
+        summary = 'INFO'
+        color = 'green'
+        summary_comment = '{0} info messages'.format(info)
+        badge_message.append(f"INFO {info}")
+    else:
+        summary = 'PASS'
+        summary_comment = ''
+        color = 'green'
+        badge_message.append("PASS")
+
+    summary_count = dict()
+    summary_count['ERROR'] = err
+    summary_count['WARN'] = warn
+    summary_count['INFO'] = info
+    date = datetime.datetime.today()
+    save_data = {'namespace': namespace, 'version': version_iri, 'date': date,
+                 'summary': {'status': summary, 'comment': summary_comment, 'summary_count': summary_count}, 'results': all_checks}
+    return {'data': save_data, 'badge': {'color': color, 'message': ", ".join(badge_message)}}
+
+
+def save_dashboard_results(data_yml, checked, config, ontology_dir):
+    """Add check results to the dashboard data of an ontology, compute its OBO
+    score and save dashboard.yml and the badges to the output directory.
+
+    Args:
+        data_yml (dict): dashboard data, including the usage metrics of the ontology
+        checked (dict): check results, see run_checks
+        config (DashboardConfig): dashboard configuration
+        ontology_dir (str): output directory of the ontology
+    """
+    dashboard_yml = os.path.join(ontology_dir, "dashboard.yml")
+    oboscore_weights = config.get_oboscore_weights()
+    oboscore_maximpacts = config.get_oboscore_max_impact()
+
+    for key in checked['data']:
+        data_yml[key] = checked['data'][key]
+
+    raw_dashboard_score = compute_dashboard_score_alt1(data_yml, oboscore_weights, oboscore_maximpacts)
+    raw_dashboard_score = float(raw_dashboard_score) / float(100)
+    obo_dashboard_score = round_float(float(raw_dashboard_score))
+    data_yml['metrics']['Info: Experimental OBO score']['_dashboard'] = obo_dashboard_score
+    oboscore = compute_obo_score(data_yml['metrics']['Info: Experimental OBO score']['_impact'],
+                                 data_yml['metrics']['Info: Experimental OBO score']['_reuse'],
+                                 data_yml['metrics']['Info: Experimental OBO score']['_dashboard'],
+                                 data_yml['metrics']['Info: Experimental OBO score']['_impact_external'],
+                                 oboscore_weights)
+
+    data_yml['metrics']['Info: Experimental OBO score']['oboscore'] = round_float(oboscore['score'])
+    data_yml['metrics']['Info: Experimental OBO score']['_formula'] = oboscore['formula']
+
+    obo_dashboard_score_pc = round_float(float((obo_dashboard_score*100)))
+    # Save to YAML file
+    print('Saving results to {0}'.format(dashboard_yml))
+    create_dashboard_qc_badge(checked['badge']['color'], checked['badge']['message'], ontology_dir)
+    create_dashboard_score_badge("blue", f"{obo_dashboard_score_pc} %", ontology_dir)
+
+    save_yaml(data_yml, dashboard_yml, json_sidecar=config.is_json_sidecars())
+
+
+def restore_checks(data_yml, ontology_dir, config):
+    """Save the cached check results of an ontology, if it was checked before with exactly
+    the same inputs (see artifact_cache.checks_key), without running the checks.
+
+    Return:
+        True if the check results were restored
+    """
+    key = data_yml.get('artifact_keys', {}).get('checks')
+    if not key:
+        return False
+    checked = ArtifactCache(config.get_artifact_cache_dir()).restore(
+        'checks', key, output_files(CHECK_FILES, ontology_dir))
+    if not checked:
+        return False
+    save_dashboard_results(data_yml, checked, config, ontology_dir)
+    return True
+
+
+def check_ontology(gateway, ontology_file, metrics_file, ontology_dir, data_yml, profile, shared):
+    """Run all checks over an ontology and save the results to dashboard.yml
+    in the output directory of the ontology.
+
+    The ontology is removed from its OWLOntologyManager afterwards, so that the
+    same gateway can be used to check many ontologies.
+
+    Args:
+        gateway (JavaGateway): gateway to a JVM running ROBOT
+        ontology_file (str): input ontology file
+        metrics_file (str): output from ROBOT metrics run
+        ontology_dir (str): output directory of the ontology
+        data_yml (dict): dashboard data, see load_dashboard_data
+        profile (str): location of the profile.txt file
+        shared (dict): inputs shared by all ontologies, see load_shared_inputs
+    """
+    owl = os.path.basename(ontology_file)
+    namespace = os.path.splitext(owl)[0]
+    config = shared['config']
+    timings = data_yml.setdefault('timings', {})
+
+    # Handle ontology file
+    big = namespace in BIG_ONTS
+    ont_or_file = None
+
+    try:
+        robot_gateway = gateway.jvm.org.obolibrary.robot
+        pid = jvm_pid(gateway)
+
+        # IOHelper for working with ontologies, one per ontology as base namespaces are added to it
+        io_helper = robot_gateway.IOHelper()
+
+        syntax = load_syntax(metrics_file)
+
+        if not big:
+            # Load ontology as OWLOntology object
+            if not ontology_file or not os.path.exists(ontology_file) or dash_utils.whitespace_only(ontology_file):
+                # If ontology_file is None, the file does not exist, or the file is empty
+                # Then the ontology is None
+                ont_or_file = None
+            else:
+                try:
+                    with timed(timings, 'load', pid):
+                        ont_or_file = io_helper.loadOntology(ontology_file)
+                except Exception:
+                    print('ERROR: Unable to load \'{0}\''.format(ontology_file), flush=True)
+                    ont_or_file = None
+            # Get the Verison IRI
+            version_iri = dash_utils.get_version_iri(ont_or_file)
         else:
-            summary = 'PASS'
-            summary_comment = ''
-            color = 'green'
-            badge_message.append("PASS")
-
-        summary_count = dict()
-        summary_count['ERROR'] = err
-        summary_count['WARN'] = warn
-        summary_count['INFO'] = info
-        date = datetime.datetime.today()
-        save_data = {'namespace': namespace, 'version': version_iri, 'date': date,
-                     'summary': {'status': summary, 'comment': summary_comment, 'summary_count': summary_count}, 'results': all_checks}
-
-        oboscore_weights = config.get_oboscore_weights()
-        oboscore_maximpacts = config.get_oboscore_max_impact()
-
-        for key in save_data:
-            data_yml[key] = save_data[key]
-
-        raw_dashboard_score = compute_dashboard_score_alt1(data_yml, oboscore_weights, oboscore_maximpacts)
-        raw_dashboard_score = float(raw_dashboard_score) / float(100)
-        obo_dashboard_score = round_float(float(raw_dashboard_score))
-        data_yml['metrics']['Info: Experimental OBO score']['_dashboard'] = obo_dashboard_score
-        oboscore = compute_obo_score(data_yml['metrics']['Info: Experimental OBO score']['_impact'],
-                                     data_yml['metrics']['Info: Experimental OBO score']['_reuse'],
-                                     data_yml['metrics']['Info: Experimental OBO score']['_dashboard'],
-                                     data_yml['metrics']['Info: Experimental OBO score']['_impact_external'],
-                                     oboscore_weights)
-
-        data_yml['metrics']['Info: Experimental OBO score']['oboscore'] = round_float(oboscore['score'])
-        data_yml['metrics']['Info: Experimental OBO score']['_formula'] = oboscore['formula']
-
-        obo_dashboard_score_pc = round_float(float((obo_dashboard_score*100)))
-        # Save to YAML file
-        print('Saving results to {0}'.format(dashboard_yml))
-        create_dashboard_qc_badge(color, ", ".join(badge_message), ontology_dir)
-        create_dashboard_score_badge("blue", f"{obo_dashboard_score_pc} %", ontology_dir)
-
-        with open(dashboard_yml, 'w+') as f:
-            yaml.dump(data_yml, f)
+            # Just provide path to file
+            ont_or_file = ontology_file
+            # Get the version IRI by text parsing
+            version_iri = dash_utils.get_big_version_iri(ont_or_file)
+
+        started = time.time()
+        checked = run_checks(gateway, io_helper, ont_or_file, namespace, version_iri, syntax, ontology_dir,
+                             profile, shared, timings, pid)
+        if checked is not None:
+            key = data_yml.get('artifact_keys', {}).get('checks')
+            if key:
+                ArtifactCache(config.get_artifact_cache_dir()).store(
+                    'checks', key, output_files(CHECK_FILES, ontology_dir), data=checked, newer_than=started)
+            save_dashboard_results(data_yml, checked, config, ontology_dir)
     except Exception:
         logging.exception(f"Creating  dashboard for {ontology_file} failed")
     finally:
-        try:
-            gateway.shutdown(raise_exception=True)
-        except Exception as e:
-            logging.exception("Failed to shut down the gateway: %s", e)
+        if ont_or_file is not None and not big:
+            # Release the ontology, so that its memory can be reclaimed before the next one
+            try:
+                ont_or_file.getOWLOntologyManager().removeOntology(ont_or_file)
+            except Exception as e:
+                logging.warning("Failed to release %s: %s", ontology_file, e)
+
+
+def jvm_pid(gateway):
+    """Return the process id of the JVM of a gateway, or None if it cannot be determined."""
+    try:
+        return gateway.jvm.java.lang.ProcessHandle.current().pid()
+    except Exception:
+        return None
+
+
+def to_java_args(gateway, args):
+    """Convert a list of command line arguments into a Java String[]."""
+    java_args = gateway.new_array(gateway.jvm.java.lang.String, len(args))
+    for i, arg in enumerate(args):
+        java_args[i] = arg
+    return java_args
+
+
+def fused_prepare_ontology(gateway, namespace, raw_file, metrics_file, ontology_dir, base_iris, make_base, profile,
+                           shared, base_file=None, robot_prefixes=None, robot_opts="-v", timings=None, catalog=None,
+                           prefixes_file=None):
+    """Prepare and check an ontology in a single pass over one parsed copy of it.
+
+    The raw ontology is loaded once in the JVM of the gateway. The same ROBOT
+    commands as in lib.robot_prepare_ontology (merge, remove, measure) are
+    chained on it through a CommandState, and the resulting ontology is then
+    checked by run_checks, instead of being written to disk and parsed again
+    by a separate dashboard.py run.
+
+    Args:
+        gateway (JavaGateway): gateway to a JVM running ROBOT
+        namespace (str): ontology id
+        raw_file (str): downloaded ontology file
+        metrics_file (str): where to save the ROBOT metrics
+        ontology_dir (str): output directory of the ontology
+        base_iris (list): base IRIs used to extract the base
+        make_base (bool): whether to extract the base of the ontology
+        profile (str): location of the profile.txt file
+        shared (dict): inputs shared by all ontologies, see load_shared_inputs
+        base_file (str): where to save the base, or None to not write it
+        robot_prefixes (dict): additional prefixes for ROBOT metrics
+        robot_opts (str): additional ROBOT options
+        timings (dict): where to record the timings of the preparation, the report and every check
+        catalog (str): XML catalog of local copies of the imports (see import_cache)
+        prefixes_file (str): JSON-LD file with the prefixes for ROBOT metrics, used instead of robot_prefixes
+
+    Return:
+        check results, see run_checks
+    """
+    robot_gateway = gateway.jvm.org.obolibrary.robot
+    if robot_prefixes is None:
+        robot_prefixes = {}
+    if timings is None:
+        timings = {}
+    pid = jvm_pid(gateway)
+
+    merge_args = ["--input", raw_file]
+    if catalog:
+        merge_args.extend(["--catalog", catalog])
+    if robot_opts:
+        merge_args.extend(robot_opts.split())
+    with timed(timings, 'robot_prepare', pid):
+        state = robot_gateway.MergeCommand().execute(robot_gateway.CommandState(), to_java_args(gateway, merge_args))
+
+        # Extract base if not available
+        if make_base:
+            remove_args = []
+            for s in base_iris:
+                remove_args.extend(["--base-iri", s])
+            remove_args.extend(["--axioms", "external", "--trim", "false", "-p", "false"])
+            state = robot_gateway.RemoveCommand().execute(state, to_java_args(gateway, remove_args))
+
+        measure_args = []
+        if prefixes_file:
+            measure_args.extend(["--add-prefixes", prefixes_file])
+        else:
+            for prefix in robot_prefixes:
+                measure_args.extend(["--prefix", f"{prefix}: {robot_prefixes[prefix]}"])
+        measure_args.extend(["--metrics", "extended-reasoner", "-f", "yaml", "-o", metrics_file])
+        state = robot_gateway.MeasureCommand().execute(state, to_java_args(gateway, measure_args))
+
+    ontology = state.getOntology()
+    try:
+        if base_file:
+            robot_gateway.IOHelper().saveOntology(ontology, base_file)
+        # IOHelper for working with ontologies, one per ontology as base namespaces are added to it
+        io_helper = robot_gateway.IOHelper()
+        version_iri = dash_utils.get_version_iri(ontology)
+        return run_checks(gateway, io_helper, ontology, namespace, version_iri, load_syntax(metrics_file),
+                          ontology_dir, profile, shared, timings, pid)
+    finally:
+        # Release the ontology, so that its memory can be reclaimed before the next one
+        ontology.getOWLOntologyManager().removeOntology(ontology)
+
+
+def run():
+    # ---------------------------- #
+    # PREPARE INPUT
+    # ---------------------------- #
+
+    # parse input args
+    parser = ArgumentParser(description='Create dashboard files')
+    parser.add_argument('ontology', type=str, help='Input ontology file')
+    parser.add_argument('ontologymetrics', type=str, help='Output from ROBOT metrics run')
+    parser.add_argument('registry', type=str, help='Registry YAML file')
+    parser.add_argument('schema', type=str, help='OBO JSON schema')
+    parser.add_argument('relations', type=str, help='Table containing RO IRIs and labels')
+    parser.add_argument('profile', type=str, help='Optional location of profile.txt file.')
+    parser.add_argument('configfile', type=str, help='Location of the dashboard config file', default='build/robot.jar')
+    parser.add_argument('outdir', type=str, help='Output directory')
+    parser.add_argument('robot_jar',type=str,help='Location of your local ROBOT jar', default='build/robot.jar')
+    args = parser.parse_args()
+
+    # Create the build directory for this ontology
+    ontology_dir = args.outdir
+    os.makedirs(ontology_dir, exist_ok=True)
+
+    data_yml = load_dashboard_data(ontology_dir)
+    if data_yml is None:
+        sys.exit(0)
+
+    shared = load_shared_inputs(args.registry, args.schema, args.relations, args.configfile)
+    if restore_checks(data_yml, ontology_dir, shared['config']):
+        sys.exit(0)
+
+    robot = RobotGateway(args.robot_jar)
+    try:
+        check_ontology(robot.gateway, args.ontology, args.ontologymetrics, ontology_dir, data_yml, args.profile, shared)
+    finally:
+        robot.shutdown()
+
+    sys.exit(0)
+
+
+def run_batch():
+    """Create the dashboard files for a batch of ontologies, running all checks
+    through a pool of warm ROBOT gateways, so that each JVM is only started once.
+
+    With --workers N, up to N ontologies are checked at the same time, each on
+    its own gateway. A gateway whose JVM crashes or runs out of memory is
+    replaced, and the ontology it was checking is checked again.
+    """
+    parser = ArgumentParser(description='Create dashboard files for a batch of ontologies')
+    parser.add_argument('--batch', type=FileType('r'), required=True,
+                        help='TSV file with one ontology per line: input ontology file, output from ROBOT '
+                             'metrics run and output directory')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of ontologies to check at the same time, each on its own ROBOT gateway')
+    parser.add_argument('--heap-mb', type=int, default=0,
+                        help='Maximum heap of each ROBOT gateway in MB, 0 for the JVM default')
+    parser.add_argument('registry', type=str, help='Registry YAML file')
+    parser.add_argument('schema', type=str, help='OBO JSON schema')
+    parser.add_argument('relations', type=str, help='Table containing RO IRIs and labels')
+    parser.add_argument('profile', type=str, help='Optional location of profile.txt file.')
+    parser.add_argument('configfile', type=str, help='Location of the dashboard config file')
+    parser.add_argument('robot_jar', type=str, help='Location of your local ROBOT jar', default='build/robot.jar')
+    args = parser.parse_args()
+
+    batch = []
+    for line in args.batch:
+        if line.strip():
+            batch.append(line.rstrip('\n').split('\t'))
+    args.batch.close()
+
+    shared = load_shared_inputs(args.registry, args.schema, args.relations, args.configfile)
+    pool = GatewayPool(args.robot_jar, max(1, args.workers), [f"-Xmx{args.heap_mb}m"] if args.heap_mb else None)
+
+    def check(item):
+        ontology_file, metrics_file, ontology_dir = item
+        os.makedirs(ontology_dir, exist_ok=True)
+        data_yml = load_dashboard_data(ontology_dir)
+        if data_yml is None or restore_checks(data_yml, ontology_dir, shared['config']):
+            return
+        pool.run(ontology_file, lambda gateway: check_ontology(
+            gateway, ontology_file, metrics_file, ontology_dir, data_yml, args.profile, shared))
+
+    try:
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            futures = [(item[0], executor.submit(check, item)) for item in batch]
+            for ontology_file, future in futures:
+                try:
+                    future.result()
+                except Exception:
+                    logging.exception(f"Creating dashboard for {ontology_file} failed")
+    finally:
+        pool.shutdown()
 
     sys.exit(0)
 
+
 BIG_ONTS = []
 #BIG_ONTS = ['bto', 'chebi', 'dron', 'gaz', 'ncbitaxon', 'ncit', 'pr', 'uberon']
 OBO = 'http://purl.obolibrary.org/obo'
@@ -429,4 +772,7 @@ PRINCIPLE_MAP = {
 
 
 if __name__ == '__main__':
-    run()
+    if '--batch' in sys.argv[1:]:
+        run_batch()
+    else:
+        run()
@@ -69,7 +69,7 @@ def has_versioning(ontology):
     if not version_iri:
         return {'status': 'ERROR', 'comment': missing_version}
 
-    if not url_exists(version_iri):
+    if not url_exists(version_iri, kind='version_iri'):
         return {"status": "ERROR", "comment": "Version IRI does not resolve"}
 
     iri_version_error_message = get_iri_version_error_message(version_iri)
@@ -104,7 +104,7 @@ def big_has_versioning(file):
         return {'status': 'ERROR', 'comment': 'Unable to parse ontology'}
     if version_iri == "":
         return {'status': 'ERROR', 'comment': missing_version}
-    if not url_exists(version_iri):
+    if not url_exists(version_iri, kind='version_iri'):
         return {"status": "ERROR", "comment": "Version IRI does not resolve"}
     # compare version IRI to the regex pattern
     if not PATTERN.search(version_iri):
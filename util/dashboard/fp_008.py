@@ -73,7 +73,7 @@ def has_documentation(data):
                 'comment': 'Missing description'}
 
     # check if URL resolves
-    if not url_exists(home):
+    if not url_exists(home, kind='homepage'):
         return {'status': 'ERROR',
                 'comment': 'Homepage URL ({0}) does not resolve'.format(home)}
 
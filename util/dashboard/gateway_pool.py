@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import atexit
+import logging
+import queue
+import threading
+
+from py4j.java_gateway import GatewayParameters, JavaGateway, launch_gateway
+
+# Make the JVM exit on OutOfMemoryError, instead of limping on in an unusable
+# state, so that the pool notices and replaces it.
+JAVA_OPTS = ['-XX:+ExitOnOutOfMemoryError']
+
+# Gateway of the current process, see process_gateway
+_process_gateway = None
+
+
+class RobotGateway:
+    """A JVM running ROBOT, launched on a free port, and the gateway connected to it.
+    """
+
+    def __init__(self, robot_jar, java_opts=None):
+        """Launch a new JVM with the ROBOT jar on an ephemeral port.
+
+        Args:
+            robot_jar (str): location of the ROBOT jar
+            java_opts (list): additional JVM options
+        """
+        self.java_opts = java_opts or []
+        self.port, self.process = launch_gateway(
+            port=0, jarpath=robot_jar, classpath='org.obolibrary.robot.PythonOperation',
+            javaopts=JAVA_OPTS + self.java_opts, die_on_exit=True, return_proc=True)
+        self.gateway = JavaGateway(gateway_parameters=GatewayParameters(port=self.port))
+        logging.info(f"Launched ROBOT gateway on port {self.port} (pid {self.process.pid})")
+
+    def is_alive(self):
+        """Return True if the JVM is still running and answering."""
+        if self.process.poll() is not None:
+            return False
+        try:
+            self.gateway.jvm.System.currentTimeMillis()
+            return True
+        except Exception:
+            return False
+
+    def shutdown(self):
+        """Shut down the gateway and make sure that the JVM is gone."""
+        try:
+            self.gateway.shutdown(raise_exception=True)
+        except Exception as e:
+            logging.warning(f"Failed to shut down the gateway on port {self.port}: {e}")
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except Exception:
+                self.process.kill()
+
+
+class GatewayPool:
+    """A pool of warm ROBOT gateways, each on its own port, shared by worker threads.
+
+    Gateways are launched lazily, up to the size of the pool. A gateway whose
+    JVM crashed (or ran out of memory) while running a task is replaced by a new
+    one, and the task is retried once on the new gateway.
+    """
+
+    def __init__(self, robot_jar, size, java_opts=None):
+        """
+        Args:
+            robot_jar (str): location of the ROBOT jar
+            size (int): maximum number of gateways
+            java_opts (list): additional JVM options for every gateway
+        """
+        self.robot_jar = robot_jar
+        self.size = size
+        self.java_opts = java_opts
+        self.idle = queue.Queue()
+        self.launched = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Return an idle gateway, launching a new one if the pool is not full yet."""
+        with self.lock:
+            launch = self.idle.empty() and self.launched < self.size
+            if launch:
+                self.launched += 1
+        if launch:
+            try:
+                return RobotGateway(self.robot_jar, self.java_opts)
+            except Exception:
+                with self.lock:
+                    self.launched -= 1
+                raise
+        return self.idle.get()
+
+    def release(self, gateway):
+        """Return a gateway to the pool, or discard it if its JVM is gone."""
+        if gateway.is_alive():
+            self.idle.put(gateway)
+            return
+        logging.warning(f"ROBOT gateway on port {gateway.port} died "
+                        f"(exit code {gateway.process.poll()}), it will be replaced")
+        gateway.shutdown()
+        with self.lock:
+            self.launched -= 1
+
+    def run(self, name, fn, retries=1):
+        """Run fn(gateway) on a gateway of the pool.
+
+        If the JVM of the gateway dies while running fn, the gateway is replaced
+        and fn is run again, up to retries times.
+
+        Args:
+            name (str): name of the task, for logging
+            fn (callable): function taking a JavaGateway
+            retries (int): number of times to retry fn after a crash
+
+        Return:
+            the return value of fn
+        """
+        attempt = 0
+        while True:
+            gateway = self.acquire()
+            try:
+                result = fn(gateway.gateway)
+            finally:
+                crashed = not gateway.is_alive()
+                self.release(gateway)
+            if not crashed:
+                return result
+            attempt += 1
+            if attempt > retries:
+                logging.error(f"Giving up on {name} after {attempt} crashed ROBOT gateways")
+                return result
+            logging.warning(f"Retrying {name} on a new ROBOT gateway ({attempt}/{retries})")
+
+    def shutdown(self):
+        """Shut down all idle gateways."""
+        while not self.idle.empty():
+            self.idle.get().shutdown()
+
+
+def process_gateway(robot_jar, java_opts=None):
+    """Return the ROBOT gateway of the current process, launching it on first use.
+
+    This lets long-lived worker processes keep one warm JVM for all the jobs
+    they run. The gateway is replaced if its JVM died or was launched with other
+    JVM options (e.g. a job needing a larger heap), and shut down when the
+    process exits.
+
+    Args:
+        robot_jar (str): location of the ROBOT jar
+        java_opts (list): additional JVM options
+    """
+    global _process_gateway
+    if _process_gateway is not None and not _process_gateway.is_alive():
+        logging.warning(f"ROBOT gateway on port {_process_gateway.port} died, it will be replaced")
+        shutdown_process_gateway()
+    elif _process_gateway is not None and _process_gateway.java_opts != (java_opts or []):
+        shutdown_process_gateway()
+    if _process_gateway is None:
+        _process_gateway = RobotGateway(robot_jar, java_opts)
+        atexit.register(_process_gateway.shutdown)
+    return _process_gateway
+
+
+def shutdown_process_gateway():
+    """Shut down the ROBOT gateway of the current process, if it has one."""
+    global _process_gateway
+    if _process_gateway is not None:
+        atexit.unregister(_process_gateway.shutdown)
+        _process_gateway.shutdown()
+        _process_gateway = None
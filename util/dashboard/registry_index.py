@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE ontologies (id TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE shared (name TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE sources (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);
+"""
+
+
+def source_stamps(paths):
+    """Return the size and modification time of every file, by path."""
+    stamps = {}
+    for path in paths:
+        stat = os.stat(path)
+        stamps[os.path.abspath(path)] = (stat.st_size, stat.st_mtime_ns)
+    return stamps
+
+
+class RegistryIndex:
+    """Registry entries by ontology id, and the inputs derived from the registry that are
+    shared by the checks of all ontologies, in a SQLite file. Looking up an ontology only
+    reads its own entry, instead of parsing the whole registry.
+
+    The index records the size and modification time of the files it was built from, and
+    open only returns it while they are unchanged. Safe to share between threads.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> registry = os.path.join(directory, 'ontologies.yml')
+    >>> with open(registry, 'w') as f:
+    ...     _ = f.write('ontologies: {}')
+    >>> index_path = os.path.join(directory, 'ontologies-index.sqlite')
+    >>> RegistryIndex.open(index_path, [registry]) is None
+    True
+    >>> index = RegistryIndex.build(index_path, [registry], {'UBERON': {'id': 'uberon'}}, {'domain_map': {}})
+    >>> index.get('uberon'), index.get('go'), index.shared('domain_map')
+    ({'id': 'uberon'}, None, {})
+    >>> index.close()
+    >>> RegistryIndex.open(index_path, [registry]).get('UBERON')
+    {'id': 'uberon'}
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, check_same_thread=False)
+
+    @classmethod
+    def open(cls, index_path, sources):
+        """Return the index, or None if it is missing or was built from other versions of the sources."""
+        if not os.path.isfile(index_path):
+            return None
+        try:
+            index = cls(index_path)
+            with index.lock:
+                recorded = {path: (size, mtime_ns) for path, size, mtime_ns
+                            in index.connection.execute("SELECT path, size, mtime_ns FROM sources")}
+        except sqlite3.Error:
+            return None
+        if recorded != source_stamps(sources):
+            index.close()
+            return None
+        return index
+
+    @classmethod
+    def build(cls, index_path, sources, ontologies, shared):
+        """Write a new index and return it.
+
+        Args:
+            index_path (str): location of the index, replaced atomically
+            sources (list): files the index is built from
+            ontologies (dict): registry entry of every ontology, by id
+            shared (dict): other inputs derived from the sources, by name
+        """
+        stamps = source_stamps(sources)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        connection = sqlite3.connect(tmp_path)
+        try:
+            with connection:
+                connection.executescript(SCHEMA)
+                connection.executemany("INSERT OR REPLACE INTO ontologies VALUES (?, ?)",
+                                       [(o.lower(), pickle.dumps(data)) for o, data in ontologies.items()])
+                connection.executemany("INSERT INTO shared VALUES (?, ?)",
+                                       [(name, pickle.dumps(data)) for name, data in shared.items()])
+                connection.executemany("INSERT INTO sources VALUES (?, ?, ?)",
+                                       [(path, size, mtime_ns) for path, (size, mtime_ns) in stamps.items()])
+        finally:
+            connection.close()
+        os.replace(tmp_path, index_path)
+        return cls(index_path)
+
+    def get(self, o):
+        """Return the registry entry of an ontology (the id is not case sensitive), or None."""
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM ontologies WHERE id = ?", (o.lower(),)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def shared(self, name):
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM shared WHERE name = ?", (name,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def close(self):
+        self.connection.close()
@@ -358,13 +358,25 @@ def main(args):
     )
     args = parser.parse_args()
 
-    dash_results = load_yaml(args.dashboard_results)
+    create_analysis_html(args.dashboard_results, args.template, args.output)
+
+
+def create_analysis_html(dashboard_results, template_file, output):
+    """
+    Render the analysis page from the results of all ontologies.
+
+    Args:
+        dashboard_results (str): path to the dashboard results file
+        template_file (str): path to the Jinja2 template file
+        output (str): path to the output HTML file
+    """
+    dash_results = load_yaml(dashboard_results)
     df = prep_data(dash_results)
     df_all = pd.json_normalize(dash_results["ontologies"])
     df_score = df[["ontology", "score", "score_dash", "score_impact"]].copy()
     df_score.sort_values("score", inplace=True, ascending=False)
 
-    with open(args.template, mode="r", encoding="utf-8") as f:
+    with open(template_file, mode="r", encoding="utf-8") as f:
         template = Template(f.read())
 
     rendered_template = template.render(
@@ -399,7 +411,7 @@ def main(args):
         )
     )
 
-    with open(args.output, mode="w", encoding="utf-8") as f:
+    with open(output, mode="w", encoding="utf-8") as f:
         f.write(rendered_template)
 
 
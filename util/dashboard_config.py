@@ -3,18 +3,45 @@
 import json
 import logging
 import os
+import queue
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import click
 import requests
-import yaml
-from lib import (DashboardConfig, compute_percentage_reused_entities,
-                 create_dashboard_qc_badge, create_dashboard_score_badge,
-                 download_file, get_base_prefixes, get_hours_since, load_yaml,
-                 robot_prepare_ontology, round_float, runcmd, save_yaml,
-                 sha256sum)
+from artifact_cache import (CHECK_FILES, HTML_FILES, ArtifactCache, artifact_key, checks_key, html_key,
+                            output_files, robot_cli_version, robot_jar_digest)
+from lib import (NOT_MODIFIED, DashboardConfig, DownloadValidators,
+                 compute_percentage_reused_entities, create_dashboard_qc_badge,
+                 create_dashboard_score_badge, download_file,
+                 file_sha256, get_base_prefixes, get_hours_since, load_yaml, prefetch_urls,
+                 robot_prepare_ontology, round_float, runcmd, save_yaml, set_url_cache, write_prefixes_context)
+from dashboard_pages import (add_dashboard_pages, add_ontology_pages, checks_out_of_date, new_build_graph,
+                             truncate_reports)
+from http_client import HttpClient, set_http_client
+from import_cache import ImportCache
+from run_history import RunHistory
+from scheduler import Job, MemoryScheduler, estimate_job_memory_mb
+from timings import DASHBOARD, timed, write_run_profile
+from url_cache import UrlCache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard'))
+import dash_utils
+from dashboard import fused_prepare_ontology, load_registry_index, load_shared_inputs, save_dashboard_results
+from gateway_pool import process_gateway, shutdown_process_gateway
 
 logging.basicConfig(level=logging.INFO)
 
+# Additional prefixes passed to ROBOT, written once per run by prepare_ontologies
+ROBOT_PREFIXES_FILE = os.path.join("build", "robot-prefixes.jsonld")
+
+# The heap of the ROBOT JVM of a prepare job is rounded up to a multiple of this, so that the warm
+# JVM of a worker can be reused by the next job if it is of a similar size
+HEAP_STEP_MB = 1024
+
 @click.group()
 def cli():
     pass
@@ -32,8 +59,13 @@ def cli():
               help="""
                 Delete the contents of the current dashboard dir prior to processing.
                 """)
-def rundashboard(configfile, clean):
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1,
+              help="""
+                Number of ontologies to prepare (download, hash, base file and metrics) in parallel.
+                """)
+def rundashboard(configfile, clean, jobs):
     config = DashboardConfig(configfile)
+    set_http_client(HttpClient(**config.get_http_settings()))
     profile = config.get_profile()
     ontologies = config.get_ontologies()
     with open('profile.txt', 'w') as f:
@@ -46,8 +78,7 @@ def rundashboard(configfile, clean):
         os.mkdir(dependencies_path)
 
     ontologies_path = os.path.join(dependencies_path, 'ontologies.yml')
-    with open(ontologies_path, 'w') as file:
-        yaml.dump(ontologies, file)
+    save_yaml(ontologies, ontologies_path)
 
     environment_variables = config.get_environment_variables()
     make_parameters = ""
@@ -72,11 +103,33 @@ def rundashboard(configfile, clean):
     if not os.path.isdir(dashboard_dir):
         os.mkdir(dashboard_dir)
 
-    prepare_ontologies(ontologies['ontologies'], ontology_dir, dashboard_dir, make_parameters, config)
+    history = RunHistory(config.get_run_history_db())
+    run_id = history.start_run(jobs)
+    processed = prepare_ontologies(ontologies['ontologies'], ontology_dir, dashboard_dir, make_parameters, config, jobs,
+                                   history)
     logging.info("Building the dashboard")
-    runcmd(f"make dashboard {make_parameters} -B", config.get_dashboard_report_timeout_seconds())
+    graph = new_build_graph()
+    add_dashboard_pages(graph, dashboard_dir)
+    failed = graph.run()
+
+    # Timings and outcomes of the ontologies processed in this run (the others keep those of an earlier run)
+    run_timings = {}
+    for o in processed:
+        ont_results_path = os.path.join(dashboard_dir, o, "dashboard.yml")
+        if os.path.isfile(ont_results_path):
+            ont_results = load_yaml(ont_results_path)
+            run_timings[o] = ont_results.get('timings', {})
+            ont_path = os.path.join(ontology_dir, f"{o}-raw.owl")
+            history.record_ontology(run_id, o, ont_results,
+                                    file_bytes=os.path.getsize(ont_path) if os.path.isfile(ont_path) else None)
+    run_timings[DASHBOARD] = {os.path.basename(output): timing for output, timing in graph.timings.items()}
+    write_run_profile(run_timings, os.path.join(build_dir, "run-profile.json"))
+    history.finish_run(run_id)
+    history.close()
+    if failed:
+        raise Exception("Failed to build the dashboard")
     logging.info("Postprocess files for github")
-    runcmd(f"make truncate_reports_for_github {make_parameters} -B", config.get_dashboard_report_timeout_seconds())
+    truncate_reports(dashboard_dir)
 
 info_usage_namespace = 'Info: Usage of namespaces in axioms'
 
@@ -117,257 +170,708 @@ def compute_external_impact(number_uses):
 
 
 
-def prepare_ontologies(ontologies, ontology_dir, dashboard_dir, make_parameters, config):
-    ontologies_results = {}
+def prefetch_link_checks(ontologies, ontology_dir, config):
+    """
+    Check concurrently whether the homepages of the ontologies, and the version IRIs of their
+    base files, resolve, so that the FP04 and FP08 checks find the results in the URL cache
+    instead of waiting for the network. Version IRIs are read from the RDF/XML header of the
+    base files, so only those of base files that exist are checked.
+    """
+    urls = {}
+    for o in ontologies:
+        if ontologies[o].get('homepage'):
+            urls[ontologies[o]['homepage']] = 'homepage'
+        ont_base_path = os.path.join(ontology_dir, f"{o}.owl")
+        if os.path.isfile(ont_base_path):
+            try:
+                version_iri = dash_utils.get_big_version_iri(ont_base_path)
+            except Exception:
+                logging.warning(f"Unable to read the version IRI of {ont_base_path}")
+                continue
+            if version_iri and isinstance(version_iri, str):
+                urls[version_iri] = 'version_iri'
+    url_cache = UrlCache(config.get_url_cache_db(), config.get_url_cache_ttl_hours())
+    previous = set_url_cache(url_cache)
+    try:
+        prefetch_urls(urls, config.get_url_check_jobs())
+    finally:
+        set_url_cache(previous)
+        url_cache.close()
+
 
+def order_ontologies(ontologies, ontology_dir, dashboard_dir, config, durations):
+    """
+    Order the work list of ontologies according to the ontology_order policy of the config:
+
+    - registry: the order of the registry
+    - lpt: longest expected processing time first, so that the biggest ontologies do not
+      start last and keep the run going long after all other workers are idle
+    - changed-first: ontologies that will be downloaded again (no recent base file) or failed
+      last time first, then the others, each group longest first
+
+    The expected processing time of an ontology is its duration in the last run that fully
+    processed it, or else the size of its last downloaded file, converted to seconds with the
+    median seconds per byte of the ontologies for which both are known. Ontologies without
+    either come first, as they may well be big.
+
+    Returns:
+        List of ontology ids.
+    """
+    policy = config.get_ontology_order()
+    if policy not in ['registry', 'lpt', 'changed-first']:
+        logging.warning(f"Unknown ontology_order {policy}, using the registry order.")
+        policy = 'registry'
+    if policy == 'registry':
+        return list(ontologies)
+
+    sizes = {}
     for o in ontologies:
-        logging.info(f"Preparing {o}...")
         ont_path = os.path.join(ontology_dir, f"{o}-raw.owl")
+        if os.path.isfile(ont_path) and os.path.getsize(ont_path) > 0:
+            sizes[o] = os.path.getsize(ont_path)
+    rates = [durations[o] / sizes[o] for o in ontologies if o in durations and o in sizes]
+    seconds_per_byte = statistics.median(rates) if rates else 1
+
+    def expected_cost(o):
+        if o in durations:
+            return durations[o]
+        if o in sizes:
+            return sizes[o] * seconds_per_byte
+        return float('inf')
+
+    def will_change(o):
         ont_base_path = os.path.join(ontology_dir, f"{o}.owl")
-        ont_metrics_path = os.path.join(ontology_dir, f"{o}-metrics.yml")
-        ont_dashboard_dir = os.path.join(dashboard_dir, o)
-        ont_results_path = os.path.join(ont_dashboard_dir, "dashboard.yml")
+        ont_results_path = os.path.join(dashboard_dir, o, "dashboard.yml")
+        if not os.path.isfile(ont_base_path) or not os.path.isfile(ont_results_path):
+            return True
+        if get_hours_since(os.path.getmtime(ont_base_path)) >= config.get_redownload_after_hours():
+            return True
+        try:
+            return 'failure' in load_yaml(ont_results_path)
+        except Exception:
+            return True
 
-        if not os.path.exists(ont_dashboard_dir):
-            os.mkdir(ont_dashboard_dir)
+    if policy == 'lpt':
+        order = sorted(ontologies, key=expected_cost, reverse=True)
+    else:
+        order = sorted(ontologies, key=lambda o: (will_change(o), expected_cost(o)), reverse=True)
+    logging.info(f"Ontology order ({policy}): {', '.join(order[:10])}{', ...' if len(order) > 10 else ''}")
+    return order
 
-        download = True
-        make_base = True
 
-        ont_results = dict()
-        if os.path.exists(ont_results_path):
+def estimate_ontology_memory_mb(o, ontology_dir, dashboard_dir, config):
+    """
+    Estimate the memory needed to prepare an ontology from the size of the last downloaded
+    file and the number of axioms recorded by the last run. Estimates can be overwritten
+    per ontology in the job_memory_estimate section of the config.
+    """
+    estimate = config.get_job_memory_estimate()
+    if o in estimate['ontologies']:
+        return estimate['ontologies'][o]
 
-            try:
-                ont_results = load_yaml(ont_results_path)
-            except Exception:
-                logging.exception(f'Corrupted results file for {o}: {ont_results_path}')
-                ont_results['failure'] = 'corrupted_results_file'
-                save_yaml(ont_results, ont_results_path)
-                create_dashboard_qc_badge("red", "Corrupted results file", ont_dashboard_dir)
-                create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-                continue
+    ont_path = os.path.join(ontology_dir, f"{o}-raw.owl")
+    ont_results_path = os.path.join(dashboard_dir, o, "dashboard.yml")
+    file_bytes = os.path.getsize(ont_path) if os.path.isfile(ont_path) else 0
+    axiom_count = 0
+    if os.path.isfile(ont_results_path):
+        try:
+            axiom_count = load_yaml(ont_results_path)['metrics']['Axioms: Number of axioms']
+        except Exception:
+            logging.info(f"No axiom count recorded for {o}, estimating memory from file size only.")
+    return estimate_job_memory_mb(file_bytes, axiom_count, estimate)
 
-            if not ont_results.get("changed") and config.is_skip_existing():
-                ontologies_results[o] = ont_results
-                logging.warning(
-                    f"Config is set to skipping, and {ont_results_path} exists, so dashboard HTML generation is entirely skipped for {o}")
-                continue
 
-        ont_results['namespace'] = o
+def download_ontology(o, ontology, ontology_dir, dashboard_dir, config, session=None, validators=None,
+                      import_cache=None):
+    """
+    Download stage of an ontology: load previous results, check the registry entry and
+    download the ontology unless it was processed recently.
+
+    This runs in a thread of the download stage, while earlier ontologies are prepared.
+    Failures are recorded in the results file and badges of the ontology.
+
+    With an import cache, the imports of the ontology are fetched into it as well, and
+    listed in an XML catalog that ROBOT loads them from in the prepare stage.
+
+    Returns:
+        None if the ontology failed, otherwise a dictionary with the results of the ontology
+        ('results'), whether the ontology was skipped entirely ('skip'), downloaded
+        ('download'), reported as not modified by the server ('unchanged'), whether
+        a base file has to be made ('make_base') and the catalog of its imports ('catalog').
+    """
+    ont_path = os.path.join(ontology_dir, f"{o}-raw.owl")
+    ont_base_path = os.path.join(ontology_dir, f"{o}.owl")
+    ont_dashboard_dir = os.path.join(dashboard_dir, o)
+    ont_results_path = os.path.join(ont_dashboard_dir, "dashboard.yml")
+
+    if not os.path.exists(ont_dashboard_dir):
+        os.mkdir(ont_dashboard_dir)
+
+    download = True
+    make_base = True
+
+    ont_results = dict()
+    if os.path.exists(ont_results_path):
 
-        # If the ontology was downloaded recently (according to the setting)
-        # Do not download it again.
-        if os.path.isfile(ont_base_path):
-            modified_timestamp = os.path.getmtime(ont_base_path)
-            hours_since = get_hours_since(modified_timestamp)
-            if hours_since < config.get_redownload_after_hours():
-                logging.info(f"File has only been processed recently ({hours_since} hours ago), skipping {o}. "
-                             f"Redownloading after {config.get_redownload_after_hours()} hours..")
-                download = False
-
-        # Get download URL
         try:
-            ourl = ontologies[o]['mirror_from']
-            if f'{o}-base.' in ourl:
-                make_base = False
+            ont_results = load_yaml(ont_results_path)
         except Exception:
-            logging.exception(f'Missing download url for {o} in registry..')
-            ont_results['failure'] = 'missing_url'
+            logging.exception(f'Corrupted results file for {o}: {ont_results_path}')
+            ont_results['failure'] = 'corrupted_results_file'
             save_yaml(ont_results, ont_results_path)
-            create_dashboard_qc_badge("red", "Missing URL", ont_dashboard_dir)
+            create_dashboard_qc_badge("red", "Corrupted results file", ont_dashboard_dir)
             create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-            continue
+            return None
+
+        if not ont_results.get("changed") and config.is_skip_existing():
+            logging.warning(
+                f"Config is set to skipping, and {ont_results_path} exists, so dashboard HTML generation is entirely skipped for {o}")
+            return {'results': ont_results, 'skip': True}
+
+    ont_results['namespace'] = o
+    # Only the stages that run this time are timed
+    ont_results['timings'] = {}
+
+    # If the ontology was downloaded recently (according to the setting)
+    # Do not download it again.
+    if os.path.isfile(ont_base_path):
+        modified_timestamp = os.path.getmtime(ont_base_path)
+        hours_since = get_hours_since(modified_timestamp)
+        if hours_since < config.get_redownload_after_hours():
+            logging.info(f"File has only been processed recently ({hours_since} hours ago), skipping {o}. "
+                         f"Redownloading after {config.get_redownload_after_hours()} hours..")
+            download = False
+
+    # Get download URL
+    try:
+        ourl = ontology['mirror_from']
+        if f'{o}-base.' in ourl:
+            make_base = False
+    except Exception:
+        logging.exception(f'Missing download url for {o} in registry..')
+        ont_results['failure'] = 'missing_url'
+        save_yaml(ont_results, ont_results_path)
+        create_dashboard_qc_badge("red", "Missing URL", ont_dashboard_dir)
+        create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+        return None
 
-        # Get base namespaces
+    # Check base namespaces, they are used in the prepare stage
+    if 'base_ns' not in ontology:
+        logging.error(f'Missing base namespaces for {o} in registry..')
+        ont_results['failure'] = 'missing_base_namespaces'
+        save_yaml(ont_results, ont_results_path)
+        create_dashboard_qc_badge("red", "Missing base namespaces", ont_dashboard_dir)
+        create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+        return None
+
+    unchanged = False
+    if download:
+        logging.info("Downloading %s...", o)
         try:
-            base_namespaces = ontologies[o]['base_ns']
+            with timed(ont_results['timings'], 'download'):
+                result = download_file(ourl, ont_path, retries=config.get_download_retries(), session=session,
+                                       validators=validators, connections=config.get_download_connections(),
+                                       min_parallel_bytes=config.get_download_parallel_min_mb() * 1024 * 1024)
+            if result is not True and result != NOT_MODIFIED:
+                raise RuntimeError(f"Download of {ourl} failed")
+            # Only a 304 Not Modified lets the prepare stage reuse the hashcode of the last run
+            unchanged = result == NOT_MODIFIED
         except Exception:
-            logging.exception(f'Missing base namespaces for {o} in registry..')
-            ont_results['failure'] = 'missing_base_namespaces'
+            logging.exception("Failed to download %s from %s", o, ourl)
+            ont_results['failure'] = 'failed_download'
             save_yaml(ont_results, ont_results_path)
-            create_dashboard_qc_badge("red", "Missing base namespaces", ont_dashboard_dir)
+            create_dashboard_qc_badge("red", "Failed to download", ont_dashboard_dir)
             create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-            continue
+            return None
+    else:
+        logging.info(f"Downloading {o} skipped.")
 
-        if download:
-            logging.info("Downloading %s...", o)
-            try:
-                download_file(ourl, ont_path)
-            except Exception:
-                logging.exception("Failed to download %s from %s", o, ourl)
-                ont_results['failure'] = 'failed_download'
-                save_yaml(ont_results, ont_results_path)
-                create_dashboard_qc_badge("red", "Failed to download", ont_dashboard_dir)
-                create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-                continue
+    catalog = None
+    if import_cache is not None and os.path.isfile(ont_path):
+        catalog = os.path.join(ontology_dir, f"{o}-catalog.xml")
+        try:
+            with timed(ont_results['timings'], 'imports'):
+                count = import_cache.write_catalog(ont_path, catalog)
+            logging.info(f"Resolved {count} imports of {o} into {catalog}")
+        except Exception:
+            # Not fatal: without the catalog, ROBOT downloads the imports itself
+            logging.exception(f"Failed to resolve the imports of {o}")
+            catalog = None
+
+    return {'results': ont_results, 'skip': False, 'download': download, 'unchanged': unchanged,
+            'make_base': make_base, 'catalog': catalog}
+
+
+# Inputs of the checks in the fused pipeline, loaded once per (worker) process
+_fused_shared_inputs = None
+
+# Registry, registry schema and RO properties used by the checks
+REGISTRY_INDEX_SOURCES = ['dependencies/ontologies.yml', 'dependencies/registry_schema.json', 'build/ro-properties.csv']
+
+
+def update_registry_index():
+    """Build the registry index used by the checks, if its inputs exist, so that the processes
+    running the checks only have to open it."""
+    if all(os.path.isfile(path) for path in REGISTRY_INDEX_SOURCES):
+        load_registry_index(*REGISTRY_INDEX_SOURCES).close()
+
+
+def load_domain_map():
+    """Load the map of all ontologies of the registry to their domains from the registry index,
+    building it if needed. This is the map used by the checks (see get_fused_shared_inputs)."""
+    index = load_registry_index(*REGISTRY_INDEX_SOURCES)
+    try:
+        return index.shared('domain_map')
+    finally:
+        index.close()
+
+
+def get_fused_shared_inputs(config_file):
+    """Load the inputs shared by the checks of all ontologies, for the fused pipeline.
+
+    Args:
+        config_file (str): location of the dashboard config file of the run
+    """
+    global _fused_shared_inputs
+    if _fused_shared_inputs is None:
+        _fused_shared_inputs = load_shared_inputs(*REGISTRY_INDEX_SOURCES, config_file)
+    return _fused_shared_inputs
+
+
+def prepare_ontology(o, ontology, ontology_dir, dashboard_dir, config, downloaded, robot_version, heap_mb=None):
+    """
+    Prepare stage of an ontology: hash the downloaded file, create the base file and
+    metrics with ROBOT, and check the metrics.
+
+    With the fused pipeline enabled, the dashboard checks are run in the same pass as
+    the base and metrics, and their results are returned under 'fused_checks'.
+
+    When preparing ontologies in parallel, this runs in a worker process, so it
+    must only depend on its arguments. Failures are recorded in the results file
+    and badges of the ontology, exactly as in a serial run. robot_version identifies
+    the ROBOT building the base file and metrics (see robot_version_key), and its heap
+    is limited to heap_mb, if given.
+
+    Returns:
+        The results dictionary of the ontology, or None if it could not be prepared.
+    """
+    logging.info(f"Preparing {o}...")
+    ont_path = os.path.join(ontology_dir, f"{o}-raw.owl")
+    ont_base_path = os.path.join(ontology_dir, f"{o}.owl")
+    ont_metrics_path = os.path.join(ontology_dir, f"{o}-metrics.yml")
+    ont_dashboard_dir = os.path.join(dashboard_dir, o)
+    ont_results_path = os.path.join(ont_dashboard_dir, "dashboard.yml")
+
+    ont_results = downloaded['results']
+    java_opts = [f"-Xmx{heap_mb}m"] if heap_mb else None
+    fused = False
+    fused_checks = None
+    download = downloaded['download']
+    make_base = downloaded['make_base']
+    # Both have been checked in the download stage
+    ourl = ontology['mirror_from']
+    base_namespaces = ontology['base_ns']
+
+    # Determine hashcode of downloaded file, if either a new file was downloaded, or there is no hash from a
+    # previous result. By default, we assume the file has changed; if there was a previously generated hashcode
+    # and the hashcode is the same as the hashcode of the new file, we then assume it has not changed.
+    ont_results['changed'] = download
+    try:
+        if downloaded['unchanged'] and 'sha256_hash' in ont_results and os.path.isfile(ont_path):
+            # The server reported the file as not modified, so the hashcode of the last run still applies
+            sha256_hash = ont_results['sha256_hash']
         else:
-            logging.info(f"Downloading {o} skipped.")
+            with timed(ont_results['timings'], 'hash'):
+                sha256_hash = file_sha256(ont_path)
+        if 'sha256_hash' in ont_results:
+            if ont_results['sha256_hash'] == sha256_hash:
+                modified_timestamp = os.path.getmtime(ont_path)
+                hours_since = get_hours_since(modified_timestamp)
+                if hours_since >= config.get_force_regenerate_dashboard_after_hours():
+                    logging.info(f"{o} has been processed a while ago ({hours_since} hours ago). "
+                                 f"Forcing dashboard generation..")
+                else:
+                    logging.info(
+                        f"The downloaded file for {o} is the same as the one used for a previous run "
+                        f"(less than {config.get_force_regenerate_dashboard_after_hours()} hours ago). "
+                        f"Skipping..")
+                    ont_results['changed'] = False
+            else:
+                logging.info(f"Hashcode for downloaded file is different, . "
+                             f"Forcing dashboard generation..")
+        # Setting the new hashcode
+        ont_results['sha256_hash'] = sha256_hash
+    except Exception:
+        logging.exception(f'Failed to compute hashcode of {o}.')
+        ont_results['failure'] = 'failed_sha256_hash'
+        save_yaml(ont_results, ont_results_path)
+        create_dashboard_qc_badge("red", "Failed to compute hashcode", ont_dashboard_dir)
+        create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+        return None
+
+
+    # If the files was previously processed, but there was a failure, we get rid of the error message
+    # to try again. I cant think of a way that could happen, just playing it safe.
+    if ont_results.get('sha256_hash'):
+        ont_results.pop('failure', None)
+    else:
+        logging.exception(f'No hashcode for {ont_path}, aborting.')
+        ont_results['failure'] = 'no_sha256_hash'
+        save_yaml(ont_results, ont_results_path)
+        create_dashboard_qc_badge("red", "No hashcode for file", ont_dashboard_dir)
+        create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+        return None
+
+    ont_results['base_generated'] = make_base
+    ont_results['mirror_from'] = ourl
+    prefixes_file = ROBOT_PREFIXES_FILE if os.path.isfile(ROBOT_PREFIXES_FILE) else None
 
-        # Determine hashcode of downloaded file, if either a new file was downloaded, or there is no hash from a
-        # previous result. By default, we assume the file has changed; if there was a previously generated hashcode
-        # and the hashcode is the same as the hashcode of the new file, we then assume it has not changed.
-        ont_results['changed'] = download
+    # The base file and metrics are cached under the key of everything they are built from, so that a change
+    # of any of these (not only of the downloaded file) rebuilds them, and a known combination is restored.
+    robot_jar = os.environ.get('ROBOT_JAR', 'build/robot.jar')
+    prepare_key = artifact_key('prepare', ont_results['sha256_hash'], make_base, sorted(base_namespaces),
+                               config.get_robot_additional_prefixes(), config.get_robot_opts(), robot_version)
+    artifact_keys = ont_results.setdefault('artifact_keys', {})
+    if artifact_keys.get('prepare') != prepare_key:
+        logging.info(f"The inputs of the base file of {o} changed since last run.")
+        ont_results['changed'] = True
+    cache = ArtifactCache(config.get_artifact_cache_dir())
+    prepare_files = {'metrics.yml': ont_metrics_path}
+    if not config.is_fused_pipeline() or config.is_fused_pipeline_write_base():
+        prepare_files['base.owl'] = ont_base_path
+
+    # Only if the downloaded file changed, run the rest of the code.
+    if ont_results['changed'] == True or not os.path.isfile(ont_metrics_path) or not os.path.isfile(ont_base_path):
+
+        logging.info(f"Verifyig downloaded file...")
+
+        # Verification: ontology has at least 10 rows and does not contain the ListBucketResult string, which is
+        # an indication that the purl is not configured correctly.
         try:
-            sha256_hash = sha256sum(ont_path)
-            if 'sha256_hash' in ont_results:
-                if ont_results['sha256_hash'] == sha256_hash:
-                    modified_timestamp = os.path.getmtime(ont_path)
-                    hours_since = get_hours_since(modified_timestamp)
-                    if hours_since >= config.get_force_regenerate_dashboard_after_hours():
-                        logging.info(f"{o} has been processed a while ago ({hours_since} hours ago). "
-                                     f"Forcing dashboard generation..")
-                    else:
-                        logging.info(
-                            f"The downloaded file for {o} is the same as the one used for a previous run "
-                            f"(less than {config.get_force_regenerate_dashboard_after_hours()} hours ago). "
-                            f"Skipping..")
-                        ont_results['changed'] = False
-                else:
-                    logging.info(f"Hashcode for downloaded file is different, . "
-                                 f"Forcing dashboard generation..")
-            # Setting the new hashcode
-            ont_results['sha256_hash'] = sha256_hash
+            with open(ont_path) as myfile:
+                head = [next(myfile) for x in range(10)]
+                for line in head:
+                    if 'ListBucketResult' in line:
+                        raise Exception("BBOP file, not url.. skipping.")
         except Exception:
-            logging.exception(f'Failed to compute hashcode of {o}.')
-            ont_results['failure'] = 'failed_sha256_hash'
+            logging.error(f'Failed to verify {o} as downloaded from {ourl}')
+            ont_results['failure'] = 'not_an_ontology'
             save_yaml(ont_results, ont_results_path)
-            create_dashboard_qc_badge("red", "Failed to compute hashcode", ont_dashboard_dir)
+            create_dashboard_qc_badge("red", "Not an ontology", ont_dashboard_dir)
             create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-            continue
+            return None
+
+        logging.info(f"Creating basefile for {o}...")
 
+        # The files of a previous run can be kept if they were built from the same inputs
+        built = artifact_keys.get('prepare') == prepare_key and all(os.path.isfile(f) for f in prepare_files.values())
+        try:
+            if config.is_fused_pipeline():
+                fused = True
+                key = checks_key(prepare_key, ontology, get_fused_shared_inputs(config.config_file)['domain_map'], robot_jar)
+                fused_checks = cache.restore('checks', key, output_files(CHECK_FILES, ont_dashboard_dir))
+                if fused_checks is not None and not built:
+                    built = cache.restore('prepare', prepare_key, prepare_files) is not None
+                if fused_checks is None or not built:
+                    # Load the ontology once, and run base, metrics and checks over it in a warm JVM
+                    started = time.time()
+                    gateway = process_gateway(robot_jar, java_opts)
+                    fused_checks = fused_prepare_ontology(
+                        gateway.gateway, o, ont_path, ont_metrics_path, ont_dashboard_dir, base_namespaces, make_base,
+                        'profile.txt', get_fused_shared_inputs(config.config_file),
+                        base_file=ont_base_path if config.is_fused_pipeline_write_base() else None,
+                        robot_prefixes=config.get_robot_additional_prefixes(), robot_opts=config.get_robot_opts(),
+                        timings=ont_results['timings'], catalog=downloaded.get('catalog'), prefixes_file=prefixes_file)
+                    built = cache.store('prepare', prepare_key, prepare_files, newer_than=started)
+                    if fused_checks is not None:
+                        cache.store('checks', key, output_files(CHECK_FILES, ont_dashboard_dir), data=fused_checks,
+                                    newer_than=started)
+                artifact_keys['checks'] = key
+            elif built:
+                logging.info(f"The base file of {o} was already built from the same inputs.")
+            elif cache.restore('prepare', prepare_key, prepare_files) is not None:
+                built = True
+            else:
+                started = time.time()
+                with timed(ont_results['timings'], 'robot_prepare'):
+                    robot_prepare_ontology(ont_path, ont_base_path, ont_metrics_path, base_namespaces, make_base=make_base, robot_prefixes=config.get_robot_additional_prefixes(), robot_opts=config.get_robot_opts(),
+                                           log_file=os.path.join(ont_dashboard_dir, "logs", "robot_prepare.log"),
+                                           catalog=downloaded.get('catalog'), prefixes_file=prefixes_file,
+                                           java_opts=java_opts)
+                # Files left over from an earlier run, if ROBOT failed, must not pass for the output of these inputs
+                built = cache.store('prepare', prepare_key, prepare_files, newer_than=started)
+        except Exception:
+            logging.exception(f'Failed to compute base file for {o}.')
+            ont_results['failure'] = 'failed_robot_base'
+            save_yaml(ont_results, ont_results_path)
+            create_dashboard_qc_badge("red", "Failed to compute base", ont_dashboard_dir)
+            create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+            return None
 
-        # If the files was previously processed, but there was a failure, we get rid of the error message
-        # to try again. I cant think of a way that could happen, just playing it safe.
-        if ont_results.get('sha256_hash'):
-            ont_results.pop('failure', None)
+        if built:
+            artifact_keys['prepare'] = prepare_key
         else:
-            logging.exception(f'No hashcode for {ont_path}, aborting.')
-            ont_results['failure'] = 'no_sha256_hash'
+            artifact_keys.pop('prepare', None)
+    else:
+        logging.info(f"{o} has not changed since last run, skipping process.")
+        artifact_keys['prepare'] = prepare_key
+
+    # Processing metrics
+    if os.path.exists(ont_metrics_path):
+        try:
+            metrics = load_yaml(ont_metrics_path)
+            curie_map = config.get_robot_additional_prefixes()
+            curie_map.update(metrics['metrics']['curie_map'])
+            base_prefixes = get_base_prefixes(curie_map, base_namespaces)
+            ont_results['base_prefixes'] = base_prefixes
+            ont_results['metrics'] = {}
+            ont_results['metrics']['Info: Logical consistency'] = metrics['metrics']['consistent']
+            ont_results['metrics']['Entities: Number of unsatisfiable classes'] = metrics['metrics'][
+                'unsatisfiable_class_count']
+            ont_results['metrics']['Axioms: Number of axioms'] = metrics['metrics']['axiom_count_incl']
+            ont_results['metrics']['Entities: Number of classes'] = metrics['metrics']['class_count_incl']
+            ont_results['metrics']['Entities: Number of object properties'] = metrics['metrics'][
+                'obj_property_count_incl']
+            ont_results['metrics']['Entities: % of entities reused'] = compute_percentage_reused_entities(
+                metrics['metrics']['namespace_entity_count_incl'], base_prefixes)
+            ont_results['metrics'][info_usage_namespace] = metrics['metrics'][
+                'namespace_axiom_count_incl']
+            ont_results['metrics']['Entities: Number of individuals'] = metrics['metrics'][
+                'individual_count_incl']
+            ont_results['metrics']['Entities: Number of data properties'] = metrics['metrics'][
+                'dataproperty_count_incl']
+            ont_results['metrics']['Entities: Number of annotation properties'] = metrics['metrics'][
+                'annotation_property_count_incl']
+            ont_results['metrics']['Axioms: Breakdown of axiom types'] = metrics['metrics'][
+                'axiom_type_count_incl']
+            ont_results['metrics']['Info: Breakdown of OWL class expressions used'] = metrics['metrics'][
+                'class_expression_count_incl']
+            ont_results['metrics']['Info: Does the ontology fall under OWL 2 DL?'] = metrics['metrics'][
+                'owl2_dl']
+            ont_results['metrics']['Info: How many externally documented uses?'] = len(ontology['usages']) if 'usages' in ontology else 0
+            ont_results['metrics']['Info: Syntax'] = metrics['metrics']['syntax']
+        except Exception:
+            logging.exception(f'Broken metrics file for {o}: {ont_metrics_path}')
+            ont_results['failure'] = 'broken_metrics_file'
             save_yaml(ont_results, ont_results_path)
-            create_dashboard_qc_badge("red", "No hashcode for file", ont_dashboard_dir)
+            create_dashboard_qc_badge("red", "Failed metrics", ont_dashboard_dir)
             create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-            continue
+            return None
+    else:
+        logging.exception(f'Missing metrics file for {o}: {ont_metrics_path}')
+        ont_results['failure'] = 'missing_metrics_file'
+        create_dashboard_qc_badge("red", "Missing metrics", ont_dashboard_dir)
+        create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+        save_yaml(ont_results, ont_results_path)
+        return None
+
+    #### Check that the ontology has at least 1 axiom and is logically consistent
+    try:
+        if ont_results['metrics']['Axioms: Number of axioms'] < 1:
+            logging.exception(f'Ontology has lass than one axiom: {o}')
+            ont_results['failure'] = 'empty_ontology'
+            create_dashboard_qc_badge("red", "Empty ontology", ont_dashboard_dir)
+            create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+            save_yaml(ont_results, ont_results_path)
+            return None
 
-        ont_results['base_generated'] = make_base
-        ont_results['mirror_from'] = ourl
+        if not ont_results['metrics']['Info: Logical consistency']:
+            logging.exception(f'Ontology is inconsistent: {o}')
+            ont_results['failure'] = 'inconsistent_ontology'
+            save_yaml(ont_results, ont_results_path)
+            create_dashboard_qc_badge("red", "Inconsistent ontology", ont_dashboard_dir)
+            create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+            return None
+    except Exception:
+        logging.exception(f'Metrics based checks failed for {o}: {ont_metrics_path}')
+        ont_results['failure'] = 'metrics_check_failed'
+        save_yaml(ont_results, ont_results_path)
+        create_dashboard_qc_badge("red", "Processing error: failed metrics", ont_dashboard_dir)
+        create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+        return None
 
-        # Only if the downloaded file changed, run the rest of the code.
-        if ont_results['changed'] == True or not os.path.isfile(ont_metrics_path) or not os.path.isfile(ont_base_path):
+    logging.info(f"{o}: preprocessing successful.")
+    if fused:
+        ont_results['fused_checks'] = fused_checks
+    return ont_results
 
-            logging.info(f"Verifyig downloaded file...")
 
-            # Verification: ontology has at least 10 rows and does not contain the ListBucketResult string, which is
-            # an indication that the purl is not configured correctly.
-            try:
-                with open(ont_path) as myfile:
-                    head = [next(myfile) for x in range(10)]
-                    for line in head:
-                        if 'ListBucketResult' in line:
-                            raise Exception("BBOP file, not url.. skipping.")
-            except Exception:
-                logging.error(f'Failed to verify {o} as downloaded from {ourl}')
-                ont_results['failure'] = 'not_an_ontology'
-                save_yaml(ont_results, ont_results_path)
-                create_dashboard_qc_badge("red", "Not an ontology", ont_dashboard_dir)
-                create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-                continue
+def robot_version_key(config):
+    """Return what identifies the ROBOT that prepares the ontologies: the jar of the fused pipeline,
+    or the version of the robot command line tool. Looked up once per run, as both are slow."""
+    if config.is_fused_pipeline():
+        return robot_jar_digest(os.environ.get('ROBOT_JAR', 'build/robot.jar'))
+    return robot_cli_version()
 
-            logging.info(f"Creating basefile for {o}...")
 
-            try:
-                robot_prepare_ontology(ont_path, ont_base_path, ont_metrics_path, base_namespaces, make_base=make_base, robot_prefixes=config.get_robot_additional_prefixes(), robot_opts=config.get_robot_opts())
-            except Exception:
-                logging.exception(f'Failed to compute base file for {o}.')
-                ont_results['failure'] = 'failed_robot_base'
-                save_yaml(ont_results, ont_results_path)
-                create_dashboard_qc_badge("red", "Failed to compute base", ont_dashboard_dir)
-                create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-                continue
+def prepare_ontologies(ontologies, ontology_dir, dashboard_dir, make_parameters, config, jobs=1, history=None):
+    """
+    Download, prepare and check all ontologies, and build their dashboard pages.
 
+    The ontologies are processed in the order chosen by order_ontologies, using the durations
+    recorded in the run history, if given.
 
+    Returns:
+        The ids of the ontologies that were processed in this run: prepared, or failed before.
+    """
+    if config.is_fused_pipeline():
+        # The fused pipeline runs the dashboard checks in the prepare stage, so it needs their inputs up front
+        logging.info("Build dashboard dependencies for the fused pipeline")
+        runcmd(f"make  {make_parameters} dependencies/ontologies.yml dependencies/registry_schema.json build/ro-properties.csv profile.txt dashboard-config.yml build/robot.jar", config.get_dashboard_report_timeout_seconds())
+        update_registry_index()
+        # Link checks of the fused pipeline run in the prepare stage, the version IRIs are those of the last run
+        prefetch_link_checks(ontologies, ontology_dir, config)
 
-        else:
-            logging.info(f"{o} has not changed since last run, skipping process.")
+    prepared, processed = download_and_prepare_ontologies(ontologies, ontology_dir, dashboard_dir, config, jobs,
+                                                          history)
+    # Serial runs prepare in this process, its JVM must not hold on to memory next to those of the checks
+    shutdown_process_gateway()
 
-        # Processing metrics
-        if os.path.exists(ont_metrics_path):
-            try:
-                metrics = load_yaml(ont_metrics_path)
-                curie_map = config.get_robot_additional_prefixes()
-                curie_map.update(metrics['metrics']['curie_map'])
-                base_prefixes = get_base_prefixes(curie_map, base_namespaces)
-                ont_results['base_prefixes'] = base_prefixes
-                ont_results['metrics'] = {}
-                ont_results['metrics']['Info: Logical consistency'] = metrics['metrics']['consistent']
-                ont_results['metrics']['Entities: Number of unsatisfiable classes'] = metrics['metrics'][
-                    'unsatisfiable_class_count']
-                ont_results['metrics']['Axioms: Number of axioms'] = metrics['metrics']['axiom_count_incl']
-                ont_results['metrics']['Entities: Number of classes'] = metrics['metrics']['class_count_incl']
-                ont_results['metrics']['Entities: Number of object properties'] = metrics['metrics'][
-                    'obj_property_count_incl']
-                ont_results['metrics']['Entities: % of entities reused'] = compute_percentage_reused_entities(
-                    metrics['metrics']['namespace_entity_count_incl'], base_prefixes)
-                ont_results['metrics'][info_usage_namespace] = metrics['metrics'][
-                    'namespace_axiom_count_incl']
-                ont_results['metrics']['Entities: Number of individuals'] = metrics['metrics'][
-                    'individual_count_incl']
-                ont_results['metrics']['Entities: Number of data properties'] = metrics['metrics'][
-                    'dataproperty_count_incl']
-                ont_results['metrics']['Entities: Number of annotation properties'] = metrics['metrics'][
-                    'annotation_property_count_incl']
-                ont_results['metrics']['Axioms: Breakdown of axiom types'] = metrics['metrics'][
-                    'axiom_type_count_incl']
-                ont_results['metrics']['Info: Breakdown of OWL class expressions used'] = metrics['metrics'][
-                    'class_expression_count_incl']
-                ont_results['metrics']['Info: Does the ontology fall under OWL 2 DL?'] = metrics['metrics'][
-                    'owl2_dl']
-                ont_results['metrics']['Info: How many externally documented uses?'] = len(ontologies[o]['usages']) if 'usages' in ontologies[o] else 0
-                ont_results['metrics']['Info: Syntax'] = metrics['metrics']['syntax']
-            except Exception:
-                logging.exception(f'Broken metrics file for {o}: {ont_metrics_path}')
-                ont_results['failure'] = 'broken_metrics_file'
-                save_yaml(ont_results, ont_results_path)
-                create_dashboard_qc_badge("red", "Failed metrics", ont_dashboard_dir)
-                create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-                continue
-        else:
-            logging.exception(f'Missing metrics file for {o}: {ont_metrics_path}')
-            ont_results['failure'] = 'missing_metrics_file'
-            create_dashboard_qc_badge("red", "Missing metrics", ont_dashboard_dir)
-            create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-            save_yaml(ont_results, ont_results_path)
-            continue
+    # Check results of ontologies that went through the fused pipeline; they only lack the OBO score
+    ontologies_results = {}
+    fused_checks = {}
+    for o in ontologies:
+        if prepared.get(o) is not None:
+            ontologies_results[o] = prepared[o]
+            if 'fused_checks' in prepared[o]:
+                fused_checks[o] = prepared[o].pop('fused_checks')
+
+    if not config.is_fused_pipeline():
+        logging.info(f"Build dashboard dependencies")
+        runcmd(f"make  {make_parameters} dependencies/ontologies.yml dependencies/registry_schema.json build/ro-properties.csv profile.txt dashboard-config.yml", config.get_dashboard_report_timeout_seconds())
 
-        #### Check that the ontology has at least 1 axiom and is logically consistent
+    # Also builds the registry index for the checks
+    domain_map = load_domain_map()
+    dashboard_builds = score_ontologies(ontologies, ontologies_results, fused_checks, domain_map, dashboard_dir,
+                                        config)
+    check_ontologies(dashboard_builds, ontologies, ontologies_results, fused_checks, ontology_dir, dashboard_dir,
+                     make_parameters, config, jobs)
+    build_ontology_pages(dashboard_builds, ontologies_results, fused_checks, ontology_dir, dashboard_dir, config, jobs)
+    return processed
+
+
+def download_and_prepare_ontologies(ontologies, ontology_dir, dashboard_dir, config, jobs=1, history=None):
+    """
+    Download and prepare stages: the ontologies are downloaded by background threads and
+    handed over through a bounded queue to up to jobs parallel prepare jobs, which are
+    admitted within the memory budget. The heap of the ROBOT JVM of each job is capped at
+    its estimate, so that the jobs cannot outgrow the budget.
+
+    Returns:
+        The results of every ontology that was handed over to the prepare stage (None if it
+        failed), and the ids of the ontologies that were processed in this run.
+    """
+    memory_budget_mb = config.get_memory_budget_mb()
+    download_jobs = config.get_download_jobs()
+    download_queue = queue.Queue(maxsize=config.get_download_queue_size())
+    logging.info(f"Preparing {len(ontologies)} ontologies using {download_jobs} download threads, up to {jobs} "
+                 f"parallel prepare jobs and a memory budget of {memory_budget_mb or 'unlimited'} MB..")
+
+    # Download stage: ontologies are downloaded in background threads and handed over to
+    # the prepare stage through a bounded queue, so that the next ontologies download while
+    # the current ones are processed by ROBOT, without running too far ahead.
+    download_errors = []
+    # Set if the prepare stage fails, so that the download threads stop instead of downloading the rest
+    stop = threading.Event()
+    # Set once the prepare stage received the end of the download stage
+    downloads_done = threading.Event()
+
+    # Computed once here from the registry fetched by get_ontologies, so that the prepare jobs
+    # receive the prefixes with the config instead of fetching the registry again, and
+    # passed to ROBOT as one file instead of a --prefix argument per ontology
+    count = write_prefixes_context(config.get_robot_additional_prefixes(), ROBOT_PREFIXES_FILE)
+    logging.info(f"Saved {count} ROBOT prefixes to {ROBOT_PREFIXES_FILE}")
+
+    validators = DownloadValidators(os.path.join(ontology_dir, "download-validators.json"))
+    # Shared by the download threads, so that an import is fetched once for all ontologies importing it
+    import_cache = ImportCache(config.get_import_cache_dir()) if config.is_import_cache() else None
+    order = order_ontologies(ontologies, ontology_dir, dashboard_dir, config,
+                             history.last_durations() if history else {})
+    robot_version = robot_version_key(config)
+
+    def download_one(o):
+        if stop.is_set():
+            return
+        downloaded = download_ontology(o, ontologies[o], ontology_dir, dashboard_dir, config, validators=validators,
+                                       import_cache=import_cache)
+        started = time.monotonic()
+        download_queue.put((o, downloaded))
+        logging.info(f"Download stage: handed over {o} after waiting {time.monotonic() - started:.1f}s "
+                     f"for the prepare stage (queue depth {download_queue.qsize()})")
+
+    def download_stage():
         try:
-            if ont_results['metrics']['Axioms: Number of axioms'] < 1:
-                logging.exception(f'Ontology has lass than one axiom: {o}')
-                ont_results['failure'] = 'empty_ontology'
-                create_dashboard_qc_badge("red", "Empty ontology", ont_dashboard_dir)
-                create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-                save_yaml(ont_results, ont_results_path)
-                continue
+            with ThreadPoolExecutor(max_workers=download_jobs) as executor:
+                futures = [executor.submit(download_one, o) for o in order]
+                for future in futures:
+                    if stop.is_set():
+                        for pending in futures:
+                            pending.cancel()
+                        break
+                    future.result()
+        except Exception as e:
+            logging.exception("Download stage failed")
+            download_errors.append(e)
+        finally:
+            download_queue.put(None)
+
+    downloader = threading.Thread(target=download_stage, name="download-stage", daemon=True)
+    downloader.start()
 
-            if not ont_results['metrics']['Info: Logical consistency']:
-                logging.exception(f'Ontology is inconsistent: {o}')
-                ont_results['failure'] = 'inconsistent_ontology'
-                save_yaml(ont_results, ont_results_path)
-                create_dashboard_qc_badge("red", "Inconsistent ontology", ont_dashboard_dir)
-                create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
+    # Prepare stage: consume downloaded ontologies in the order they arrive
+    prepared = {}
+    processed = []
+
+    def downloaded_jobs():
+        while True:
+            started = time.monotonic()
+            item = download_queue.get()
+            if item is None:
+                downloads_done.set()
+                return
+            o, downloaded = item
+            logging.info(f"Prepare stage: received {o} after waiting {time.monotonic() - started:.1f}s "
+                         f"for the download stage (queue depth {download_queue.qsize()})")
+            if downloaded is None or downloaded['skip']:
+                prepared[o] = downloaded['results'] if downloaded else None
+                if downloaded is None:
+                    # Failed in the download stage
+                    processed.append(o)
                 continue
-        except Exception:
-            logging.exception(f'Metrics based checks failed for {o}: {ont_metrics_path}')
-            ont_results['failure'] = 'metrics_check_failed'
-            save_yaml(ont_results, ont_results_path)
-            create_dashboard_qc_badge("red", "Processing error: failed metrics", ont_dashboard_dir)
-            create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
-            continue
+            # Memory estimates only matter if several jobs compete for the memory budget
+            memory_mb = estimate_ontology_memory_mb(o, ontology_dir, dashboard_dir, config) if jobs > 1 else 0
+            heap_mb = None
+            if memory_mb and memory_budget_mb:
+                heap_mb = memory_mb = -(-memory_mb // HEAP_STEP_MB) * HEAP_STEP_MB
+            processed.append(o)
+            yield Job(o, memory_mb, prepare_ontology,
+                      (o, ontologies[o], ontology_dir, dashboard_dir, config, downloaded, robot_version, heap_mb))
+
+    scheduler = MemoryScheduler(jobs, memory_budget_mb)
+    try:
+        # This only returns once every job has finished.
+        prepared.update(scheduler.run(downloaded_jobs()))
+    except BaseException:
+        stop.set()
+        # Unblock the download threads waiting to hand over an ontology, until the download stage ended
+        if not downloads_done.is_set():
+            while download_queue.get() is not None:
+                pass
+        downloader.join()
+        raise
+    downloader.join()
+    if download_errors:
+        raise download_errors[0]
+    return prepared, processed
 
-        logging.info(f"{o}: preprocessing successful.")
-        ontologies_results[o] = ont_results
 
-    # This has to be done after all ontologies are analysed, because we need their usage information to quantify impact.
+def compute_ontology_use(ontologies_results):
+    """
+    Compute which ontologies use each ontology, from the namespaces used in their axioms.
 
+    Returns:
+        The ids of the ontologies using each ontology, and the ontology of each base prefix.
+    """
     logging.info(f"Computing cross-OBO usage metrics...")
     ontology_use = {}
     ontology_base_prefixes = {}
@@ -388,16 +892,38 @@ def prepare_ontologies(ontologies, ontology_dir, dashboard_dir, make_parameters,
                     if ont_used_prefix not in ontology_use:
                         ontology_use[ont_used_prefix] = []
                     ontology_use[ont_used_prefix].append(o)
+    return ontology_use, ontology_base_prefixes
+
 
-    logging.info(f"Build dashboard dependencies")
-    runcmd(f"make  {make_parameters} dependencies/ontologies.yml dependencies/registry_schema.json build/ro-properties.csv profile.txt dashboard-config.yml", config.get_dashboard_report_timeout_seconds())
+def score_ontologies(ontologies, ontologies_results, fused_checks, domain_map, dashboard_dir, config):
+    """
+    Compute the usage metrics and OBO score inputs of every prepared ontology. This has to be
+    done after all ontologies are prepared, because their usage by all others quantifies
+    their impact. domain_map is the map of all ontologies of the registry to their domains
+    used by the checks, which is part of the inputs of their results.
+
+    Returns:
+        The ids of the ontologies whose checks and pages have to be (re)built.
+    """
+    ontology_use, ontology_base_prefixes = compute_ontology_use(ontologies_results)
 
     logging.info(f"Computing obo score and generating individual dashboard files...")
+    robot_jar = os.environ.get('ROBOT_JAR', 'build/robot.jar')
+    dashboard_builds = []
     for o in ontologies_results:
         ont_dashboard_dir = os.path.join(dashboard_dir, o)
         ont_results_path = os.path.join(ont_dashboard_dir, "dashboard.yml")
         ont_results = ontologies_results[o]
 
+        # Check again if anything the checks depend on (profile, registry entry, check code, ROBOT) changed
+        prepare_key = ont_results.get('artifact_keys', {}).get('prepare')
+        if prepare_key and o not in fused_checks:
+            key = checks_key(prepare_key, ontologies[o], domain_map, robot_jar)
+            if ont_results['artifact_keys'].get('checks') != key:
+                logging.info(f"The inputs of the checks of {o} changed since last run.")
+                ont_results['artifact_keys']['checks'] = key
+                ont_results['changed'] = True
+
         if not ont_results.get("changed") and config.is_skip_existing():
             logging.info("Skipping %s because it has not changed since last run.", o)
             continue
@@ -456,9 +982,7 @@ def prepare_ontologies(ontologies, ontology_dir, dashboard_dir, make_parameters,
                     else:
                         ont_results['metrics']['Info: Experimental OBO score'] = dashboard_score
                     save_yaml(ont_results, ont_results_path)
-                    runcmd(f"make  {make_parameters} {dashboard_html}", config.get_dashboard_report_timeout_seconds())
-                    ont_results.pop('last_ontology_dashboard_run_failed', None)
-
+                    dashboard_builds.append(o)
                 except Exception:
                     logging.exception(f'Failed to build dashboard pages for {o}.')
                     ont_results['failure'] = 'failed_ontology_dashboard'
@@ -475,6 +999,97 @@ def prepare_ontologies(ontologies, ontology_dir, dashboard_dir, make_parameters,
                          f"or a failure registered ({'failure' not in ont_results})). "
                          f"This suggests there was an error with the basefile computation, so we"
                          f"dont even try to generate the dashboard.")
+    return dashboard_builds
+
+
+def check_ontologies(dashboard_builds, ontologies, ontologies_results, fused_checks, ontology_dir, dashboard_dir,
+                     make_parameters, config, jobs=1):
+    """
+    Checks stage: save the results of the checks run by the fused pipeline, and run the checks
+    of all other ontologies in one batch through a pool of warm ROBOT gateways. Ontologies
+    whose checks did not complete are checked again when building their pages.
+    """
+    for o in dashboard_builds:
+        if o in fused_checks and fused_checks[o] is not None:
+            ont_dashboard_dir = os.path.join(dashboard_dir, o)
+            try:
+                save_dashboard_results(ontologies_results[o], fused_checks[o], config, ont_dashboard_dir)
+            except Exception:
+                logging.exception(f"Failed to save the dashboard results of {o}, checking it again.")
+                del fused_checks[o]
+
+    batch_builds = [o for o in dashboard_builds if o not in fused_checks]
+    if batch_builds:
+        if not config.is_fused_pipeline():
+            # The fused pipeline already did this before the prepare stage
+            prefetch_link_checks({o: ontologies[o] for o in batch_builds}, ontology_dir, config)
+        # Run the checks of all ontologies through a pool of warm ROBOT gateways first, one per job.
+        # Ontologies whose checks did not complete in the batch are checked again when
+        # building their pages.
+        logging.info(f"Running dashboard checks for {len(batch_builds)} ontologies...")
+        batch_path = os.path.join("build", "dashboard-batch.tsv")
+        with open(batch_path, 'w') as f:
+            for o in batch_builds:
+                ont_base_path = os.path.join(ontology_dir, f"{o}.owl")
+                ont_metrics_path = os.path.join(ontology_dir, f"{o}-metrics.yml")
+                f.write(f"{ont_base_path}\t{ont_metrics_path}\t{os.path.join(dashboard_dir, o)}/\n")
+        # The batch runs one JVM per job, which share the memory budget
+        memory_budget_mb = config.get_memory_budget_mb()
+        heap_mb = memory_budget_mb // jobs if memory_budget_mb and jobs > 1 else 0
+        try:
+            runcmd(f"make {make_parameters} dashboard_batch BATCH={batch_path} DASHBOARD_WORKERS={jobs} "
+                   f"DASHBOARD_HEAP_MB={heap_mb}",
+                   config.get_dashboard_report_timeout_seconds() * len(batch_builds),
+                   log_file=os.path.join("build", "logs", "dashboard-batch.log"))
+        except Exception:
+            logging.exception("Failed to run the dashboard checks in batch, falling back to one run per ontology.")
+
+
+def build_ontology_pages(dashboard_builds, ontologies_results, fused_checks, ontology_dir, dashboard_dir, config,
+                         jobs=1):
+    """
+    Pages stage: build the pages of all ontologies in one build graph, only rebuilding pages
+    whose inputs changed, and restoring those built from the same inputs before from the cache.
+    Ontologies whose pages failed are recorded as failed_ontology_dashboard.
+    """
+    cache = ArtifactCache(config.get_artifact_cache_dir())
+    graph = new_build_graph()
+    graph_builds = {}
+    for o in dashboard_builds:
+        ont_dashboard_dir = os.path.join(dashboard_dir, o)
+        checked = o in fused_checks
+        if checked or not checks_out_of_date(ontology_dir, ont_dashboard_dir):
+            if cache.restore('html', html_key(ont_dashboard_dir), output_files(HTML_FILES, ont_dashboard_dir)) is not None:
+                ontologies_results[o].pop('last_ontology_dashboard_run_failed', None)
+                continue
+        for node in add_ontology_pages(graph, o, ontology_dir, ont_dashboard_dir,
+                                       config.get_dashboard_report_timeout_seconds(), checked):
+            graph_builds[id(node)] = o
+    logging.info(f"Building the dashboard pages of {len(set(graph_builds.values()))} ontologies...")
+    failed_builds = {graph_builds[id(node)] for node in graph.run(max_workers=jobs) if id(node) in graph_builds}
+
+    for o in set(graph_builds.values()):
+        ont_dashboard_dir = os.path.join(dashboard_dir, o)
+        ont_results_path = os.path.join(ont_dashboard_dir, "dashboard.yml")
+        ont_results = ontologies_results[o]
+        if o not in failed_builds:
+            cache.store('html', html_key(ont_dashboard_dir), output_files(HTML_FILES, ont_dashboard_dir))
+            ont_results.pop('last_ontology_dashboard_run_failed', None)
+            # The checks may have run in another process, so add the timings of the pages to the saved results
+            html_files = output_files(HTML_FILES, ont_dashboard_dir)
+            page_timings = {f"html_{os.path.splitext(name)[0]}": graph.timings[path]
+                            for name, path in html_files.items() if path in graph.timings}
+            if page_timings:
+                saved_results = load_yaml(ont_results_path)
+                saved_results.setdefault('timings', {}).update(page_timings)
+                save_yaml(saved_results, ont_results_path)
+        else:
+            logging.error(f'Failed to build dashboard pages for {o}.')
+            ont_results['failure'] = 'failed_ontology_dashboard'
+            ont_results['last_ontology_dashboard_run_failed'] = True
+            save_yaml(ont_results, ont_results_path)
+            create_dashboard_qc_badge("red", "Processing error: build dashboard", ont_dashboard_dir)
+            create_dashboard_score_badge("lightgrey", "NA", ont_dashboard_dir)
 
 
 if __name__ == '__main__':
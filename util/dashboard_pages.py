@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import itertools
+import logging
+import os
+import subprocess
+import sys
+
+import md_to_html
+from build_graph import BuildGraph
+from create_dashboard_html import create_dashboard_html
+from create_ontology_html import create_ontology_html
+from create_report_html import create_report_html
+from http_client import get_http_client
+from lib import runcmd
+
+UTIL_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join('util', 'templates')
+
+# Number of lines of the ROBOT report shown on its page, and kept in the report (see truncate_reports)
+REPORT_LENGTH_LIMIT = 200
+OBO_CONTEXT = 'dependencies/obo_context.jsonld'
+OBO_CONTEXT_URL = 'https://raw.githubusercontent.com/OBOFoundry/OBOFoundry.github.io/master/registry/obo_context.jsonld'
+REGISTRY = 'dependencies/ontologies.yml'
+DASHBOARD_CONFIG = 'dashboard-config.yml'
+DASHBOARD_RESULTS = 'dashboard/dashboard-results.yml'
+BUILD_STATE = 'build/build-state.json'
+
+# Icons from open iconic, included in the dashboard
+SVG_URL = 'https://raw.githubusercontent.com/iconic/open-iconic/master/svg/{0}.svg'
+SVGS = [f'dashboard/assets/{name}.svg' for name in ['check', 'info', 'warning', 'x']]
+
+# Report pages of an ontology: report file, page title and number of report lines on the page
+REPORT_PAGES = {'robot_report.html': ('robot_report.tsv', 'ROBOT Report', REPORT_LENGTH_LIMIT),
+                'fp3.html': ('fp3.tsv', 'IRI Report', 50),
+                'fp7.html': ('fp7.tsv', 'Relations Report', 50)}
+
+
+def new_build_graph():
+    """Return an empty build graph of the dashboard, with the steps downloading the icons and
+    the OBO JSON-LD context used by the report pages."""
+    graph = BuildGraph(BUILD_STATE)
+    for svg in SVGS:
+        graph.add([svg], [], download_svg, (svg,))
+    graph.add([OBO_CONTEXT], [], download_obo_context, ())
+    return graph
+
+
+def download_svg(svg):
+    """Download an icon from open iconic."""
+    name = os.path.splitext(os.path.basename(svg))[0]
+    response = get_http_client().get(SVG_URL.format(name))
+    response.raise_for_status()
+    with open(svg, 'wb') as f:
+        f.write(response.content)
+
+
+def download_obo_context():
+    """Download the OBO JSON-LD context, which maps the prefixes on the report pages to IRIs."""
+    response = get_http_client().get(OBO_CONTEXT_URL)
+    response.raise_for_status()
+    os.makedirs(os.path.dirname(OBO_CONTEXT), exist_ok=True)
+    with open(OBO_CONTEXT, 'wb') as f:
+        f.write(response.content)
+
+
+def checks_out_of_date(ontology_dir, ont_dashboard_dir):
+    """Return True if the dashboard checks of an ontology have to run again.
+
+    Like make, the checks are out of date if one of their results is missing, or
+    older than the ontology, its metrics or the dashboard script.
+    """
+    o = os.path.basename(os.path.normpath(ont_dashboard_dir))
+    sources = [os.path.join(UTIL_DIR, 'dashboard', 'dashboard.py'),
+               os.path.join(ontology_dir, f"{o}.owl"),
+               os.path.join(ontology_dir, f"{o}-metrics.yml")]
+    results = [os.path.join(ont_dashboard_dir, name) for name in ['dashboard.yml', 'robot_report.tsv', 'fp3.tsv', 'fp7.tsv']]
+    if not all(os.path.exists(path) for path in results):
+        return True
+    newest_source = max(os.path.getmtime(path) for path in sources if os.path.exists(path))
+    return any(os.path.getmtime(path) < newest_source for path in results)
+
+
+def run_checks(o, ontology_dir, ont_dashboard_dir, timeout):
+    """Run the dashboard checks of a single ontology in a new dashboard.py process."""
+    robot_jar = os.environ.get('ROBOT_JAR', 'build/robot.jar')
+    runcmd(f"python3 util/dashboard/dashboard.py {os.path.join(ontology_dir, o)}.owl "
+           f"{os.path.join(ontology_dir, o)}-metrics.yml {REGISTRY} dependencies/registry_schema.json "
+           f"build/ro-properties.csv profile.txt {DASHBOARD_CONFIG} {ont_dashboard_dir}/ {robot_jar}", timeout,
+           log_file=os.path.join(ont_dashboard_dir, 'logs', 'dashboard.log'))
+
+
+def add_ontology_pages(graph, o, ontology_dir, ont_dashboard_dir, timeout, checked=False):
+    """Add the steps building the dashboard pages of an ontology to a build graph.
+
+    Args:
+        graph (BuildGraph): the build graph
+        o (str): ontology id
+        ontology_dir (str): directory of the base files and metrics
+        ont_dashboard_dir (str): output directory of the ontology
+        timeout (int): timeout of the dashboard checks, in seconds
+        checked (bool): the checks already ran, e.g. in the fused pipeline
+
+    Return:
+        the nodes of the ontology
+    """
+    def path(name):
+        return os.path.join(ont_dashboard_dir, name)
+
+    nodes = []
+    if not checked:
+        # Fallback for ontologies whose checks did not complete in the dashboard batch
+        nodes.append(graph.add([path('dashboard.yml'), path('robot_report.tsv'), path('fp3.tsv'), path('fp7.tsv')], [],
+                               run_checks, (o, ontology_dir, ont_dashboard_dir, timeout),
+                               is_stale=lambda: checks_out_of_date(ontology_dir, ont_dashboard_dir)))
+
+    report_template = os.path.join(TEMPLATES_DIR, 'report.html.jinja2')
+    for page, (report, title, limitlines) in REPORT_PAGES.items():
+        nodes.append(graph.add([path(page)],
+                               ['util/create_report_html.py', path(report), OBO_CONTEXT, report_template],
+                               create_report_html,
+                               (path(report), OBO_CONTEXT, report_template, f"{title} - {o}", path(page), limitlines)))
+
+    ontology_template = os.path.join(TEMPLATES_DIR, 'ontology.html.jinja2')
+    nodes.append(graph.add([path('dashboard.html')],
+                           ['util/create_ontology_html.py', path('dashboard.yml'), ontology_template] +
+                           [path(page) for page in REPORT_PAGES] + SVGS,
+                           create_ontology_html,
+                           (path('dashboard.yml'), ontology_template, path('dashboard.html'))))
+    return nodes
+
+
+def get_robot_version():
+    """Return the version of the ROBOT jar, or an empty string if it cannot be run."""
+    robot_jar = os.environ.get('ROBOT_JAR', 'build/robot.jar')
+    try:
+        return subprocess.run(['java', '-jar', robot_jar, '--version'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        logging.warning(f"Unable to determine the version of {robot_jar}")
+        return ""
+
+
+def get_obomd_version():
+    """Return the URL of the latest commit of the OBO Dashboard, or an empty string if it cannot be found."""
+    try:
+        response = get_http_client().get('https://api.github.com/repos/OBOFoundry/OBO-Dashboard/commits')
+        response.raise_for_status()
+        return response.json()[0]['html_url']
+    except Exception:
+        logging.warning("Unable to determine the latest commit of the OBO Dashboard")
+        return ""
+
+
+def create_index_html(dashboard_dir, index):
+    """Build the index page and the results of all ontologies. The versions of ROBOT and of the
+    OBO Dashboard shown on the page are only looked up when it is built."""
+    create_dashboard_html(dashboard_dir, REGISTRY, DASHBOARD_CONFIG, DASHBOARD_RESULTS, get_robot_version(),
+                          get_obomd_version(), index)
+
+
+def add_dashboard_pages(graph, dashboard_dir):
+    """Add the steps building the index, about and analysis pages of the dashboard to a build graph.
+
+    Args:
+        graph (BuildGraph): the build graph
+        dashboard_dir (str): directory of the dashboard
+    """
+    index = os.path.join(dashboard_dir, 'index.html')
+    index_template = os.path.join(TEMPLATES_DIR, 'index.html.jinja2')
+    dashboard_ymls = sorted(os.path.join(dashboard_dir, o, 'dashboard.yml') for o in os.listdir(dashboard_dir)
+                            if os.path.isfile(os.path.join(dashboard_dir, o, 'dashboard.yml')))
+    graph.add([index, DASHBOARD_RESULTS, DASHBOARD_RESULTS.replace('.yml', '.json')],
+              ['util/create_dashboard_html.py', REGISTRY, index_template, DASHBOARD_CONFIG] + SVGS + dashboard_ymls,
+              create_index_html, (dashboard_dir, index))
+
+    about = os.path.join(dashboard_dir, 'about.html')
+    about_args = ['docs/about.md', '-t', os.path.join(TEMPLATES_DIR, 'about.html.jinja2'), '-o', about]
+    graph.add([about], ['util/md_to_html.py', 'docs/about.md', os.path.join(TEMPLATES_DIR, 'about.html.jinja2')],
+              md_to_html.main, (about_args,))
+
+    # Imported here, as plotly, networkx and pandas are only needed for this page
+    from dashboard_analysis_html import create_analysis_html
+    analysis_template = os.path.join(TEMPLATES_DIR, 'analysis.html.jinja2')
+    analysis = os.path.join(dashboard_dir, 'analysis.html')
+    graph.add([analysis], ['util/dashboard_analysis_html.py', DASHBOARD_RESULTS, analysis_template],
+              create_analysis_html, (DASHBOARD_RESULTS, analysis_template, analysis))
+
+
+def truncate_reports(dashboard_dir):
+    """Truncate the potentially huge ROBOT reports of all ontologies to the lines shown on their page."""
+    for o in sorted(os.listdir(dashboard_dir)):
+        report = os.path.join(dashboard_dir, o, 'robot_report.tsv')
+        if not os.path.isfile(report):
+            continue
+        with open(report, 'r') as f:
+            lines = list(itertools.islice(f, REPORT_LENGTH_LIMIT))
+        with open(f"{report}.tmp", 'w') as f:
+            f.writelines(lines)
+        os.replace(f"{report}.tmp", report)
+
+
+def build_dashboard(dashboard_dir, force=False):
+    """Build the index, about and analysis pages of the dashboard, and the icons they use.
+
+    Return:
+        list of the failed build steps
+    """
+    graph = new_build_graph()
+    add_dashboard_pages(graph, dashboard_dir)
+    return graph.run(force=force)
+
+
+if __name__ == '__main__':
+    failed = build_dashboard(sys.argv[1] if len(sys.argv) > 1 else 'dashboard')
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+
+class CircuitOpenError(RequestException):
+    """Raised instead of sending a request to a host that failed repeatedly, until its cooldown is over."""
+
+
+class _Host:
+    def __init__(self, name, max_connections):
+        self.name = name
+        self.slots = threading.BoundedSemaphore(max_connections)
+        self.failures = 0
+        self.open_until = None
+
+
+class HttpClient:
+    """HTTP client shared by all outbound requests of the dashboard.
+
+    Requests go through one pooled session, with default (connect, read) timeouts, and at
+    most max_per_host requests (or the limit of the host in hosts) run against a host at
+    the same time; the others wait for a free slot. A streamed response (see stream) holds
+    its slot until the block reading it is left.
+
+    Each host has a circuit breaker: after failure_threshold consecutive failures
+    (connection errors, timeouts or 5xx responses), requests to the host fail at once with
+    CircuitOpenError for cooldown_seconds. After that, a single request is let through:
+    if it succeeds the host is used normally again, otherwise it stays blocked for another
+    cooldown. CircuitOpenError is a RequestException, so callers retry or give up on it
+    like on any other connection error.
+
+    >>> client = HttpClient(failure_threshold=2, cooldown_seconds=60)
+    >>> host = client._host('http://purl.obolibrary.org/obo/uberon.owl')
+    >>> client._failed(host); client._failed(host)
+    >>> client.get('http://purl.obolibrary.org/obo/uberon.owl')
+    Traceback (most recent call last):
+    ...
+    http_client.CircuitOpenError: purl.obolibrary.org failed 2 times in a row, not sending requests for ...
+    """
+
+    def __init__(self, max_per_host=8, hosts=None, connect_timeout=10, read_timeout=60, failure_threshold=5,
+                 cooldown_seconds=60):
+        """
+        Args:
+            max_per_host (int): maximum number of concurrent requests to a host
+            hosts (dict): maximum number of concurrent requests, by host, overriding max_per_host
+            connect_timeout (float): default timeout to connect to a host, in seconds
+            read_timeout (float): default timeout between two bytes of a response, in seconds
+            failure_threshold (int): number of consecutive failures after which a host is blocked
+            cooldown_seconds (float): time for which a host is blocked
+        """
+        self.max_per_host = max_per_host
+        self.host_limits = hosts or {}
+        self.timeout = (connect_timeout, read_timeout)
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        pool_size = max([max_per_host] + list(self.host_limits.values()))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """Send a request, like requests.Session.request, within the limits of the host of url.
+        The response is read completely, streamed responses are read within stream."""
+        if kwargs.get('stream'):
+            raise ValueError("Streamed responses have to be read within HttpClient.stream")
+        with self._slot(url) as host:
+            return self._send(host, method, url, **kwargs)
+
+    @contextmanager
+    def stream(self, url, method='GET', **kwargs):
+        """Send a request with a streamed response, like requests.Session.request with stream=True,
+        within the limits of the host of url. The response holds its slot until the block is left,
+        and is then closed."""
+        with self._slot(url) as host:
+            response = self._send(host, method, url, stream=True, **kwargs)
+            try:
+                yield response
+            finally:
+                response.close()
+
+    @contextmanager
+    def _slot(self, url):
+        host = self._host(url)
+        self._check_circuit(host)
+        host.slots.acquire()
+        try:
+            yield host
+        finally:
+            host.slots.release()
+
+    def _send(self, host, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except RequestException:
+            self._failed(host)
+            raise
+        if response.status_code >= 500:
+            self._failed(host)
+        else:
+            self._succeeded(host)
+        return response
+
+    def _host(self, url):
+        name = urlsplit(url).netloc.lower()
+        with self.lock:
+            if name not in self.hosts:
+                self.hosts[name] = _Host(name, self.host_limits.get(name, self.max_per_host))
+            return self.hosts[name]
+
+    def _check_circuit(self, host):
+        with self.lock:
+            if host.open_until is None:
+                return
+            now = time.monotonic()
+            if now < host.open_until:
+                raise CircuitOpenError(f"{host.name} failed {host.failures} times in a row, not sending requests "
+                                       f"for {round(host.open_until - now)}s")
+            # Let this request through to probe the host, and block the others until it is known to work again
+            host.open_until = now + self.cooldown_seconds
+
+    def _failed(self, host):
+        with self.lock:
+            host.failures += 1
+            if host.failures >= self.failure_threshold:
+                if host.open_until is None:
+                    logging.warning(f"{host.name} failed {host.failures} times in a row, not sending requests "
+                                    f"for {self.cooldown_seconds}s")
+                host.open_until = time.monotonic() + self.cooldown_seconds
+
+    def _succeeded(self, host):
+        with self.lock:
+            if host.open_until is not None:
+                logging.info(f"{host.name} is responding again")
+            host.failures = 0
+            host.open_until = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Return the HTTP client of this process, with the default settings unless set_http_client was called."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def set_http_client(client):
+    """Use client for all outbound requests of this process."""
+    global _client
+    with _client_lock:
+        _client = client
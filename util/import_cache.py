@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+from lib import NOT_MODIFIED, DownloadValidators, download_file
+
+# owl:imports in RDF/XML (also with an entity, e.g. &obo;ro.owl), Turtle, OWL functional syntax and OBO
+IMPORT_PATTERNS = [re.compile(r'imports\s+rdf:resource="([^"]+)"'),
+                   re.compile(r'owl:imports\s+<([^>]+)>'),
+                   re.compile(r'^\s*Import\(<([^>]+)>\)'),
+                   re.compile(r'^import:\s*(\S+)')]
+ENTITY_PATTERN = re.compile(r'<!ENTITY\s+(\S+)\s+"([^"]+)"')
+# The header of the ontology, where the imports are declared, ends at the first of these
+HEADER_END = ['</owl:Ontology>', '[Term]', '[Typedef]', '<owl:Class', 'Declaration(']
+HEADER_MAX_LINES = 5000
+
+
+def read_imports(path):
+    """Return the IRIs imported by an ontology file, read from its header.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile('w', suffix='.owl', delete=False) as f:
+    ...     _ = f.write('<!DOCTYPE rdf:RDF [\\n<!ENTITY obo "http://purl.obolibrary.org/obo/" >\\n]>\\n'
+    ...                 '<owl:Ontology rdf:about="http://purl.obolibrary.org/obo/go.owl">\\n'
+    ...                 '<owl:imports rdf:resource="&obo;ro.owl"/>\\n'
+    ...                 '<owl:imports rdf:resource="http://purl.obolibrary.org/obo/bfo.owl"/>\\n'
+    ...                 '</owl:Ontology>\\n<owl:imports rdf:resource="http://example.org/not-a-header.owl"/>\\n')
+    >>> read_imports(f.name)
+    ['http://purl.obolibrary.org/obo/ro.owl', 'http://purl.obolibrary.org/obo/bfo.owl']
+    >>> os.remove(f.name)
+    """
+    imports = []
+    entities = {}
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for i, line in enumerate(f):
+            if i >= HEADER_MAX_LINES or any(end in line for end in HEADER_END):
+                break
+            for name, value in ENTITY_PATTERN.findall(line):
+                entities[name] = value
+            for pattern in IMPORT_PATTERNS:
+                for iri in pattern.findall(line):
+                    for name, value in entities.items():
+                        iri = iri.replace(f'&{name};', value)
+                    if iri not in imports:
+                        imports.append(iri)
+    return imports
+
+
+class ImportCache:
+    """Local copies of imported ontologies, so that ROBOT reads them from disk through an
+    XML catalog instead of downloading them again for every ontology that imports them.
+
+    Every imported IRI is fetched at most once per instance (i.e. per run), and copies
+    from earlier runs are revalidated with a conditional GET. Imports of imports are
+    resolved as well. Safe to share between download threads.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Args:
+            cache_dir (str): directory of the copies, kept across runs
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.validators = DownloadValidators(os.path.join(cache_dir, 'download-validators.json'))
+        self.lock = threading.Lock()
+        self.iri_locks = {}
+        self.resolved = {}
+
+    def _path(self, iri):
+        name = os.path.basename(iri.rstrip('/')) or 'ontology.owl'
+        return os.path.join(self.cache_dir, f"{hashlib.sha256(iri.encode('utf-8')).hexdigest()[:16]}-{name}")
+
+    def fetch(self, iri):
+        """Return the local copy of an imported ontology, or None if it cannot be downloaded."""
+        with self.lock:
+            iri_lock = self.iri_locks.setdefault(iri, threading.Lock())
+        with iri_lock:
+            if iri not in self.resolved:
+                path = self._path(iri)
+                downloaded = download_file(iri, path, retries=3, validators=self.validators)
+                ok = downloaded is True or downloaded == NOT_MODIFIED
+                self.resolved[iri] = path if ok and os.path.isfile(path) else None
+                if self.resolved[iri] is None:
+                    logging.warning(f"Unable to fetch the import {iri}, ROBOT will try to load it itself")
+            return self.resolved[iri]
+
+    def write_catalog(self, ontology_file, catalog_file):
+        """Fetch the import closure of an ontology and write an XML catalog mapping every
+        imported IRI to its local copy.
+
+        Return:
+            the number of imports in the catalog
+        """
+        mapping = {}
+        todo = read_imports(ontology_file)
+        while todo:
+            iri = todo.pop(0)
+            if iri in mapping:
+                continue
+            mapping[iri] = self.fetch(iri)
+            if mapping[iri] is not None:
+                todo.extend(read_imports(mapping[iri]))
+        entries = [f'    <uri name={quoteattr(iri)} uri={quoteattr(Path(path).resolve().as_uri())}/>'
+                   for iri, path in mapping.items() if path is not None]
+        tmp_path = f"{catalog_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+                    '<catalog prefer="public" xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">\n')
+            f.write(''.join(f'{entry}\n' for entry in entries))
+            f.write('</catalog>\n')
+        os.replace(tmp_path, catalog_file)
+        return len(entries)
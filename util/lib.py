@@ -1,71 +1,383 @@
 #!/usr/bin/env python3
 
+import copy
 import hashlib
 import json
 import logging
+import logging.handlers
+import os
+import random
+import re
+import signal
 import subprocess
 import threading
+import time
 import urllib.request
-from datetime import datetime
-from subprocess import check_call
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
-import requests
-import yaml
-from requests.exceptions import (ChunkedEncodingError, HTTPError,
-                                 RequestException)
+import serialization
+from http_client import get_http_client
+from requests.exceptions import HTTPError, RequestException
+from timings import record_command_usage
 
 obo_purl = "http://purl.obolibrary.org/obo/"
 
+# Resources used by a finished command: elapsed (wall-clock) time, CPU time (user and system)
+# and peak resident memory of the process and all of its descendants that it waited for, and
+# the processes that were killed when it timed out (pid, command line and resident memory).
+CommandResult = namedtuple('CommandResult', ['cmd', 'returncode', 'elapsed_s', 'cpu_s', 'peak_rss_mb', 'killed'],
+                           defaults=[()])
+
+# Cache of the url_exists checks of this process, see set_url_cache
+_url_cache = None
+
+# Valid prefixes and namespaces of a prefix file (see write_prefixes_context)
+PREFIX_NAME = re.compile(r'^[A-Za-z_][\w.\-]*$')
+ABSOLUTE_IRI = re.compile(r'^[A-Za-z][A-Za-z0-9+.\-]*:[^\s<>"{}|\\^`]+$')
+
+# Every command run through runcmd or robot_prepare_ontology is recorded here, if the build directory exists
+COMMAND_LOG = os.path.join('build', 'commands.jsonl')
+_command_log_lock = threading.Lock()
+
+# Output of commands is streamed line by line into rotating log files of this size
+COMMAND_OUTPUT_MAX_BYTES = 10 * 1024 * 1024
+COMMAND_OUTPUT_BACKUPS = 2
+# Number of last lines of each output stream kept in memory for error reporting
+COMMAND_OUTPUT_TAIL_LINES = 20
+# Longer lines are split, so that memory use does not depend on the output
+COMMAND_OUTPUT_MAX_LINE = 64 * 1024
+# Time the processes of a timed out command get to exit after SIGTERM, before they are killed
+COMMAND_KILL_GRACE_SECONDS = 10
+
+
 class Command(object):
-    def __init__(self, cmd):
+    """A command run in its own process group, with its output streamed to a log.
+
+    When the command times out, its whole process group is terminated, and the
+    killed processes are reported in the result.
+
+    >>> command = Command('sleep 30 & sleep 30')
+    >>> command.run(timeout=1)
+    Traceback (most recent call last):
+    ...
+    Exception: Failed: sleep 30 & sleep 30 with return code -15, timed out after 1s and killed ... processes...
+    >>> [member['cmdline'] for member in command.result.killed if member['cmdline'] == 'sleep 30']
+    ['sleep 30', 'sleep 30']
+    >>> process_group_members(command.process.pid)
+    {}
+    """
+
+    def __init__(self, cmd, log_file=None, env=None):
+        """
+        Args:
+            cmd (str or list): shell command line, or list of arguments
+            log_file (str): rotating log file the output is streamed to; if None,
+                the output is logged by the root logger
+            env (dict): environment of the command, that of this process if None
+        """
         self.cmd = cmd
+        self.log_file = log_file
+        self.env = env
         self.process = None
+        self.result = None
+        self.killed = []
+        self.tail = {'out': deque(maxlen=COMMAND_OUTPUT_TAIL_LINES),
+                     'err': deque(maxlen=COMMAND_OUTPUT_TAIL_LINES)}
+
+    def _output_logger(self):
+        logger = logging.Logger(f"command.{self.log_file}")
+        if self.log_file:
+            os.makedirs(os.path.dirname(self.log_file) or '.', exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(self.log_file, maxBytes=COMMAND_OUTPUT_MAX_BYTES,
+                                                           backupCount=COMMAND_OUTPUT_BACKUPS)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            logger.addHandler(handler)
+            logger.info(f"RUNNING: {self.cmd}")
+        else:
+            logger.parent = logging.getLogger()
+        return logger
+
+    def _stream(self, name, pipe, logger):
+        for line in iter(lambda: pipe.readline(COMMAND_OUTPUT_MAX_LINE), b''):
+            line = line.decode('utf-8', errors='replace').rstrip('\n')
+            self.tail[name].append(line)
+            logger.info(f"{name.upper()}: {line}")
 
     def run(self, timeout):
+        """Run the command (a shell command line, or a list of arguments) and wait for it to finish.
+
+        The child process is reaped with os.wait4, so that the resources it used are known
+        exactly, even if other commands run at the same time.
+
+        Returns:
+            CommandResult, also kept in self.result
+        """
         def target():
             logging.info(f"RUNNING: {self.cmd} (Timeout: {timeout})")
-            self.process = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-            (out, err) = self.process.communicate()
-            logging.info('OUT: {}'.format(out))
-            if err:
-                logging.info('ERROR: {}'.format(err))
+            # In a new session, the command and everything it starts (make, java) form a
+            # process group that can be terminated as a whole
+            self.process = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                            shell=isinstance(self.cmd, str), start_new_session=True,
+                                            env=self.env)
+            # Stream both pipes line by line without reaping the process, as communicate() would
+            logger = self._output_logger()
+            readers = [threading.Thread(target=self._stream, args=(name, pipe, logger), daemon=True)
+                       for name, pipe in [('out', self.process.stdout), ('err', self.process.stderr)]]
+            for reader in readers:
+                reader.start()
+            _, status, usage = os.wait4(self.process.pid, 0)
+            self.process.returncode = os.waitstatus_to_exitcode(status)
+            for reader in readers:
+                reader.join()
+            for handler in logger.handlers:
+                handler.close()
+            self.result = CommandResult(self.cmd, self.process.returncode, round(time.monotonic() - started, 3),
+                                        round(usage.ru_utime + usage.ru_stime, 3), round(usage.ru_maxrss / 1024, 1),
+                                        tuple(self.killed))
+            if self.log_file:
+                logging.info(f"Output of {self.cmd} saved to {self.log_file}")
+            else:
+                logging.info('OUT: {}'.format('\n'.join(self.tail['out'])))
+                if self.tail['err']:
+                    logging.info('ERROR: {}'.format('\n'.join(self.tail['err'])))
 
+        started = time.monotonic()
         thread = threading.Thread(target=target)
         thread.start()
 
         thread.join(timeout)
-        if thread.is_alive():
-            print('Terminating process')
-            self.process.terminate()
+        if thread.is_alive() and self.process is not None:
+            self._kill_group()
             thread.join()
+            if self.result is not None:
+                self.result = self.result._replace(killed=tuple(self.killed))
+        if self.process is None:
+            raise Exception(f'Failed to start: {self.cmd}')
+        if self.result is not None:
+            logging.info(f"Finished: {self.cmd} in {self.result.elapsed_s}s, using {self.result.cpu_s}s CPU time "
+                         f"and at most {self.result.peak_rss_mb} MB of memory")
+            record_command(self.result)
+            record_command_usage(self.result)
         if self.process.returncode != 0:
-            raise Exception(f'Failed: {self.cmd} with return code {self.process.returncode}')
-
-
-def runcmd(cmd, timeout=3600):
-    command = Command(cmd)
-    command.run(timeout=timeout)
+            details = f", see {self.log_file}" if self.log_file else ""
+            if self.killed:
+                details += f", timed out after {timeout}s and killed {len(self.killed)} processes"
+            raise Exception(f'Failed: {self.cmd} with return code {self.process.returncode}{details}. '
+                            f'Last lines of its error output:\n' + '\n'.join(self.tail['err']))
+        return self.result
+
+
+    def _kill_group(self):
+        """Terminate the process group of the command: SIGTERM first, then SIGKILL for the
+        processes still running after the grace period. Every killed process is reported with
+        the resident memory it held.
+        """
+        pgid = self.process.pid
+        members = process_group_members(pgid)
+        logging.warning(f"Timeout: terminating {self.cmd} (process group {pgid}, {len(members)} processes, "
+                        f"{round(sum(m['rss_mb'] for m in members.values()), 1)} MB)")
+        signals = [(signal.SIGTERM, COMMAND_KILL_GRACE_SECONDS), (signal.SIGKILL, COMMAND_KILL_GRACE_SECONDS)]
+        for sig, grace in signals:
+            try:
+                os.killpg(pgid, sig)
+            except ProcessLookupError:
+                break
+            deadline = time.monotonic() + grace
+            while process_group_members(pgid) and time.monotonic() < deadline:
+                time.sleep(0.1)
+            if not process_group_members(pgid):
+                break
+        remaining = process_group_members(pgid)
+        for pid, member in members.items():
+            if pid not in remaining:
+                self.killed.append(dict(pid=pid, **member))
+                logging.warning(f"Killed {pid} ({member['cmdline']}), freeing {member['rss_mb']} MB")
+        if remaining:
+            logging.error(f"Processes {', '.join(map(str, remaining))} of {self.cmd} are still running")
+        logging.warning(f"Freed {round(sum(m['rss_mb'] for m in self.killed), 1)} MB by killing "
+                        f"{len(self.killed)} processes of {self.cmd}")
+
+
+def process_group_members(pgid):
+    """Return the running processes of a process group, with their command line and resident memory in MB.
+
+    This reads /proc, so it returns nothing on systems without it.
+    """
+    members = {}
+    try:
+        pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return members
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", 'r') as f:
+                # The command name can contain spaces and parentheses, the fields after it can not
+                fields = f.read().rsplit(')', 1)[1].split()
+            # Zombies have already released their memory
+            if int(fields[2]) != pgid or fields[0] == 'Z':
+                continue
+            rss_kb = 0
+            with open(f"/proc/{pid}/status", 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss_kb = int(line.split()[1])
+            with open(f"/proc/{pid}/cmdline", 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode('utf-8', errors='replace').strip()
+        except (OSError, IndexError, ValueError):
+            continue
+        members[pid] = {'cmdline': cmdline[:200], 'rss_mb': round(rss_kb / 1024, 1)}
+    return members
+
+
+def record_command(result):
+    """Append the resources used by a command to the command log (see COMMAND_LOG)."""
+    if not os.path.isdir(os.path.dirname(COMMAND_LOG)):
+        return
+    entry = dict(result._asdict(), date=datetime.now().isoformat(timespec='seconds'))
+    with _command_log_lock, open(COMMAND_LOG, 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def runcmd(cmd, timeout=3600, log_file=None):
+    command = Command(cmd, log_file)
+    return command.run(timeout=timeout)
+
+
+def write_prefixes_context(prefixes, path):
+    """Write a prefix map to a JSON-LD context file, for ROBOT's --add-prefixes.
+
+    Entries whose prefix is not a valid name, or whose namespace is not an absolute IRI,
+    are left out with a warning. The file is only rewritten if the map changed, so that
+    it keeps its modification time between runs.
 
+    Args:
+        prefixes (dict): namespace IRI of every prefix
+        path (str): JSON-LD file
 
-def read_txt_from_url_as_lines(url):
-    profile_raw = urllib.request.urlopen(url).read()
-    profile_lines = profile_raw.decode('utf-8').split('\n')
-    return profile_lines
+    Return:
+        the number of prefixes in the file
+    """
+    context = {}
+    for prefix, iri in sorted(prefixes.items()):
+        if not PREFIX_NAME.match(str(prefix)) or not ABSOLUTE_IRI.match(str(iri)):
+            logging.warning(f"Ignoring invalid prefix {prefix}: {iri}")
+            continue
+        context[prefix] = iri
+    content = json.dumps({'@context': context}, indent=1) + "\n"
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return len(context)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", 'w') as f:
+        f.write(content)
+    os.replace(f"{path}.tmp", path)
+    return len(context)
+
+
+def fetch_url_cached(url, cache_dir):
+    """Return the contents of a URL, keeping a copy in cache_dir that is revalidated with a conditional GET.
+
+    The copy is used if the server answers 304 Not Modified, and, with a warning, if the
+    server cannot be reached. Other URLs than http(s), e.g. file:, are read directly.
 
+    Args:
+        url (str): URL of the document
+        cache_dir (str): directory of the copies, and of their ETag and Last-Modified headers
 
-def open_yaml_from_url(url):
-    raw = urllib.request.urlopen(url).read()
-    return yaml.load(raw, Loader=yaml.SafeLoader)
+    Return:
+        the contents of the document as bytes
+    """
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        return urllib.request.urlopen(url).read()
+    path = os.path.join(cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+    meta_path = f"{path}.json"
+    meta = {}
+    if os.path.isfile(path) and os.path.isfile(meta_path):
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        except ValueError:
+            logging.warning(f"Ignoring broken cache entry {meta_path}")
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    try:
+        response = get_http_client().get(url, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+    except RequestException:
+        if not meta:
+            raise
+        logging.warning(f"Unable to fetch {url}, using the copy fetched on {meta.get('fetched')}")
+        response = None
+    if response is None or response.status_code == 304:
+        logging.info(f"Using cached copy of {url}")
+        with open(path, 'rb') as f:
+            return f.read()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(response.content)
+    os.replace(f"{path}.tmp", path)
+    meta = {'url': url, 'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+            'fetched': datetime.now().isoformat(timespec='seconds')}
+    with open(f"{meta_path}.tmp", 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    return response.content
 
 
 class DashboardConfig:
+    """Configuration of the dashboard (dashboard-config.yml).
+
+    Remote documents (registries, profiles) are fetched and parsed at most once per
+    instance, and kept on disk in the remote directory of the artifact cache, where
+    they are revalidated with a conditional GET. The maps derived from them are
+    computed once too; every call returns a copy that the caller may change. The
+    memoised values are pickled with the config, so that worker processes receive them.
+    """
 
     def __init__(self, config_file):
-        self.config = yaml.load(open(config_file, 'r'), Loader=yaml.SafeLoader)
+        self.config_file = config_file
+        self.config = load_yaml(config_file)
         self.default_profile = "https://raw.githubusercontent.com/ontodev/robot/master/robot-core/src/main/resources" \
                                "/report_profile.txt "
         self.obo_registry = "https://raw.githubusercontent.com/OBOFoundry/OBOFoundry.github.io/master/registry/ontologies.yml"
+        self._memo = {}
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def _memoised(self, key, compute):
+        """Return a copy of the value of compute(), which is only called the first time for a key."""
+        with self._lock:
+            if key not in self._memo:
+                self._memo[key] = compute()
+            return copy.deepcopy(self._memo[key])
+
+    def _fetch(self, url):
+        return self._memoised(('url', url), lambda: fetch_url_cached(url, self.get_remote_cache_dir()))
+
+    def _open_yaml(self, url):
+        return self._memoised(('yaml', url), lambda: serialization.parse_yaml(self._fetch(url)))
+
+    def _read_lines(self, url):
+        return self._fetch(url).decode('utf-8').split('\n')
 
     def get_title(self):
         if "title" in self.config:
@@ -74,6 +386,9 @@ class DashboardConfig:
             return "OBO Dashboard"
 
     def get_oboscore_weights(self):
+        return self._memoised('oboscore_weights', self._get_oboscore_weights)
+
+    def _get_oboscore_weights(self):
         weights = dict()
         weights['no_base'] = 5
         weights['overall_error'] = 1
@@ -93,6 +408,9 @@ class DashboardConfig:
         return weights
 
     def get_oboscore_max_impact(self):
+        return self._memoised('oboscore_max_impact', self._get_oboscore_max_impact)
+
+    def _get_oboscore_max_impact(self):
         weights = dict()
         weights['no_base'] = 5
         weights['overall_error'] = 20
@@ -136,6 +454,9 @@ class DashboardConfig:
             return 0
 
     def get_robot_additional_prefixes(self):
+        return self._memoised('robot_additional_prefixes', self._get_robot_additional_prefixes)
+
+    def _get_robot_additional_prefixes(self):
         prefixes = {}
         ontologies = self.get_ontology_ids()
 
@@ -171,6 +492,142 @@ class DashboardConfig:
         else:
             return ""
 
+    def get_memory_budget_mb(self):
+        if "memory_budget_mb" in self.config:
+            return self.config.get("memory_budget_mb")
+        else:
+            return get_physical_memory_mb()
+
+    def get_job_memory_estimate(self):
+        estimate = dict()
+        estimate['base_mb'] = 1024
+        estimate['per_file_mb'] = 8
+        estimate['per_million_axioms_mb'] = 1500
+        estimate['ontologies'] = {}
+        if "job_memory_estimate" in self.config:
+            estimate.update(self.config.get("job_memory_estimate"))
+        return estimate
+
+    def get_download_jobs(self):
+        if "download_jobs" in self.config:
+            return self.config.get("download_jobs")
+        else:
+            return 2
+
+    def get_download_queue_size(self):
+        if "download_queue_size" in self.config:
+            return self.config.get("download_queue_size")
+        else:
+            return 2
+
+    def get_ontology_order(self):
+        if "ontology_order" in self.config:
+            return self.config.get("ontology_order")
+        else:
+            return "registry"
+
+    def get_download_retries(self):
+        if "download_retries" in self.config:
+            return self.config.get("download_retries")
+        else:
+            return 5
+
+    def get_download_connections(self):
+        if "download_connections" in self.config:
+            return self.config.get("download_connections")
+        else:
+            return 1
+
+    def get_download_parallel_min_mb(self):
+        if "download_parallel_min_mb" in self.config:
+            return self.config.get("download_parallel_min_mb")
+        else:
+            return 512
+
+    def is_fused_pipeline(self):
+        if "fused_pipeline" in self.config:
+            return self.config.get("fused_pipeline")
+        else:
+            return False
+
+    def is_fused_pipeline_write_base(self):
+        if "fused_pipeline_write_base" in self.config:
+            return self.config.get("fused_pipeline_write_base")
+        else:
+            return True
+
+    def get_artifact_cache_dir(self):
+        if "artifact_cache_dir" in self.config:
+            return self.config.get("artifact_cache_dir")
+        else:
+            return os.path.join("build", "cache")
+
+    def get_remote_cache_dir(self):
+        return os.path.join(self.get_artifact_cache_dir(), "remote")
+
+    def get_base_url_ttl_hours(self):
+        if "base_url_ttl_hours" in self.config:
+            return self.config.get("base_url_ttl_hours")
+        else:
+            return 24
+
+    def get_base_url_probe_jobs(self):
+        if "base_url_probe_jobs" in self.config:
+            return self.config.get("base_url_probe_jobs")
+        else:
+            return 16
+
+    def get_url_cache_db(self):
+        return os.path.join(self.get_remote_cache_dir(), "url-cache.sqlite")
+
+    def get_url_cache_ttl_hours(self):
+        ttl_hours = dict()
+        ttl_hours['version_iri'] = None
+        ttl_hours['homepage'] = 168
+        ttl_hours['failure'] = 6
+        if "url_cache_ttl_hours" in self.config:
+            ttl_hours.update(self.config.get("url_cache_ttl_hours"))
+        return ttl_hours
+
+    def get_url_check_jobs(self):
+        if "url_check_jobs" in self.config:
+            return self.config.get("url_check_jobs")
+        else:
+            return 16
+
+    def get_http_settings(self):
+        settings = dict()
+        settings['max_per_host'] = 8
+        settings['hosts'] = {}
+        settings['connect_timeout'] = 10
+        settings['read_timeout'] = 60
+        settings['failure_threshold'] = 5
+        settings['cooldown_seconds'] = 60
+        if "http" in self.config:
+            settings.update(self.config.get("http"))
+        return settings
+
+    def is_import_cache(self):
+        if "import_cache" in self.config:
+            return self.config.get("import_cache")
+        else:
+            return False
+
+    def get_import_cache_dir(self):
+        return os.path.join(self.get_artifact_cache_dir(), "imports")
+
+    def is_json_sidecars(self):
+        if "json_sidecars" in self.config:
+            return self.config.get("json_sidecars")
+        else:
+            return False
+
+    def get_run_history_db(self):
+        if "run_history_db" in self.config:
+            return self.config.get("run_history_db")
+        else:
+            return "run-history.sqlite"
+
     def get_force_regenerate_dashboard_after_hours(self):
         if "force_regenerate_dashboard_after_hours" in self.config:
             return self.config.get("force_regenerate_dashboard_after_hours")
@@ -178,12 +635,15 @@ class DashboardConfig:
             return 0
 
     def get_ontology_ids(self):
+        return self._memoised('ontology_ids', self._get_ontology_ids)
+
+    def _get_ontology_ids(self):
         ontologies = []
         ont_conf = self.config.get("ontologies")
 
         if 'registry' in ont_conf:
             if ont_conf['registry'] and ont_conf['registry'] != 'None':
-                base = open_yaml_from_url(ont_conf['registry'])
+                base = self._open_yaml(ont_conf['registry'])
                 for o in base['ontologies']:
                     if 'activity_status' in o:
                         if o['activity_status'] != 'active':
@@ -197,12 +657,16 @@ class DashboardConfig:
         return list(set(ontologies))
 
     def get_ontologies(self):
+        return self._memoised('ontologies', self._get_ontologies)
+
+    def _get_ontologies(self):
         ontologies = dict()
+        probe = []
         ont_conf = self.config.get("ontologies")
 
         if 'registry' in ont_conf:
             if ont_conf['registry'] and ont_conf['registry'] != 'None':
-                base = open_yaml_from_url(ont_conf['registry'])
+                base = self._open_yaml(ont_conf['registry'])
                 for o in base['ontologies']:
                     ontology = dict()
                     if 'activity_status' in o:
@@ -224,7 +688,9 @@ class DashboardConfig:
                         ontology['base_ns'].append(f'http://purl.obolibrary.org/obo/{oid}#')
 
                     if self._get_prefer_base():
-                        ourl = self.base_url_if_exists(oid)
+                        # Probed below, together with all other ontologies
+                        ourl = None
+                        probe.append(oid)
                     else:
                         ourl = f"http://purl.obolibrary.org/obo/{oid}.owl"
                     ontology['mirror_from'] = ourl
@@ -242,7 +708,8 @@ class DashboardConfig:
                     ourl = o['mirror_from']
                 else:
                     if self._get_prefer_base():
-                        ourl = self.base_url_if_exists(oid)
+                        ourl = None
+                        probe.append(oid)
                     else:
                         ourl = f"http://purl.obolibrary.org/obo/{oid}.owl"
                 ontology['mirror_from'] = ourl
@@ -255,7 +722,12 @@ class DashboardConfig:
                     if key not in ontology:
                         ontology[key] = o[key]
                 ontologies[oid] = ontology
-        obo_registry_yaml = open_yaml_from_url(self.obo_registry)
+        if probe:
+            base_urls = self.base_urls_if_exist(probe)
+            for oid in ontologies:
+                if ontologies[oid]['mirror_from'] is None:
+                    ontologies[oid]['mirror_from'] = base_urls[oid]
+        obo_registry_yaml = self._open_yaml(self.obo_registry)
         for oid in ontologies:
             for ontology in obo_registry_yaml['ontologies']:
                 if oid == ontology['id']:
@@ -269,36 +741,82 @@ class DashboardConfig:
         return {'ontologies': ontologies}
 
     def base_url_if_exists(self, oid):
-        ourl = f"http://purl.obolibrary.org/obo/{oid}/{oid}-base.owl"
         try:
-            ret = requests.head(ourl, allow_redirects=True)
-            if ret.status_code != 200:
-                ourl = f"http://purl.obolibrary.org/obo/{oid}.owl"
-            else:
-                i = 0
-                for line in urllib.request.urlopen(ourl):
-                    i = i + 1
-                    if i > 3:
-                        break
-                    l = line.decode('utf-8')
-                    if "ListBucketResult" in l:
-                        ourl = f"http://purl.obolibrary.org/obo/{oid}.owl"
-
+            ourl = self._probe_base_url(oid)
         except Exception:
             ourl = f"http://purl.obolibrary.org/obo/{oid}.owl"
         return ourl
 
+    def _probe_base_url(self, oid):
+        """Return the URL of the base file of an ontology if it exists, else of the ontology.
+        Raises an exception if the purl cannot be reached."""
+        ourl = f"http://purl.obolibrary.org/obo/{oid}/{oid}-base.owl"
+        http = get_http_client()
+        ret = http.head(ourl, allow_redirects=True)
+        if ret.status_code != 200:
+            return f"http://purl.obolibrary.org/obo/{oid}.owl"
+        with http.stream(ourl) as response:
+            response.raise_for_status()
+            for i, line in enumerate(response.iter_lines()):
+                if i >= 3:
+                    break
+                if b"ListBucketResult" in line:
+                    return f"http://purl.obolibrary.org/obo/{oid}.owl"
+        return ourl
+
+    def base_urls_if_exist(self, oids):
+        """Return the URL of the base file of each ontology if it exists, else of the ontology, by id.
+
+        The ontologies are probed concurrently through the HTTP client. The results are kept
+        in the remote cache for base_url_ttl_hours, and only ontologies without a recent
+        result are probed. Failed probes fall back to the ontology and are not kept.
+        """
+        cache_path = os.path.join(self.get_remote_cache_dir(), 'base-urls.json')
+        cached = {}
+        if os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'r') as f:
+                    cached = json.load(f)
+            except ValueError:
+                logging.warning(f"Ignoring broken base URL cache {cache_path}")
+        expired = (datetime.now() - timedelta(hours=self.get_base_url_ttl_hours())).isoformat(timespec='seconds')
+        base_urls = {oid: cached[oid]['url'] for oid in oids if oid in cached and cached[oid]['checked'] >= expired}
+        probe = [oid for oid in dict.fromkeys(oids) if oid not in base_urls]
+        logging.info(f"Probing base files of {len(probe)} ontologies, {len(base_urls)} known from {cache_path}")
+        if not probe:
+            return base_urls
+
+        def probe_one(oid):
+            try:
+                return oid, self._probe_base_url(oid), True
+            except Exception as e:
+                logging.warning(f"Unable to probe the base file of {oid}: {e}")
+                return oid, f"http://purl.obolibrary.org/obo/{oid}.owl", False
+
+        jobs = self.get_base_url_probe_jobs()
+        checked = datetime.now().isoformat(timespec='seconds')
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for oid, ourl, probed in executor.map(probe_one, probe):
+                base_urls[oid] = ourl
+                if probed:
+                    cached[oid] = {'url': ourl, 'checked': checked}
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(f"{cache_path}.tmp", 'w') as f:
+            json.dump(cached, f, indent=1, sort_keys=True)
+        os.replace(f"{cache_path}.tmp", cache_path)
+        return base_urls
+
     def get_profile(self):
         profile_lines = []
         if 'profile' in self.config:
             profileconf = self.config.get('profile')
             if 'baseprofile' in profileconf:
-                profile_lines = read_txt_from_url_as_lines(profileconf['baseprofile'])
+                profile_lines = self._read_lines(profileconf['baseprofile'])
             if 'custom' in profileconf:
                 for c in profileconf['custom']:
                     profile_lines.append(c)
         if not profile_lines:
-            profile_lines = read_txt_from_url_as_lines(self.default_profile)
+            profile_lines = self._read_lines(self.default_profile)
         else:
             mandatory_lines = ["duplicate_label", "missing_definition", "duplicate_label", "missing_ontology_license",
                                "multiple_definitions", "multiple_labels"]
@@ -322,6 +840,13 @@ class DashboardConfig:
             return False
 
 
+def get_physical_memory_mb():
+    try:
+        return int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024))
+    except (ValueError, OSError, AttributeError):
+        logging.warning("Unable to determine the physical memory of this machine, not limiting jobs by memory.")
+        return None
+
 def is_number(s):
     try:
         float(s)
@@ -338,10 +863,45 @@ def sha256sum(filename):
             h.update(mv[:n])
     return h.hexdigest()
 
+def sha256_sidecar_path(filename):
+    return f"{filename}.sha256.json"
+
+
+def write_sha256_sidecar(filename, sha256_hash):
+    """
+    Record the hashcode of a file next to it, together with the size and modification
+    time of the file, so that it can be reused as long as the file is not modified.
+    """
+    stat = os.stat(filename)
+    sidecar = {'sha256': sha256_hash, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    with open(sha256_sidecar_path(filename), 'w') as f:
+        json.dump(sidecar, f)
+
+
+def file_sha256(filename):
+    """
+    Return the hashcode of a file, from its sidecar if the sidecar still matches the
+    size and modification time of the file. Otherwise (no sidecar, or the file was
+    replaced, e.g. by a manual copy), hash the file and update the sidecar.
+    """
+    stat = os.stat(filename)
+    try:
+        with open(sha256_sidecar_path(filename), 'r') as f:
+            sidecar = json.load(f)
+        if sidecar['size'] == stat.st_size and sidecar['mtime_ns'] == stat.st_mtime_ns:
+            return sidecar['sha256']
+        logging.info(f"Hashcode sidecar of {filename} is stale, hashing the file..")
+    except FileNotFoundError:
+        logging.info(f"No hashcode sidecar for {filename}, hashing the file..")
+    except Exception:
+        logging.warning(f"Ignoring broken hashcode sidecar for {filename}")
+    sha256_hash = sha256sum(filename)
+    write_sha256_sidecar(filename, sha256_hash)
+    return sha256_hash
+
+
 def load_yaml(filepath):
-    with open(filepath, 'r') as f:
-        data = yaml.load(f, Loader=yaml.SafeLoader)
-    return data
+    return serialization.load_yaml(filepath)
 
 
 def robot_prepare_ontology(
@@ -353,7 +913,11 @@ def robot_prepare_ontology(
     make_base: bool,
     robot_prefixes: Optional[Dict[str, str]] = None,
     robot_opts: str = "-v",
-) -> None:
+    log_file: Optional[str] = None,
+    catalog: Optional[str] = None,
+    prefixes_file: Optional[str] = None,
+    java_opts: Optional[List[str]] = None,
+) -> Optional[CommandResult]:
     """
     Prepare an ontology for the dashboard by running ROBOT commands.  
 
@@ -368,13 +932,22 @@ def robot_prepare_ontology(
         make_base (bool): Whether to extract a base version of the ontology.
         robot_prefixes (Optional[Dict[str, str]]): Dictionary of prefix mappings for ROBOT.
         robot_opts (str): Additional ROBOT options.
+        log_file (Optional[str]): Rotating log file the output of ROBOT is streamed to.
+        catalog (Optional[str]): XML catalog of local copies of the imports (see import_cache).
+        prefixes_file (Optional[str]): JSON-LD file with the prefixes for ROBOT, used instead of
+            robot_prefixes (see write_prefixes_context).
+        java_opts (Optional[List[str]]): JVM options for ROBOT (e.g. -Xmx4096m), passed in
+            ROBOT_JAVA_ARGS.
 
     Returns:
-        None
+        The resources used by ROBOT (CommandResult), or None if it could not be started.
     """
     logging.info("Preparing %s for dashboard.", o_path)
 
-    callstring = ["robot", "merge", "-i", o_path]
+    callstring = ["robot", "merge"]
+    if catalog:
+        callstring.extend(["--catalog", catalog])
+    callstring.extend(["-i", o_path])
 
     if robot_opts:
         callstring.append(f"{robot_opts}")
@@ -393,8 +966,11 @@ def robot_prepare_ontology(
 
     # Measure stuff
     callstring.extend(["measure"])
-    for prefix in robot_prefixes:
-        callstring.extend(["--prefix", f"{prefix}: {robot_prefixes[prefix]}"])
+    if prefixes_file:
+        callstring.extend(["--add-prefixes", prefixes_file])
+    else:
+        for prefix in robot_prefixes:
+            callstring.extend(["--prefix", f"{prefix}: {robot_prefixes[prefix]}"])
     callstring.extend(
         ["--metrics", "extended-reasoner", "-f", "yaml", "-o", o_metrics_path,]
     )
@@ -403,10 +979,13 @@ def robot_prepare_ontology(
     callstring.extend(["merge", "--output", o_out_path])
     logging.info(callstring)
 
+    env = dict(os.environ, ROBOT_JAVA_ARGS=" ".join(java_opts)) if java_opts else None
+    command = Command(callstring, log_file, env=env)
     try:
-        check_call(callstring)
-    except subprocess.CalledProcessError as e:
+        command.run(timeout=None)
+    except Exception:
         logging.exception("Preparing %s for dashboard failed", o_path)
+    return command.result
 
 def count_up(dictionary, value):
     if value not in dictionary:
@@ -415,9 +994,8 @@ def count_up(dictionary, value):
     return dictionary
 
 
-def save_yaml(dictionary, file_path):
-    with open(file_path, 'w') as file:
-        yaml.dump(dictionary, file)
+def save_yaml(dictionary, file_path, json_sidecar=False):
+    serialization.save_yaml(dictionary, file_path, json_sidecar=json_sidecar)
 
 
 def save_json(dictionary, file_path):
@@ -594,47 +1172,389 @@ def create_badge(color: str, message: str, label:str, filepath: str):
     with open(filepath, "w") as text_file:
         print(json_string, file=text_file)
 
-def url_exists(url: str) -> bool:
+def set_url_cache(cache):
+    """Use cache (a url_cache.UrlCache, or None) for the url_exists checks of this process.
+
+    Return:
+        the cache used until now
+    """
+    global _url_cache
+    previous, _url_cache = _url_cache, cache
+    return previous
+
+
+def url_exists(url: str, kind: Optional[str] = None) -> bool:
+    # With a kind (e.g. 'version_iri' or 'homepage') the result is taken from, and recorded in,
+    # the URL cache of this process, if there is one (see set_url_cache)
+    cache = _url_cache if kind else None
+    if cache is not None:
+        exists = cache.get(url, kind)
+        if exists is not None:
+            return exists
     # check the URL resolves, but don't download it in full
     # inspired by https://stackoverflow.com/a/69016995/802504 
     # more updated solution
+    exists = False
+    definitive = False
     try:
-        with requests.head(url, allow_redirects=True, headers={"User-Agent": "OBO Dashboard"}) as res:
-            return (res.status_code == 200)
+        with get_http_client().head(url, allow_redirects=True, headers={"User-Agent": "OBO Dashboard"}) as res:
+            exists = (res.status_code == 200)
+            definitive = exists or res.status_code in (404, 410)
     except Exception as e:
         # Any errors with connection will be considered
         # as the URL not existing
         logging.error(e, exc_info=True)
-    return False
+    # Only a definitive answer of the server is kept: transport errors, blocked hosts (CircuitOpenError),
+    # rate limits and server errors are checked again next time
+    if cache is not None and definitive:
+        cache.put(url, kind, exists)
+    return exists
+
+
+def prefetch_urls(urls, jobs=16):
+    """Check concurrently whether URLs resolve, and record the results in the URL cache of this
+    process, so that url_exists does not have to wait for them later. URLs whose result is
+    still in the cache are skipped.
+
+    Args:
+        urls (dict): kind of every URL, by URL
+        jobs (int): number of URLs checked at the same time
+    """
+    if _url_cache is None:
+        return
+    todo = [(url, kind) for url, kind in urls.items() if _url_cache.get(url, kind) is None]
+    logging.info(f"Checking {len(todo)} URLs, {len(urls) - len(todo)} known from the URL cache")
+    if not todo:
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(lambda item: url_exists(*item), todo))
 
 
-def download_file(url, dest_path, retries=3):
+class DownloadValidators:
     """
-    Download the ontology from the URL to a local path. Retries on ChunkedEncodingError.
+    Small persistent cache of the ETag and Last-Modified validators of downloaded URLs,
+    used to make conditional requests. Validators are only used while the file they
+    were recorded for still exists. Safe to share between download threads.
     """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.validators = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    self.validators = json.load(f)
+            except Exception:
+                logging.warning("Ignoring corrupted download validators file %s", path)
+
+    def get_headers(self, url, dest_path):
+        """Return the conditional request headers for downloading url to dest_path."""
+        with self.lock:
+            entry = self.validators.get(url)
+        headers = {}
+        if entry and entry.get('path') == dest_path and os.path.isfile(dest_path):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def update(self, url, dest_path, response):
+        """Record the validators of a response whose content was fully written to dest_path."""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        with self.lock:
+            if etag or last_modified:
+                self.validators[url] = {'etag': etag, 'last_modified': last_modified, 'path': dest_path}
+            else:
+                self.validators.pop(url, None)
+            self._save()
+
+    def forget(self, url):
+        """Drop the validators of url, e.g. because the file is about to be overwritten."""
+        with self.lock:
+            if self.validators.pop(url, None) is not None:
+                self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.validators, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# (connect, read) timeouts in seconds for downloads. The read timeout applies to each chunk,
+# not to the whole download.
+DOWNLOAD_TIMEOUT = (30, 300)
+DOWNLOAD_CHUNK_SIZE = 32768
+
+
+def backoff_seconds(attempt, base=2, cap=120):
+    """
+    Exponential backoff with jitter before retry number attempt (starting at 1), capped at cap
+    seconds.
+    """
+    return min(cap, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+
+
+class PartialDownload:
+    """
+    State of a partially downloaded file (<dest>.part), so that a download interrupted by a
+    dropped connection, or by an earlier run, can be resumed with a Range request. Resume
+    state (<dest>.part.json) is only kept when the server supports byte ranges and sent a
+    validator, which is sent back as If-Range so that a changed file is downloaded afresh.
+    """
+
+    def __init__(self, url, dest_path):
+        self.url = url
+        self.part_path = f"{dest_path}.part"
+        self.state_path = f"{self.part_path}.json"
+        self.validator = None
+        self.offset = 0
+        self.hash = hashlib.sha256()
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if state['url'] == url and state['validator'] and os.path.isfile(self.part_path):
+                self.validator = state['validator']
+                # Hash what was downloaded so far, the rest is hashed as it arrives
+                with open(self.part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        self.hash.update(chunk)
+                        self.offset += len(chunk)
+                logging.info("Resuming download of %s from %s bytes", url, self.offset)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logging.warning("Ignoring broken resume state %s", self.state_path)
+
+    def range_headers(self):
+        if self.offset > 0 and self.validator:
+            return {'Range': f'bytes={self.offset}-', 'If-Range': self.validator}
+        return {}
+
+    def is_continuation(self, response):
+        """True if the response continues the partial file where it stopped."""
+        if response.status_code != 206 or self.offset == 0:
+            return False
+        content_range = response.headers.get('Content-Range', '')
+        return content_range.startswith(f'bytes {self.offset}-')
+
+    def restart(self, response):
+        """Start the partial file from scratch for a full (200) response."""
+        self.offset = 0
+        self.hash = hashlib.sha256()
+        with open(self.part_path, 'wb'):
+            pass
+        self.validator = None
+        if response.headers.get('Accept-Ranges') == 'bytes':
+            self.validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        if self.validator:
+            with open(self.state_path, 'w') as f:
+                json.dump({'url': self.url, 'validator': self.validator}, f)
+        elif os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def write(self, response):
+        with open(self.part_path, 'ab') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if chunk:  # filter out keep-alive new chunks
+                    f.write(chunk)
+                    self.hash.update(chunk)
+                    self.offset += len(chunk)
+
+    def reset(self):
+        """Forget the partial file, the next attempt starts from scratch."""
+        self.offset = 0
+        self.validator = None
+        self.hash = hashlib.sha256()
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _download_range(http, url, part_path, start, end, validator, retries):
+    """Download bytes start-end (inclusive) of url into part_path, resuming on errors."""
+    position = start
     attempt = 0
-    while attempt < retries:
+    while position <= end:
         try:
-            response = requests.get(url, stream=True, timeout=1000000)
-            response.raise_for_status()
+            headers = {'Range': f'bytes={position}-{end}', 'If-Range': validator}
+            with http.stream(url, timeout=DOWNLOAD_TIMEOUT, headers=headers) as response:
+                if response.status_code != 206:
+                    raise HTTPError(f"Expected partial content for range {position}-{end} of {url}, "
+                                    f"got {response.status_code}", response=response)
+                fd = os.open(part_path, os.O_WRONLY)
+                try:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        if chunk:
+                            chunk = chunk[:end + 1 - position]
+                            os.pwrite(fd, chunk, position)
+                            position += len(chunk)
+                finally:
+                    os.close(fd)
+        except HTTPError:
+            raise
+        except RequestException as e:
+            attempt += 1
+            if attempt >= retries:
+                raise
+            delay = backoff_seconds(attempt)
+            logging.warning("Range %s-%s of %s failed: %s. Resuming in %.0fs (%s/%s)...",
+                            position, end, url, e, delay, attempt, retries)
+            time.sleep(delay)
+
+
+def download_ranges(http, url, part_path, size, validator, connections, retries=5):
+    """
+    Download a file of the given size in several byte ranges over parallel connections,
+    writing each range at its offset in part_path.
+    """
+    with open(part_path, 'wb') as f:
+        f.truncate(size)
+    segment = -(-size // connections)
+    ranges = [(start, min(start + segment, size) - 1) for start in range(0, size, segment)]
+    logging.info("Downloading %s in %s ranges of up to %s bytes", url, len(ranges), segment)
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        futures = [executor.submit(_download_range, http, url, part_path, start, end, validator, retries)
+                   for start, end in ranges]
+        for future in futures:
+            future.result()
+
+
+# Returned by download_file when the server answered 304 Not Modified
+NOT_MODIFIED = 'not_modified'
+
+
+def download_file(url, dest_path, retries=5, session=None, validators=None, connections=1,
+                  min_parallel_bytes=512 * 1024 * 1024):
+    """
+    Download the ontology from the URL to a local path.
+
+    The file is downloaded to <dest_path>.part and only moved to dest_path once complete.
+    On connection errors, the download is retried with an exponential backoff, resuming
+    the partial file with a Range request if the server supports it (also across runs). If
+    the server does not continue the partial file, the next attempt downloads it from scratch.
+    If connections > 1 and the file is at least min_parallel_bytes large, it is split into
+    byte ranges that are downloaded over parallel connections. If a range cannot be
+    downloaded, the whole file is downloaded again in a single stream.
+
+    The requests go through the HTTP client of the process (see http_client), unless a
+    session with the same stream method is given.
 
-            with open(dest_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=32768):
-                    if chunk:  # filter out keep-alive new chunks
-                        f.write(chunk)
+    The SHA-256 hashcode of the file is computed while downloading and recorded in a
+    sidecar file (see file_sha256).
+
+    If validators (DownloadValidators) are given and the file was downloaded before, the
+    request is conditional (If-None-Match/If-Modified-Since). If the server answers 304 Not
+    Modified, nothing is written.
+
+    Returns:
+        True if the file was downloaded, NOT_MODIFIED if the server answered 304 Not Modified,
+        False if the server answered with an HTTP error and None if all retries failed. Nothing
+        is written unless the file was downloaded.
+
+    >>> import io, tempfile
+    >>> from requests import Response
+    >>> from contextlib import contextmanager
+    >>> class Server:
+    ...     def __init__(self, status_code, content=b''):
+    ...         self.status_code, self.content = status_code, content
+    ...     @contextmanager
+    ...     def stream(self, url, **kwargs):
+    ...         response = Response()
+    ...         response.status_code, response.url, response.raw = self.status_code, url, io.BytesIO(self.content)
+    ...         yield response
+    >>> dest = os.path.join(tempfile.mkdtemp(), 'uberon.owl')
+    >>> download_file('http://purl.obolibrary.org/obo/uberon.owl', dest, session=Server(200, b'<rdf:RDF/>'))
+    True
+    >>> download_file('http://purl.obolibrary.org/obo/uberon.owl', dest, session=Server(304)) == NOT_MODIFIED
+    True
+    >>> download_file('http://purl.obolibrary.org/obo/uberon.owl', dest, session=Server(404))
+    False
+    >>> download_file('http://purl.obolibrary.org/obo/uberon.owl', dest, session=Server(206, b'<rdf'))
+    False
+    >>> open(dest).read()
+    '<rdf:RDF/>'
+    """
+    http = session if session is not None else get_http_client()
+    headers = validators.get_headers(url, dest_path) if validators else {}
+    partial = PartialDownload(url, dest_path)
+    attempt = 0
+    while True:
+        try:
+            request_headers = dict(headers)
+            request_headers.update(partial.range_headers())
+            in_ranges = False
+            with http.stream(url, timeout=DOWNLOAD_TIMEOUT, headers=request_headers) as response:
+                if response.status_code == 304:
+                    logging.info("%s has not been modified since it was downloaded to %s", url, dest_path)
+                    return NOT_MODIFIED
+                if response.status_code == 416 or \
+                        (response.status_code == 206 and not partial.is_continuation(response)):
+                    if 'Range' not in request_headers:
+                        raise HTTPError(f"Unexpected {response.status_code} response for {url} without a Range "
+                                        f"request", response=response)
+                    # The partial file does not fit the current file on the server, the next
+                    # attempt downloads it again without Range
+                    offset = partial.offset
+                    partial.reset()
+                    raise RequestException(f"Failed to resume at {offset} bytes ({response.status_code})")
+                response.raise_for_status()
+
+                if response.status_code == 206:
+                    partial.write(response)
+                    sha256_hash = partial.hash.hexdigest()
+                else:
+                    partial.restart(response)
+                    size = int(response.headers.get('Content-Length', 0))
+                    # The ranges are downloaded once this response freed its connection (and its slot
+                    # in the HTTP client)
+                    in_ranges = connections > 1 and partial.validator and size >= min_parallel_bytes
+                    if not in_ranges:
+                        partial.write(response)
+                        sha256_hash = partial.hash.hexdigest()
+
+            if in_ranges:
+                try:
+                    download_ranges(http, url, partial.part_path, size, partial.validator, connections, retries)
+                except RequestException as e:
+                    # Servers may advertise byte ranges and then not serve them (reliably)
+                    logging.warning("Failed to download %s in ranges: %s. Downloading it in a single stream", url, e)
+                    partial.reset()
+                    connections = 1
+                    continue
+                except Exception:
+                    # Ranges cannot be resumed individually across attempts
+                    partial.reset()
+                    raise
+                # The ranges arrive out of order, so the file has to be hashed once complete
+                sha256_hash = sha256sum(partial.part_path)
+
+            if validators:
+                validators.forget(url)
+            os.replace(partial.part_path, dest_path)
+            partial.reset()
+            write_sha256_sidecar(dest_path, sha256_hash)
+            if validators:
+                validators.update(url, dest_path, response)
             logging.info("Downloaded %s to %s", url, dest_path)
-            return  # Exit the function if download is successful
+            return True
         except HTTPError as e:
             logging.exception("Failed to download %s: %s", url, e)
             return False
-        except ChunkedEncodingError as e:
-            logging.warning(
-                "ChunkedEncodingError encountered: %s. Retrying %s/%s...",
-                e, attempt + 1, retries
-            )
         except RequestException as e:
+            attempt += 1
+            if attempt >= retries:
+                logging.error("Failed to download %s after %s attempts: %s", url, attempt, e)
+                return None
+            if not partial.validator:
+                # Without a validator, the partial file cannot be resumed safely
+                partial.reset()
+            delay = backoff_seconds(attempt)
             logging.warning(
-                "Failed to download %s: %s (%s). Retrying %s/%s...",
-                url, e, type(e).__name__, attempt + 1, retries
+                "Failed to download %s: %s (%s), %s bytes downloaded so far. Retrying in %.0fs (%s/%s)...",
+                url, e, type(e).__name__, partial.offset, delay, attempt, retries
             )
-        attempt += 1
+            time.sleep(delay)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import math
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL,
+    finished TEXT,
+    jobs INTEGER
+);
+CREATE TABLE IF NOT EXISTS ontology_runs (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    ontology TEXT NOT NULL,
+    recorded TEXT NOT NULL,
+    file_bytes INTEGER,
+    axiom_count INTEGER,
+    sha256 TEXT,
+    changed INTEGER,
+    status TEXT,
+    failure TEXT,
+    wall_s REAL,
+    peak_rss_mb REAL,
+    PRIMARY KEY (run_id, ontology)
+);
+CREATE TABLE IF NOT EXISTS stage_timings (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    ontology TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    recorded TEXT NOT NULL,
+    wall_s REAL,
+    cpu_s REAL,
+    peak_rss_mb REAL,
+    PRIMARY KEY (run_id, ontology, stage)
+);
+CREATE TABLE IF NOT EXISTS check_results (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    ontology TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    status TEXT,
+    PRIMARY KEY (run_id, ontology, check_name)
+);
+CREATE INDEX IF NOT EXISTS ontology_runs_by_ontology ON ontology_runs (ontology, recorded);
+CREATE INDEX IF NOT EXISTS stage_timings_by_ontology ON stage_timings (ontology, stage, recorded);
+CREATE INDEX IF NOT EXISTS check_results_by_ontology ON check_results (ontology, check_name);
+CREATE INDEX IF NOT EXISTS runs_by_started ON runs (started);
+"""
+
+
+def now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def percentile(values, p):
+    """Return the p-th percentile of values (nearest rank), or None if there are none.
+
+    >>> percentile([5, 1, 4, 2, 3], 95)
+    5
+    >>> percentile([5, 1, 4, 2, 3], 50)
+    3
+    >>> percentile([], 95) is None
+    True
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class RunHistory:
+    """Append-only history of dashboard runs in a SQLite database: per ontology and run,
+    the size of the downloaded file, the number of axioms, the outcome, the status of every
+    check and the duration and peak memory of every stage.
+
+    Rows are only ever inserted, one transaction per ontology, so the database is never
+    rewritten and an interrupted run keeps everything recorded until then.
+
+    >>> history = RunHistory(':memory:')
+    >>> run_id = history.start_run(jobs=2)
+    >>> history.record_ontology(run_id, 'uberon', {'changed': True, 'metrics': {'Axioms: Number of axioms': 10},
+    ...     'summary': {'status': 'PASS'}, 'results': {'FP01 Open': {'status': 'PASS'}},
+    ...     'timings': {'download': {'wall_s': 3.0, 'cpu_s': 1.0, 'peak_rss_mb': 50.0}}}, file_bytes=1024)
+    >>> history.finish_run(run_id)
+    >>> history.stage_durations('uberon', 'download', days=30)
+    [3.0]
+    >>> history.last_durations()
+    {'uberon': 3.0}
+    >>> history.close()
+    """
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (str): location of the database, created if it does not exist
+        """
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def start_run(self, jobs=None):
+        """Record the start of a run and return its id."""
+        with self.connection:
+            cursor = self.connection.execute("INSERT INTO runs (started, jobs) VALUES (?, ?)", (now(), jobs))
+        return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        """Record the end of a run."""
+        with self.connection:
+            self.connection.execute("UPDATE runs SET finished = ? WHERE run_id = ?", (now(), run_id))
+
+    def record_ontology(self, run_id, o, results, file_bytes=None):
+        """Append the outcome of an ontology in a run.
+
+        Args:
+            run_id (int): id of the run, see start_run
+            o (str): ontology id
+            results (dict): dashboard data of the ontology (dashboard.yml)
+            file_bytes (int): size of the downloaded ontology file
+        """
+        recorded = now()
+        timings = results.get('timings') or {}
+        metrics = results.get('metrics') or {}
+        summary = results.get('summary') or {}
+        checks = results.get('results') or {}
+        wall_s = sum(timing['wall_s'] for timing in timings.values()) if timings else None
+        peaks = [timing['peak_rss_mb'] for timing in timings.values() if timing.get('peak_rss_mb') is not None]
+        peak_rss_mb = max(peaks) if peaks else None
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO ontology_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, o, recorded, file_bytes, metrics.get('Axioms: Number of axioms'),
+                 results.get('sha256_hash'), results.get('changed'), summary.get('status'),
+                 results.get('failure'), wall_s, peak_rss_mb))
+            self.connection.executemany(
+                "INSERT INTO stage_timings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, o, stage, recorded, timing.get('wall_s'), timing.get('cpu_s'), timing.get('peak_rss_mb'))
+                 for stage, timing in timings.items()])
+            self.connection.executemany(
+                "INSERT INTO check_results VALUES (?, ?, ?, ?)",
+                [(run_id, o, str(check), result.get('status') if isinstance(result, dict) else None)
+                 for check, result in checks.items()])
+
+    def stage_durations(self, o, stage, days=30):
+        """Return the wall-clock times of a stage of an ontology over the last days, oldest first.
+
+        Use percentile to summarise them, e.g. percentile(history.stage_durations('uberon', 'robot_prepare'), 95).
+        """
+        since = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
+        rows = self.connection.execute(
+            "SELECT wall_s FROM stage_timings WHERE ontology = ? AND stage = ? AND recorded >= ? ORDER BY recorded",
+            (o, stage, since))
+        return [row[0] for row in rows]
+
+    def last_durations(self):
+        """Return the total wall-clock time of every ontology in the last run that fully processed it
+        (i.e. in which it had changed), by ontology id."""
+        rows = self.connection.execute(
+            "SELECT ontology, wall_s FROM ontology_runs WHERE changed = 1 AND wall_s IS NOT NULL ORDER BY recorded")
+        return {o: wall_s for o, wall_s in rows}
+
+    def close(self):
+        self.connection.close()
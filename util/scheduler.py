@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import logging
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# A unit of work for the scheduler: fn(*args) is run in a worker process, and
+# memory_mb is the estimated peak memory (mostly ROBOT/JVM heap) of the job.
+Job = namedtuple('Job', ['key', 'memory_mb', 'fn', 'args'])
+
+
+def estimate_job_memory_mb(file_bytes, axiom_count, estimate):
+    """Estimate the memory needed to process an ontology, in MB.
+
+    The estimate is a fixed base (JVM startup, ROBOT) plus whichever is larger
+    of the memory predicted from the file size and from the axiom count
+    recorded by an earlier run.
+
+    Args:
+        file_bytes (int): size of the ontology file, 0 if unknown
+        axiom_count (int): number of axioms from an earlier run, 0 if unknown
+        estimate (dict): base_mb, per_file_mb and per_million_axioms_mb factors
+
+    Return:
+        estimated memory in MB
+
+    >>> estimate = {'base_mb': 1024, 'per_file_mb': 8, 'per_million_axioms_mb': 1500}
+    >>> estimate_job_memory_mb(0, 0, estimate)
+    1024
+    >>> estimate_job_memory_mb(100 * 1024 * 1024, 0, estimate)
+    1824
+    >>> estimate_job_memory_mb(100 * 1024 * 1024, 2000000, estimate)
+    4024
+    """
+    file_mb = file_bytes / (1024 * 1024)
+    from_size = file_mb * estimate['per_file_mb']
+    from_axioms = axiom_count / 1000000 * estimate['per_million_axioms_mb']
+    return int(estimate['base_mb'] + max(from_size, from_axioms))
+
+
+class MemoryScheduler:
+    """Run jobs in a process pool, only admitting a job when its estimated
+    memory fits into the memory budget next to the jobs already running.
+
+    Jobs are admitted in the order they are given. A job that does not fit waits
+    until enough running jobs have finished, so that small jobs pack densely and
+    very large ones end up running alone. A job larger than the whole budget is
+    admitted once nothing else is running.
+    """
+
+    def __init__(self, max_workers, memory_budget_mb=None):
+        """
+        Args:
+            max_workers (int): maximum number of jobs running at the same time
+            memory_budget_mb (int): memory available to all running jobs, in
+                MB. None or 0 means that only max_workers limits admission.
+        """
+        self.max_workers = max_workers
+        self.memory_budget_mb = memory_budget_mb
+
+    def run(self, jobs):
+        """Run all jobs and return a map of job key to result.
+
+        With a single worker the jobs are run one after the other in the current
+        process, exactly like a plain loop. A job that raises an exception is
+        logged with its key and recorded as None, so that it does not stop the
+        other jobs.
+
+        Args:
+            jobs (iterable): Job tuples, consumed lazily
+
+        Return:
+            dict of job key to the return value of the job
+
+        >>> jobs = [Job('a', 0, int, ('1',)), Job('b', 0, int, ('x',)), Job('c', 0, int, ('3',))]
+        >>> MemoryScheduler(1).run(jobs)
+        {'a': 1, 'b': None, 'c': 3}
+        """
+        results = {}
+        if self.max_workers <= 1:
+            for job in jobs:
+                try:
+                    results[job.key] = job.fn(*job.args)
+                except Exception:
+                    logging.exception(f"Job {job.key} failed")
+                    results[job.key] = None
+            return results
+
+        jobs = iter(jobs)
+        pending = None
+        exhausted = False
+        running = {}
+        used_mb = 0
+        # Workers are spawned rather than forked, as the calling process may be running
+        # other threads (e.g. downloads) whose locks must not be inherited half-held.
+        mp_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=mp_context) as executor:
+            while True:
+                if pending is None and not exhausted:
+                    pending = next(jobs, None)
+                    exhausted = pending is None
+
+                if pending is not None and self._fits(pending, used_mb, len(running)):
+                    used_mb += pending.memory_mb
+                    logging.info(f"Starting {pending.key} (estimated {pending.memory_mb} MB, "
+                                 f"{used_mb}/{self.memory_budget_mb or 'unlimited'} MB in use, "
+                                 f"{len(running) + 1} jobs running)")
+                    running[executor.submit(pending.fn, *pending.args)] = pending
+                    pending = None
+                    continue
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    used_mb -= job.memory_mb
+                    try:
+                        results[job.key] = future.result()
+                    except Exception:
+                        logging.exception(f"Job {job.key} failed")
+                        results[job.key] = None
+        return results
+
+    def _fits(self, job, used_mb, running_count):
+        if running_count >= self.max_workers:
+            return False
+        if running_count == 0 or not self.memory_budget_mb:
+            return True
+        return used_mb + job.memory_mb <= self.memory_budget_mb
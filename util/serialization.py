@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import json
+import os
+from datetime import date, datetime
+
+import yaml
+
+# The libyaml bindings parse and emit YAML several times faster than the pure-Python
+# implementation, with the same output; they are used whenever PyYAML was built with them.
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+def sidecar_path(path):
+    """Return the location of the JSON sidecar of a YAML file."""
+    return f"{path}.json"
+
+
+def _encode(o):
+    # YAML timestamps, e.g. the date of the dashboard results, are tagged so that they are read back as such
+    if isinstance(o, datetime):
+        return {'$datetime': o.isoformat()}
+    if isinstance(o, date):
+        return {'$date': o.isoformat()}
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _decode(o):
+    if len(o) == 1:
+        if '$datetime' in o:
+            return datetime.fromisoformat(o['$datetime'])
+        if '$date' in o:
+            return date.fromisoformat(o['$date'])
+    return o
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def parse_yaml(stream):
+    """Parse a YAML document from a string, bytes or an open file."""
+    return yaml.load(stream, Loader=Loader)
+
+
+def dump_yaml(data, stream=None):
+    """Write data as YAML to an open file, or return it as a string if stream is None."""
+    return yaml.dump(data, stream, Dumper=Dumper)
+
+
+def load_yaml(path):
+    """Load a YAML file, from its JSON sidecar if it has an up to date one.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'dashboard.yml')
+    >>> data = {'namespace': 'uberon', 'date': datetime(2024, 1, 1, 12, 30), 'results': {'FP01 Open': 'PASS'}}
+    >>> save_yaml(data, path, json_sidecar=True)
+    >>> os.path.isfile(sidecar_path(path))
+    True
+    >>> load_yaml(path) == data
+    True
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write('namespace: go\\n')
+    >>> load_yaml(path)
+    {'namespace': 'go'}
+    """
+    try:
+        with open(sidecar_path(path), 'r', encoding='utf-8') as f:
+            sidecar = json.load(f, object_hook=_decode)
+        if sidecar['yaml'] == _stamp(path):
+            return sidecar['data']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    with open(path, 'r') as f:
+        return parse_yaml(f)
+
+
+def save_yaml(data, path, json_sidecar=False):
+    """Write data to a YAML file.
+
+    Args:
+        data: data to write
+        path (str): location of the YAML file
+        json_sidecar (bool): also write the data to a JSON sidecar (see sidecar_path), which
+            load_yaml reads instead of the YAML file for as long as the YAML file is unchanged.
+            Dates and times are tagged in the sidecar. The sidecar is skipped if the data does
+            not survive a round trip through JSON unchanged (e.g. non-string keys), and removed
+            when it is not written.
+    """
+    with open(path, 'w') as f:
+        dump_yaml(data, f)
+    sidecar = sidecar_path(path)
+    content = None
+    if json_sidecar:
+        try:
+            content = json.dumps({'yaml': _stamp(path), 'data': data}, default=_encode)
+            if json.loads(content, object_hook=_decode)['data'] != data:
+                content = None
+        except (TypeError, ValueError):
+            content = None
+    if content is None:
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+        return
+    tmp_path = f"{sidecar}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, sidecar)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Stages of the whole dashboard, not of a single ontology, in the run profile
+DASHBOARD = '_dashboard'
+
+# Stages open in each thread, which the commands run by the thread are charged to
+_open_stages = threading.local()
+
+
+def record_command_usage(result):
+    """Charge the resources used by a finished command (lib.CommandResult) to the stages
+    open in the current thread, i.e. the thread that ran the command."""
+    for usage in getattr(_open_stages, 'stack', []):
+        usage['cpu_s'] += result.cpu_s or 0
+        if result.peak_rss_mb is not None:
+            usage['peak_rss_mb'] = max(usage['peak_rss_mb'] or 0, result.peak_rss_mb)
+
+
+def _process_cpu_seconds(pid):
+    """Return the CPU time of another process, or 0 if it cannot be read (e.g. not on Linux)."""
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            # The command name can contain spaces, the fields after it can not
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _process_max_rss_mb(pid):
+    """Return the peak resident memory of another process, or 0 if it cannot be read."""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return 0
+
+
+@contextmanager
+def timed(timings, stage, pid=None):
+    """Record the wall-clock time, CPU time and peak RSS of a stage into timings[stage].
+
+    Only the work of the stage is counted, also when other stages run in other threads
+    at the same time. The CPU time is that of the current thread, plus that of the commands
+    it ran during the stage (see lib.Command), plus that of the process pid if given (e.g.
+    the JVM of a ROBOT gateway doing the work of the stage). The peak RSS is the largest
+    of the peaks of these commands and of how much the peak of the process pid grew during
+    the stage, so that a long-lived process is not charged again for the peaks of earlier
+    stages. It is None if the stage ran neither, as the memory used by a single thread of
+    this process is not known. The stage is recorded even if it fails.
+
+    >>> from lib import runcmd
+    >>> timings = {}
+    >>> with timed(timings, 'sum'):
+    ...     total = sum(range(1000))
+    >>> sorted(timings['sum']), timings['sum']['peak_rss_mb']
+    (['cpu_s', 'peak_rss_mb', 'wall_s'], None)
+    >>> with timed(timings, 'command'):
+    ...     _ = runcmd('python3 -c "x = bytearray(64 * 1024 * 1024)"')
+    >>> timings['command']['peak_rss_mb'] > 64
+    True
+
+    Args:
+        timings (dict): timings of an ontology, by stage
+        stage (str): name of the stage
+        pid (int): process doing (part of) the work of the stage
+    """
+    usage = {'cpu_s': 0, 'peak_rss_mb': None}
+    start_rss_mb = _process_max_rss_mb(pid) if pid else 0
+    if not hasattr(_open_stages, 'stack'):
+        _open_stages.stack = []
+    stack = _open_stages.stack
+    stack.append(usage)
+    wall = time.perf_counter()
+    cpu = time.thread_time() + (_process_cpu_seconds(pid) if pid else 0)
+    try:
+        yield
+    finally:
+        stack.remove(usage)
+        cpu_end = time.thread_time() + (_process_cpu_seconds(pid) if pid else 0)
+        peak_rss_mb = usage['peak_rss_mb']
+        if pid:
+            peak_rss_mb = max(peak_rss_mb or 0, _process_max_rss_mb(pid) - start_rss_mb)
+        timings[stage] = {'wall_s': round(time.perf_counter() - wall, 3),
+                          'cpu_s': round(cpu_end - cpu + usage['cpu_s'], 3),
+                          'peak_rss_mb': round(peak_rss_mb, 1) if peak_rss_mb is not None else None}
+
+
+def write_run_profile(timings_by_ontology, path):
+    """Write the timings of all ontologies of a run, sorted by cost, to a JSON file.
+
+    The profile lists every ontology and stage pair ('stages'), the totals of
+    every stage over all ontologies ('totals') and of every ontology over all of
+    its stages ('ontologies'), each sorted by decreasing wall-clock time.
+
+    Args:
+        timings_by_ontology (dict): timings by stage, by ontology id
+        path (str): output JSON file
+    """
+    stages = []
+    totals = {}
+    ontologies = {}
+    for o, timings in timings_by_ontology.items():
+        for stage, timing in (timings or {}).items():
+            stages.append(dict(ontology=o, stage=stage, **timing))
+            total = totals.setdefault(stage, {'wall_s': 0, 'cpu_s': 0, 'count': 0})
+            total['wall_s'] += timing['wall_s']
+            total['cpu_s'] += timing['cpu_s']
+            total['count'] += 1
+            ontologies[o] = ontologies.get(o, 0) + timing['wall_s']
+
+    profile = {'stages': sorted(stages, key=lambda stage: stage['wall_s'], reverse=True),
+               'totals': sorted([dict(stage=stage, wall_s=round(total['wall_s'], 3), cpu_s=round(total['cpu_s'], 3),
+                                      count=total['count']) for stage, total in totals.items()],
+                                key=lambda total: total['wall_s'], reverse=True),
+               'ontologies': sorted([{'ontology': o, 'wall_s': round(wall, 3)} for o, wall in ontologies.items()],
+                                    key=lambda ontology: ontology['wall_s'], reverse=True)}
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=1)
+    if stages:
+        slowest = profile['stages'][0]
+        logging.info(f"Run profile saved to {path}, slowest stage: {slowest['stage']} of {slowest['ontology']} "
+                     f"({slowest['wall_s']}s)")
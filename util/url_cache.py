@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    exists_ INTEGER NOT NULL,
+    checked TEXT NOT NULL,
+    PRIMARY KEY (url, kind)
+);
+"""
+
+# Hours for which the result of a URL check is reused, by kind of URL. None means forever:
+# version IRIs are immutable, so once one resolves, it always will. Failed checks of any
+# kind are reused for 'failure' hours, which should be shorter than the time between runs.
+DEFAULT_TTL_HOURS = {'version_iri': None, 'homepage': 168, 'failure': 6}
+
+
+class UrlCache:
+    """Results of checks whether URLs resolve, kept in a SQLite database across runs.
+
+    Safe to share between threads, and between processes using the same database.
+
+    >>> cache = UrlCache(':memory:')
+    >>> cache.get('http://purl.obolibrary.org/obo/uberon/releases/2024-01-01/uberon.owl', 'version_iri') is None
+    True
+    >>> cache.put('http://purl.obolibrary.org/obo/uberon/releases/2024-01-01/uberon.owl', 'version_iri', True)
+    >>> cache.get('http://purl.obolibrary.org/obo/uberon/releases/2024-01-01/uberon.owl', 'version_iri')
+    True
+    >>> cache.put('http://example.org/home', 'homepage', False)
+    >>> cache.get('http://example.org/home', 'homepage')
+    False
+    >>> cache.close()
+    """
+
+    def __init__(self, db_path, ttl_hours=None):
+        """
+        Args:
+            db_path (str): location of the database, created if it does not exist
+            ttl_hours (dict): hours for which results are reused, by kind, see DEFAULT_TTL_HOURS
+        """
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.ttl_hours = dict(DEFAULT_TTL_HOURS)
+        self.ttl_hours.update(ttl_hours or {})
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def get(self, url, kind):
+        """Return whether url resolved when last checked, or None if it has to be checked (again)."""
+        with self.lock:
+            row = self.connection.execute("SELECT exists_, checked FROM urls WHERE url = ? AND kind = ?",
+                                          (url, kind)).fetchone()
+        if row is None:
+            return None
+        exists, checked = bool(row[0]), datetime.fromisoformat(row[1])
+        ttl = self.ttl_hours.get(kind if exists else 'failure')
+        if ttl is not None and checked < datetime.now() - timedelta(hours=ttl):
+            return None
+        return exists
+
+    def put(self, url, kind, exists):
+        """Record whether url resolves."""
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?)",
+                                    (url, kind, int(exists), datetime.now().isoformat(timespec='seconds')))
+
+    def close(self):
+        self.connection.close()